@@ -0,0 +1,218 @@
+''' Compare the speed of the vectorized feature code with the per-row code it replaced.
+
+Usage: python benchmark.py <path to data>
+Each benchmark checks that both versions give the same columns before timing them.
+'''
+import sys
+import time
+import numpy as np
+import pandas as pd
+from utils import add_derived, read_table, row_stats, get_age_label, get_age_labels, bin_labels
+from utils import INSTALLMENTS_DAYS_DERIVED, INSTALLMENTS_DERIVED, APPLICATION_DERIVED
+
+path_to_data = sys.argv[1] if len(sys.argv) > 1 else r'<replace it by your own path to data>'
+
+
+def _best_time(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _report(title, rows, before, after):
+    print('{}: {} rows, per-row {:.3f}s, vectorized {:.3f}s ({:.1f}x faster)'.format(
+        title, rows, before, after, before / after))
+
+
+def installments_flags_apply(pay):
+    ''' Flags of installments_days() and installment() computed with per-row lambdas, as before. '''
+    pay['DPD'] = pay['DAYS_ENTRY_PAYMENT'] - pay['DAYS_INSTALMENT']
+    pay['DPD'] = pay['DPD'].apply(lambda x: 0 if x <= 0 else x)
+    pay['DBD'] = pay['DAYS_INSTALMENT'] - pay['DAYS_ENTRY_PAYMENT']
+    pay['DBD'] = pay['DBD'].apply(lambda x: 0 if x <= 0 else x)
+    pay['LATE_PAYMENT'] = pay['DBD'].apply(lambda x: 1 if x > 0 else 0)
+    pay['INSTALMENT_PAYMENT_RATIO'] = pay['AMT_PAYMENT'] / pay['AMT_INSTALMENT']
+    pay['LATE_PAYMENT_RATIO'] = pay.apply(
+        lambda x: x['INSTALMENT_PAYMENT_RATIO'] if x['LATE_PAYMENT'] == 1 else 0, axis=1)
+    pay['SIGNIFICANT_LATE_PAYMENT'] = pay['LATE_PAYMENT_RATIO'].apply(
+        lambda x: 1 if x > 0.05 else 0)
+    pay['DPD_7'] = pay['DPD'].apply(lambda x: 1 if x >= 7 else 0)
+    pay['DPD_15'] = pay['DPD'].apply(lambda x: 1 if x >= 15 else 0)
+    pay['INS_IS_DPD_UNDER_120'] = pay['DPD'].apply(
+        lambda x: 1 if (x > 0) & (x < 120) else 0)
+    pay['INS_IS_DPD_OVER_120'] = pay['DPD'].apply(
+        lambda x: 1 if (x >= 120) else 0)
+    return pay
+
+
+def installments_flags_derived(pay):
+    ''' Same flags with utils.derived. '''
+    pay = add_derived(pay, INSTALLMENTS_DAYS_DERIVED)
+    pay['INSTALMENT_PAYMENT_RATIO'] = pay['AMT_PAYMENT'] / pay['AMT_INSTALMENT']
+    return add_derived(pay, INSTALLMENTS_DERIVED)
+
+
+def benchmark_installments_flags():
+    ''' Derived flags of the whole dseb63_installments_payments table. '''
+    columns = ['SK_ID_CURR', 'SK_ID_PREV', 'DAYS_INSTALMENT', 'DAYS_ENTRY_PAYMENT',
+               'AMT_INSTALMENT', 'AMT_PAYMENT']
+    pay = read_table(path_to_data, 'installments_payments', columns=columns)
+    before = installments_flags_apply(pay.copy())
+    after = installments_flags_derived(pay.copy())
+    pd.testing.assert_frame_equal(before, after)
+    _report('Installments flags', len(pay),
+            _best_time(lambda: installments_flags_apply(pay.copy()), repeat=1),
+            _best_time(lambda: installments_flags_derived(pay.copy())))
+
+
+EXT_SOURCES = ['EXT_SOURCE_1', 'EXT_SOURCE_2', 'EXT_SOURCE_3']
+INCOME_BINS = [0, 30000, 65000, 95000, 130000, 160000, 190880, 220000, 275000, 325000, np.inf]
+
+
+def application_rows_pandas(df):
+    ''' Row features of application() computed with DataFrame methods, eval, apply and .loc, as before. '''
+    docs = [f for f in df.columns if 'FLAG_DOC' in f]
+    df['DOCUMENT_COUNT'] = df[docs].sum(axis=1)
+    df['NEW_DOC_KURT'] = df[docs].kurtosis(axis=1)
+    df['AGE_RANGE'] = df['DAYS_BIRTH'].apply(lambda x: get_age_label(x))
+    for function_name in ['min', 'max', 'mean', 'nanmedian']:
+        df[f'EXT_SOURCES_{function_name.upper()}'] = eval('np.{}'.format(function_name))(df[EXT_SOURCES], axis=1)
+    df['APPS_EXT_SOURCE_STD'] = df[EXT_SOURCES].std(axis=1)
+    df['INCOME_BAND'] = pd.cut(df['AMT_INCOME_TOTAL'], bins=INCOME_BINS, labels=range(1, 11), right=False)
+    df['FLAG_ASSET'] = np.nan
+    for flag, (car, realty) in enumerate([('N', 'N'), ('Y', 'N'), ('N', 'Y'), ('Y', 'Y')]):
+        df.loc[(df['FLAG_OWN_CAR'] == car) & (df['FLAG_OWN_REALTY'] == realty), 'FLAG_ASSET'] = flag
+    return df
+
+
+def application_rows_kernel(df):
+    ''' Same features with utils.row_stats and the binning lookups of application(). '''
+    docs = [f for f in df.columns if 'FLAG_DOC' in f]
+    doc_stats = row_stats(df[docs], ['sum', 'kurt'])
+    df['DOCUMENT_COUNT'] = doc_stats['sum']
+    df['NEW_DOC_KURT'] = doc_stats['kurt']
+    df['AGE_RANGE'] = get_age_labels(df['DAYS_BIRTH'])
+    ext_stats = row_stats(df[EXT_SOURCES], ['min', 'max', 'mean', 'nanmedian', 'std'])
+    for function_name in ['min', 'max', 'mean', 'nanmedian']:
+        df[f'EXT_SOURCES_{function_name.upper()}'] = ext_stats[function_name]
+    df['APPS_EXT_SOURCE_STD'] = ext_stats['std']
+    df['INCOME_BAND'] = bin_labels(df['AMT_INCOME_TOTAL'], INCOME_BINS, range(1, 11))
+    car = pd.Categorical(df['FLAG_OWN_CAR'], categories=['N', 'Y']).codes
+    realty = pd.Categorical(df['FLAG_OWN_REALTY'], categories=['N', 'Y']).codes
+    df['FLAG_ASSET'] = np.array([[0, 2, np.nan], [1, 3, np.nan], [np.nan, np.nan, np.nan]])[car, realty]
+    return df
+
+
+def benchmark_application_rows():
+    ''' Row statistics and binned features of application() on the concatenated train and test tables. '''
+    df = pd.concat([read_table(path_to_data, 'application_train'),
+                    read_table(path_to_data, 'application_test')]).reset_index(drop=True)
+    df['DAYS_BIRTH'] = df['DAYS_BIRTH'] * -1 / 365
+    before = application_rows_pandas(df.copy())
+    after = application_rows_kernel(df.copy())
+    pd.testing.assert_frame_equal(before, after)
+    _report('Application row features', len(df),
+            _best_time(lambda: application_rows_pandas(df.copy()), repeat=1),
+            _best_time(lambda: application_rows_kernel(df.copy())))
+
+
+def application_ratios_pandas(df):
+    ''' Ratios, differences and flags of application() written as pandas column operations, as before. '''
+    df['PAYMENT_RATE'] = df['AMT_ANNUITY'] / df['AMT_CREDIT']
+    df['CREDIT_TO_ANNUITY_RATIO'] = df['AMT_CREDIT'] / df['AMT_ANNUITY']
+    df['CREDIT_TO_GOODS_RATIO'] = df['AMT_CREDIT'] / df['AMT_GOODS_PRICE']
+    df['GOODS_INCOME_RATIO'] = df['AMT_GOODS_PRICE'] / df['AMT_INCOME_TOTAL']
+    df['ANNUITY_TO_INCOME_RATIO'] = df['AMT_ANNUITY'] / df['AMT_INCOME_TOTAL']
+    df['CREDIT_TO_INCOME_RATIO'] = df['AMT_CREDIT'] / df['AMT_INCOME_TOTAL']
+    df['INCOME_TO_EMPLOYED_RATIO'] = df['AMT_INCOME_TOTAL'] / df['DAYS_EMPLOYED']
+    df['INCOME_TO_BIRTH_RATIO'] = df['AMT_INCOME_TOTAL'] / df['DAYS_BIRTH']
+    df['INCOME_ANNUITY_DIFF'] = df['AMT_INCOME_TOTAL'] - df['AMT_ANNUITY']
+    df['INCOME_EXT_RATIO'] = df['AMT_INCOME_TOTAL'] / df['EXT_SOURCE_3']
+    df['CREDIT_EXT_RATIO'] = df['AMT_CREDIT'] / df['EXT_SOURCE_3']
+    df['APP_AMT_INCOME_TOTAL_12_AMT_ANNUITY_ratio'] = df['AMT_INCOME_TOTAL'] / \
+        12. - df['AMT_ANNUITY']
+    df['EMPLOYED_TO_BIRTH_RATIO'] = df['DAYS_EMPLOYED'] / df['DAYS_BIRTH']
+    df['ID_TO_BIRTH_RATIO'] = df['DAYS_ID_PUBLISH'] / df['DAYS_BIRTH']
+    df['CAR_TO_BIRTH_RATIO'] = df['OWN_CAR_AGE'] / df['DAYS_BIRTH']
+    df['CAR_TO_EMPLOYED_RATIO'] = df['OWN_CAR_AGE'] / df['DAYS_EMPLOYED']
+    df['PHONE_TO_BIRTH_RATIO'] = df['DAYS_LAST_PHONE_CHANGE'] / df['DAYS_BIRTH']
+    df['APP_SCORE1_TO_EMPLOY_RATIO'] = df['EXT_SOURCE_1'] / \
+        (df['DAYS_EMPLOYED'] / 365.25)
+    df['EXT_SOURCES_PROD'] = df['EXT_SOURCE_1'] * \
+        df['EXT_SOURCE_2'] * df['EXT_SOURCE_3']
+    df['EXT_SOURCES_WEIGHTED'] = df.EXT_SOURCE_1 * \
+        2 + df.EXT_SOURCE_2 * 1 + df.EXT_SOURCE_3 * 3
+    df['APP_EXT_SOURCE_2*EXT_SOURCE_3*DAYS_BIRTH'] = df['EXT_SOURCE_1'] * \
+        df['EXT_SOURCE_2'] * df['DAYS_BIRTH']
+    df['APP_SCORE1_TO_FAM_CNT_RATIO'] = df['EXT_SOURCE_1'] / df['CNT_FAM_MEMBERS']
+    df['APP_SCORE1_TO_GOODS_RATIO'] = df['EXT_SOURCE_1'] / df['AMT_GOODS_PRICE']
+    df['APP_SCORE1_TO_CREDIT_RATIO'] = df['EXT_SOURCE_1'] / df['AMT_CREDIT']
+    df['APP_SCORE1_TO_SCORE2_RATIO'] = df['EXT_SOURCE_1'] / df['EXT_SOURCE_2']
+    df['APP_SCORE1_TO_SCORE3_RATIO'] = df['EXT_SOURCE_1'] / df['EXT_SOURCE_3']
+    df['APP_SCORE2_TO_CREDIT_RATIO'] = df['EXT_SOURCE_2'] / df['AMT_CREDIT']
+    df['APP_SCORE2_TO_REGION_RATING_RATIO'] = df['EXT_SOURCE_2'] / \
+        df['REGION_RATING_CLIENT']
+    df['APP_SCORE2_TO_CITY_RATING_RATIO'] = df['EXT_SOURCE_2'] / \
+        df['REGION_RATING_CLIENT_W_CITY']
+    df['APP_SCORE2_TO_POP_RATIO'] = df['EXT_SOURCE_2'] / \
+        df['REGION_POPULATION_RELATIVE']
+    df['APP_SCORE2_TO_PHONE_CHANGE_RATIO'] = df['EXT_SOURCE_2'] / \
+        df['DAYS_LAST_PHONE_CHANGE']
+    df['EXT_SOURCE_1^2'] = df['EXT_SOURCE_1']**2
+    df['EXT_SOURCE_2^2'] = df['EXT_SOURCE_2']**2
+    df['EXT_SOURCE_3^2'] = df['EXT_SOURCE_3']**2
+    df['APP_EXT_SOURCE_1*EXT_SOURCE_2'] = df['EXT_SOURCE_1'] * df['EXT_SOURCE_2']
+    df['APP_EXT_SOURCE_1*EXT_SOURCE_3'] = df['EXT_SOURCE_1'] * df['EXT_SOURCE_3']
+    df['APP_EXT_SOURCE_2*EXT_SOURCE_3'] = df['EXT_SOURCE_2'] * df['EXT_SOURCE_3']
+    df['EXT_SOURCE_1 * DAYS_EMPLOYED'] = df['EXT_SOURCE_1'] * df['DAYS_EMPLOYED']
+    df['EXT_SOURCE_2 * DAYS_EMPLOYED'] = df['EXT_SOURCE_2'] * df['DAYS_EMPLOYED']
+    df['EXT_SOURCE_3 * DAYS_EMPLOYED'] = df['EXT_SOURCE_3'] * df['DAYS_EMPLOYED']
+    df['EXT_SOURCE_1 / DAYS_BIRTH'] = df['EXT_SOURCE_1'] / df['DAYS_BIRTH']
+    df['EXT_SOURCE_2 / DAYS_BIRTH'] = df['EXT_SOURCE_2'] / df['DAYS_BIRTH']
+    df['EXT_SOURCE_3 / DAYS_BIRTH'] = df['EXT_SOURCE_3'] / df['DAYS_BIRTH']
+    df['APP_DAYS_EMPLOYED_DAYS_BIRTH_diff'] = df['DAYS_EMPLOYED'] - df['DAYS_BIRTH']
+    df['INCOME_PER_PERSON'] = df['AMT_INCOME_TOTAL'] / df['CNT_FAM_MEMBERS']
+    df['CREDIT_PER_PERSON'] = df['AMT_CREDIT'] / df['CNT_FAM_MEMBERS']
+    df['INCOME_CREDIT_PERCENTAGE'] = df['AMT_INCOME_TOTAL'] / df['AMT_CREDIT']
+    df['PHONE_TO_EMPLOY_RATIO'] = df['DAYS_LAST_PHONE_CHANGE'] / df['DAYS_EMPLOYED']
+    df['CHILDREN_RATIO'] = df['CNT_CHILDREN'] / df['CNT_FAM_MEMBERS']
+    df['CNT_NON_CHILD'] = df['CNT_FAM_MEMBERS'] - df['CNT_CHILDREN']
+    df['CHILD_TO_NON_CHILD_RATIO'] = df['CNT_CHILDREN'] / df['CNT_NON_CHILD']
+    df['CREDIT_PER_CHILD'] = df['AMT_CREDIT'] / (1 + df['CNT_CHILDREN'])
+    df['CREDIT_PER_NON_CHILD'] = df['AMT_CREDIT'] / df['CNT_NON_CHILD']
+    df['INCOME_PER_NON_CHILD'] = df['AMT_INCOME_TOTAL'] / df['CNT_NON_CHILD']
+    df['INCOME_PER_CHILD'] = df['AMT_INCOME_TOTAL'] / (1 + df['CNT_CHILDREN'])
+    df['RETIREMENT_AGE'] = (df['DAYS_BIRTH'] < -14000).astype(int)
+    df['LONG_EMPLOYMENT'] = (df['DAYS_EMPLOYED'] < -2000).astype(int)
+    df['DAYS_DETAILS_CHANGE_MUL'] = df['DAYS_LAST_PHONE_CHANGE'] * \
+        df['DAYS_REGISTRATION'] * df['DAYS_ID_PUBLISH']
+    df['DAYS_DETAILS_CHANGE_SUM'] = df['DAYS_LAST_PHONE_CHANGE'] + \
+        df['DAYS_REGISTRATION'] + df['DAYS_ID_PUBLISH']
+    df['AMT_ENQ_SUM'] = df['AMT_REQ_CREDIT_BUREAU_HOUR'] + df['AMT_REQ_CREDIT_BUREAU_DAY'] + df['AMT_REQ_CREDIT_BUREAU_WEEK'] + df[
+        'AMT_REQ_CREDIT_BUREAU_MON'] + df['AMT_REQ_CREDIT_BUREAU_QRT'] + df['AMT_REQ_CREDIT_BUREAU_YEAR']
+    df['ENQ_CREDIT_RATIO'] = df['AMT_ENQ_SUM'] / df['AMT_CREDIT']
+    return df
+
+
+def benchmark_application_ratios():
+    ''' Ratios, differences and flags of APPLICATION_DERIVED on the concatenated train and test tables. '''
+    df = pd.concat([read_table(path_to_data, 'application_train'),
+                    read_table(path_to_data, 'application_test')]).reset_index(drop=True)
+    df['DAYS_EMPLOYED'] = df['DAYS_EMPLOYED'].replace(365243, np.nan)
+    df['DAYS_BIRTH'] = df['DAYS_BIRTH'] * -1 / 365
+    derived = {name: e for name, e in APPLICATION_DERIVED.items() if e is not None}
+    before = application_ratios_pandas(df.copy())
+    after = add_derived(df.copy(), derived)
+    pd.testing.assert_frame_equal(before, after)
+    _report('Application ratios', len(df),
+            _best_time(lambda: application_ratios_pandas(df.copy())),
+            _best_time(lambda: add_derived(df.copy(), derived)))
+
+
+if __name__ == '__main__':
+    benchmark_installments_flags()
+    benchmark_application_rows()
+    benchmark_application_ratios()
@@ -1,21 +1,32 @@
-from utils import one_hot_encoder, group_and_merge
-import pandas as pd
-import os
+from utils import one_hot_encoder, category_means, group_and_merge, input_columns, stream_group, TableRegistry
+from utils import BUREAU_BALANCE_INPUT_COLUMNS, BUREAU_BALANCE_CATEGORICAL
 import gc
 
 
-def bureau_balance(path_to_data):
-    ''' Process dseb63_bureau_balance.csv and return a pandas dataframe. '''
-    bb = pd.read_csv(os.path.join(path_to_data, 'dseb63_bureau_balance.csv'))
+def bureau_balance(path_to_data, tables=None, chunk_rows=None):
+    ''' Process dseb63_bureau_balance.csv and return a pandas dataframe.
+    If chunk_rows is given, the table is read chunk_rows rows at a time (streaming mode). '''
+    tables = tables or TableRegistry(path_to_data)
+    columns = input_columns(tables.columns('bureau_balance'), [],
+                            BUREAU_BALANCE_INPUT_COLUMNS, BUREAU_BALANCE_CATEGORICAL)
+    # Min, Max, Count and mean duration of payments (months)
+    agg = {'MONTHS_BALANCE': ['min', 'max', 'mean', 'size']}
 
-    # Credit duration and credit/account end date difference
-    bb, cat_cols = one_hot_encoder(bb, nan_as_category=False)
+    if chunk_rows:
+        # Every aggregation is a mean, min, max or size, merged from the states of each chunk
+        categories, _ = tables.categories('bureau_balance', BUREAU_BALANCE_CATEGORICAL, chunk_rows=chunk_rows)
+        cat_cols = [f'{c}_{v}' for c in BUREAU_BALANCE_CATEGORICAL for v in categories[c]]
+        chunks = tables.chunks('bureau_balance', columns, BUREAU_BALANCE_CATEGORICAL, chunk_rows, categories)
+        bb_processed = stream_group((one_hot_encoder(chunk, nan_as_category=False)[0] for chunk in chunks),
+                                    '', {**{c: ['mean'] for c in cat_cols}, **agg}, 'SK_ID_BUREAU')
+        return bb_processed.rename(columns={f'{c}_MEAN': c for c in cat_cols})
 
-    # Calculate rate for each category with decay
-    bb_processed = bb.groupby('SK_ID_BUREAU')[cat_cols].mean().reset_index()
+    bb = tables.get('bureau_balance', columns)
+
+    # Calculate rate for each category, from the counts of each status by loan (no one-hot columns)
+    bb_processed = category_means(bb, 'SK_ID_BUREAU', nan_as_category=False,
+                                  key_dictionary=tables.key_dictionary()).reset_index()
 
-    # Min, Max, Count and mean duration of payments (months)
-    agg = {'MONTHS_BALANCE': ['min', 'max', 'mean', 'size']}
     bb_processed = group_and_merge(bb, bb_processed, '', agg, 'SK_ID_BUREAU')
 
     del bb
@@ -0,0 +1,35 @@
+''' Check on small synthetic tables that the aggregation engine gives the expected features.
+
+Usage: python checks.py
+Unlike benchmark.py, the checks need no data and time nothing; each one raises an
+AssertionError when its features differ from the expected ones.
+'''
+import numpy as np
+import pandas as pd
+from utils import group, group_many
+
+
+def check_group_many_integer_sums():
+    ''' Sums of an int16 column beyond the int16 range, by group_many and its time windows. '''
+    df = pd.DataFrame({'SK_ID_CURR': np.repeat(np.array([1, 2], dtype=np.int32), [2, 3]),
+                       'SK_DPD': np.array([30000, 30000, 1, 2, 3], dtype=np.int16),
+                       'MONTHS_BALANCE': np.array([-1, -2, -1, -2, -20], dtype=np.int16)})
+    aggregations = {'SK_DPD': ['sum', 'mean']}
+    # Integer sums are int64 whatever the dtype of the column, so they are compared with those of int64 values
+    wide = df.astype({'SK_DPD': np.int64})
+
+    agg_df = group_many(df, [('CC_', None, aggregations)])
+    pd.testing.assert_frame_equal(agg_df, group(wide, 'CC_', aggregations))
+    assert agg_df['CC_SK_DPD_SUM'].tolist() == [60000, 6]
+
+    starts = {'INS_12M_': -12, 'INS_24M_': -24}
+    windows = group_many(df, [], windows=[('MONTHS_BALANCE', starts, aggregations)])
+    for prefix, start in starts.items():
+        expected = group(wide[wide['MONTHS_BALANCE'] >= start], prefix, aggregations)
+        pd.testing.assert_frame_equal(windows[expected.columns], expected)
+    assert windows['INS_12M_SK_DPD_SUM'].tolist() == [60000, 3]
+
+
+if __name__ == '__main__':
+    check_group_many_integer_sums()
+    print('All checks passed')
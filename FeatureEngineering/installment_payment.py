@@ -1,16 +1,27 @@
-import pandas as pd
-import os
 import gc
-from utils import INSTALLMENTS_AGG, INSTALLMENTS_TIME_AGG
-from utils import parallel_apply, group, group_and_merge, do_sum, installments_last_loan_features
-
-
-def installment(path_to_data):
-    """ Process dseb63_installments_payments.csv and return a pandas dataframe. """
-    # Read data
-    pay = pd.read_csv(os.path.join(
-        path_to_data, 'dseb63_installments_payments.csv'))
-
+from utils import INSTALLMENTS_AGG, INSTALLMENTS_TIME_AGG, INSTALLMENTS_INPUT_COLUMNS, INSTALLMENTS_DERIVED, input_columns
+from utils import group_many, do_sum, add_derived, installments_last_loan_features
+from utils import concat_partitions, TableRegistry
+
+
+def installment(path_to_data, tables=None, chunk_rows=None):
+    """ Process dseb63_installments_payments.csv and return a pandas dataframe.
+    If chunk_rows is given, the table is processed in partitions of about chunk_rows rows
+    holding all the rows of their SK_ID_CURR (streaming mode). """
+    # Read data (DPD, DBD and LATE_PAYMENT are added once by the table registry)
+    tables = tables or TableRegistry(path_to_data)
+    columns = input_columns(tables.columns('installments_payments'),
+                            [INSTALLMENTS_AGG, INSTALLMENTS_TIME_AGG], INSTALLMENTS_INPUT_COLUMNS)
+    if chunk_rows:
+        partitions = tables.partitions('installments_payments', 'SK_ID_CURR', columns,
+                                       chunk_rows=chunk_rows)
+        return concat_partitions(installment_features(pay, tables.key_dictionary()) for pay in partitions)
+    return installment_features(tables.get('installments_payments', columns), tables.key_dictionary())
+
+
+def installment_features(pay, key_dictionary=None):
+    """ Compute the features of installment() from the rows of dseb63_installments_payments.csv of some SK_ID_CURR.
+    key_dictionary (utils.KeyDictionary) numbers the SK_ID_CURR of the groups, see group_many. """
     # Group payments and get Payment difference
     pay = do_sum(pay, ['SK_ID_PREV', 'NUM_INSTALMENT_NUMBER'],
                  'AMT_PAYMENT', 'AMT_PAYMENT_GROUPED')
@@ -20,55 +31,26 @@ def installment(path_to_data):
     pay['PAID_OVER_AMOUNT'] = pay['AMT_PAYMENT'] - pay['AMT_INSTALMENT']
     pay['PAID_OVER'] = (pay['PAID_OVER_AMOUNT'] > 0).astype(int)
 
-    # Payment Entry: Days past due and Days before due
-    pay['DPD'] = pay['DAYS_ENTRY_PAYMENT'] - pay['DAYS_INSTALMENT']
-    pay['DPD'] = pay['DPD'].apply(lambda x: 0 if x <= 0 else x)
-    pay['DBD'] = pay['DAYS_INSTALMENT'] - pay['DAYS_ENTRY_PAYMENT']
-    pay['DBD'] = pay['DBD'].apply(lambda x: 0 if x <= 0 else x)
-
-    # Flag late payment
-    pay['LATE_PAYMENT'] = pay['DBD'].apply(lambda x: 1 if x > 0 else 0)
-
     # Percentage of payments that were late
     pay['INSTALMENT_PAYMENT_RATIO'] = pay['AMT_PAYMENT'] / pay['AMT_INSTALMENT']
-    pay['LATE_PAYMENT_RATIO'] = pay.apply(
-        lambda x: x['INSTALMENT_PAYMENT_RATIO'] if x['LATE_PAYMENT'] == 1 else 0, axis=1)
-
-    # Flag late payments that have a significant amount
-    pay['SIGNIFICANT_LATE_PAYMENT'] = pay['LATE_PAYMENT_RATIO'].apply(
-        lambda x: 1 if x > 0.05 else 0)
-
-    # Flag k threshold late payments
-    pay['DPD_7'] = pay['DPD'].apply(lambda x: 1 if x >= 7 else 0)
-    pay['DPD_15'] = pay['DPD'].apply(lambda x: 1 if x >= 15 else 0)
-
-    # Flag k threshold late payments over or under 120 days
-    pay['INS_IS_DPD_UNDER_120'] = pay['DPD'].apply(
-        lambda x: 1 if (x > 0) & (x < 120) else 0)
-    pay['INS_IS_DPD_OVER_120'] = pay['DPD'].apply(
-        lambda x: 1 if (x >= 120) else 0)
-
-    # Aggregations by SK_ID_CURR
-    pay_agg = group(pay, 'INS_', INSTALLMENTS_AGG)
-
-    # Installments in the last x months
-    for months in [24, 60]:
-        recent_prev_id = pay[pay['DAYS_INSTALMENT']
-                             >= -30*months]['SK_ID_PREV'].unique()
-        pay_recent = pay[pay['SK_ID_PREV'].isin(recent_prev_id)]
-        prefix = f'INS_{months}M_'
-        pay_agg = group_and_merge(
-            pay_recent, pay_agg, prefix, INSTALLMENTS_TIME_AGG)
+    # Flag late payments that have a significant amount, k threshold late payments
+    # and late payments over or under 120 days
+    pay = add_derived(pay, INSTALLMENTS_DERIVED)
+
+    # Aggregations by SK_ID_CURR, of all installments and of the loans with installments in the last x months:
+    # nested windows of the last installment of each loan
+    jobs = [('INS_', None, INSTALLMENTS_AGG)]
+    last_instalment = pay.groupby('SK_ID_PREV')['DAYS_INSTALMENT'].transform('max')
+    windows = {f'INS_{months}M_': -30*months for months in [24, 60]}
+    pay_agg = group_many(pay, jobs, key_dictionary=key_dictionary,
+                         windows=[(last_instalment, windows, INSTALLMENTS_TIME_AGG)])
+    del jobs, last_instalment
 
     # Last loan features
-    group_features = ['SK_ID_CURR', 'SK_ID_PREV', 'DPD', 'LATE_PAYMENT',
-                      'PAID_OVER_AMOUNT', 'PAID_OVER', 'DAYS_INSTALMENT']
-    gp = pay[group_features].groupby('SK_ID_CURR')
+    g = installments_last_loan_features(pay).reset_index()
     del pay
-    g = parallel_apply(gp, installments_last_loan_features,
-                       index_name='SK_ID_CURR', chunk_size=10000).reset_index()
     pay_agg = pay_agg.merge(g, on='SK_ID_CURR', how='left')
 
-    del g, gp
+    del g
     gc.collect()
     return pay_agg
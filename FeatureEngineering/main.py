@@ -11,50 +11,70 @@ import re
 
 path_to_data = r'<replace it by your own path to data>'
 
-with timer('Loading application_train and application_test'):
-    df = application(path_to_data)
-    print('--=> df after loading application:', df.shape)
-    gc.collect()
+# Tables read by several builders (installments_payments) are loaded once and shared
+tables = TableRegistry(path_to_data)
 
-with timer('Loading bureau data and merge with train/test data'):
-    df = df.merge(bureau(path_to_data=path_to_data),
-                  how='left', on='SK_ID_CURR')
-    print('--=> df after merge with bureau:', df.shape)
-    gc.collect()
+# Set to a number of rows (e.g. 1000000) to read the balance tables in chunks of that size
+# instead of loading them whole, when they do not fit in memory
+chunk_rows = None
 
-with timer('Loading previous application data and merge with train/test data'):
-    df = df.merge(previous_application(path_to_data=path_to_data),
-                  how='left', on='SK_ID_CURR')
-    print('--=> df after merge with previous application:', df.shape)
-    gc.collect()
+# Number of builders run at the same time, each in its own process (1: one after another,
+# sharing the tables they both read), and memory in bytes they may use together (None: no limit)
+max_workers = 1
+memory_budget = None
 
-with timer('Loading POS_CASH_balance data and merge with train/test data'):
-    df = df.merge(pos_cash(path_to_data=path_to_data),
-                  how='left', on='SK_ID_CURR')
-    print('--=> df after merge with pos cash:', df.shape)
-    gc.collect()
+# Outputs of the stages are kept in this folder, up to checkpoint_max_bytes; a stage is only
+# run again when the csv files it reads, its code or the outputs it uses changed
+checkpoints = Checkpoints('.checkpoints', max_bytes=20 * 1024 ** 3)
 
-with timer('Loading installments_payments data and merge with train/test data'):
-    df = df.merge(installment(path_to_data=path_to_data),
-                  how='left', on='SK_ID_CURR')
-    print('--=> df after merge with installments:', df.shape)
-    gc.collect()
+# SK_ID_CURR of the new or changed clients (e.g. the daily batch) to update only their rows of the
+# previous_application, installment and credit_card features kept in the checkpoints; None: full run
+ids = None
+
+# Builders of each table and the tables they read; they do not depend on each other.
+# Incremental builders compute the features of each client from the rows of that client only
+stages = [
+    Stage('application', application, ['application_train', 'application_test']),
+    Stage('bureau', bureau, ['bureau', 'bureau_balance'], kwargs={'chunk_rows': chunk_rows}),
+    Stage('previous_application', previous_application, ['previous_application', 'installments_payments'],
+          kwargs={'chunk_rows': chunk_rows}, incremental=True),
+    Stage('pos_cash', pos_cash, ['POS_CASH_balance'], kwargs={'chunk_rows': chunk_rows}),
+    Stage('installment', installment, ['installments_payments'], kwargs={'chunk_rows': chunk_rows},
+          incremental=True),
+    Stage('credit_card', credit_card, ['credit_card_balance'], kwargs={'chunk_rows': chunk_rows},
+          incremental=True),
+]
 
-with timer('Loading credit_card_balance data and merge with train/test data'):
-    df = df.merge(credit_card(path_to_data=path_to_data),
-                  how='left', on='SK_ID_CURR')
-    print('--=> df after merge with credit card:', df.shape)
+with timer('Running the builders of every table'):
+    outputs = run_stages(stages, path_to_data, tables, max_workers=max_workers,
+                         memory_budget=memory_budget, checkpoints=checkpoints, ids=ids)
+    df = outputs.pop('application')
+    print('--=> df after loading application:', df.shape)
+    # Features of each table, joined to df at once by assemble()
+    blocks = [outputs.pop(stage.name) for stage in stages[1:]]
+    for stage, block in zip(stages[1:], blocks):
+        print(f'--=> {stage.name} features:', block.shape)
     gc.collect()
 
-with timer('Adding ratios features'):
-    df = add_ratios_features(df)
+with timer('Assembling the features of all tables with train/test data and adding ratios features'):
+    # One aligned concat instead of a merge per table, which copies the whole frame each time
+    df = checkpoints.run('ratios', [assemble, add_ratios_features],
+                         lambda: add_ratios_features(assemble(df, blocks, key_dictionary=tables.key_dictionary())),
+                         upstream=[checkpoints.keys[stage.name] for stage in stages])
+    del blocks
     print('--=> df after adding ratios features:', df.shape)
     gc.collect()
 
+with timer('Profiling the number of unique values of the features'):
+    # Kept in the checkpoints with the stage outputs, for the stages after the assembly to reuse
+    profile = checkpoints.run('profile', [cardinality_profile], cardinality_profile, df,
+                              num_workers=max_workers, upstream=[checkpoints.keys['ratios']])
+    print('--=> features with more than 500 unique values:', int((profile['N_UNIQUE'] > 500).sum()))
+    gc.collect()
+
 with timer('Adding 3 sigma features'):
-    cols = find_features(df)
-    for col in cols:
-        df[col] = zoom_3sigma(col, df, df, verbose=False)
+    df = checkpoints.run('3sigma', [add_3sigma_features], add_3sigma_features, df, profile=profile,
+                         upstream=[checkpoints.keys['ratios'], checkpoints.keys['profile']])
     print('--=> df after adding 3sigma columns: ', df.shape)
     gc.collect()
 
@@ -68,6 +88,7 @@ with timer('Rename columns'):
     gc.collect()
 
 with timer('Save data'):
-    df.to_csv('FeatEng.csv', index=False)
+    # Feather keeps the reduced dtypes and allows reading a subset of the columns
+    save_features(df, 'FeatEng.feather')
     print('data is saved')
     gc.collect()
@@ -1,41 +1,77 @@
-from utils import one_hot_encoder, group, do_sum
-from utils import POS_CASH_AGG
+from utils import category_means, group, do_sum, add_derived, ewm_mean, concat_partitions, TableRegistry
+from utils import POS_CASH_AGG, POS_CASH_INPUT_COLUMNS, POS_CASH_CATEGORICAL, input_columns
+from utils import POS_CASH_DERIVED, POS_CASH_LOAN_DERIVED
 import pandas as pd
-import os
 import gc
 
 
-def pos_cash(path_to_data):
-    """ Process dseb63_POS_CASH_balance.csv and return a pandas dataframe. """
-    pos = pd.read_csv(os.path.join(
-        path_to_data, 'dseb63_POS_CASH_balance.csv'))
+def pos_cash(path_to_data, tables=None, chunk_rows=None):
+    """ Process dseb63_POS_CASH_balance.csv and return a pandas dataframe.
+    If chunk_rows is given, the table is processed in partitions of about chunk_rows rows
+    holding all the rows of their SK_ID_CURR (streaming mode). LATE_PAYMENT_SUM picks the
+    last months by their position in the whole table, so it is computed beforehand from
+    one pass over the few columns it needs (see late_payment_last_applications). """
+    tables = tables or TableRegistry(path_to_data)
+    columns = input_columns(tables.columns('POS_CASH_balance'), [POS_CASH_AGG],
+                            POS_CASH_INPUT_COLUMNS, POS_CASH_CATEGORICAL)
+    if chunk_rows:
+        late_derived = {'LATE_PAYMENT': POS_CASH_DERIVED['LATE_PAYMENT']}
+        chunks = tables.chunks('POS_CASH_balance', LATE_PAYMENT_COLUMNS + ['SK_DPD'],
+                               chunk_rows=chunk_rows, categories={})
+        late_pos = pd.concat([add_derived(chunk, late_derived)[LATE_PAYMENT_COLUMNS + ['LATE_PAYMENT']]
+                              for chunk in chunks], ignore_index=True)
+        late_payment = late_payment_last_applications(late_pos)
+        del late_pos
+        partitions = tables.partitions('POS_CASH_balance', 'SK_ID_CURR', columns,
+                                       POS_CASH_CATEGORICAL, chunk_rows)
+        return concat_partitions(pos_cash_features(pos, late_payment) for pos in partitions)
+    return pos_cash_features(tables.get('POS_CASH_balance', columns))
+
+
+# Raw columns of late_payment_last_applications, besides LATE_PAYMENT
+LATE_PAYMENT_COLUMNS = ['SK_ID_CURR', 'SK_ID_PREV', 'MONTHS_BALANCE']
+
+
+def late_payment_last_applications(pos):
+    """ Average number of late months (LATE_PAYMENT_SUM) of the 3 most recent applications of each SK_ID_CURR.
+    pos holds the SK_ID_CURR, SK_ID_PREV, MONTHS_BALANCE and LATE_PAYMENT of every row of
+    dseb63_POS_CASH_balance.csv, in the order of the table: the last month of each application
+    is picked by its position in the table, so pos must not be a subset of the rows. """
+    # Percentage of late payments for the 3 most recent applications
+    pos = do_sum(pos, ['SK_ID_PREV'], 'LATE_PAYMENT', 'LATE_PAYMENT_SUM')
 
-    # computing Exponential Moving Average for some features based on MONTHS_BALANCE
-    columns_for_ema = ['CNT_INSTALMENT', 'CNT_INSTALMENT_FUTURE']
-    exp_columns = ['EXP_'+ele for ele in columns_for_ema]
-    pos[exp_columns] = pos.groupby('SK_ID_PREV')[columns_for_ema].transform(
-        lambda x: x.ewm(alpha=0.6).mean())
+    # Last month of each application
+    last_month_df = pos.groupby('SK_ID_PREV')['MONTHS_BALANCE'].idxmax()
 
-    # One-hot encode categorical features
-    pos, categorical_cols = one_hot_encoder(pos, nan_as_category=False)
+    # Most recent applications (last 3)
+    sort_pos = pos.sort_values(by=['SK_ID_PREV', 'MONTHS_BALANCE'])
+    gp = sort_pos.iloc[last_month_df].groupby('SK_ID_CURR').tail(3)
 
-    # Flag months with late payment
-    pos['LATE_PAYMENT'] = pos['SK_DPD'].apply(lambda x: 1 if x > 0 else 0)
+    # Average application features over the last 3 applications
+    return gp.groupby('SK_ID_CURR')['LATE_PAYMENT_SUM'].mean().reset_index()
 
-    # Flag days past due
-    pos['POS_IS_DPD'] = pos['SK_DPD'].apply(lambda x: 1 if x > 0 else 0)
 
-    # Flag days past due less than 120 days
-    pos['POS_IS_DPD_UNDER_120'] = pos['SK_DPD'].apply(
-        lambda x: 1 if (x > 0) & (x < 120) else 0)
+def pos_cash_features(pos, late_payment=None):
+    """ Compute the features of pos_cash() from the rows of dseb63_POS_CASH_balance.csv of some SK_ID_CURR.
+    late_payment: output of late_payment_last_applications for the whole table, computed from pos if None
+    (pos is then the whole table). """
+    # computing Exponential Moving Average for some features based on MONTHS_BALANCE
+    columns_for_ema = ['CNT_INSTALMENT', 'CNT_INSTALMENT_FUTURE']
+    exp_columns = ['EXP_'+ele for ele in columns_for_ema]
+    pos[exp_columns] = ewm_mean(pos, 'SK_ID_PREV', columns_for_ema, 0.6).to_numpy()
+
+    # Share of the months in each status by SK_ID_CURR, from their counts instead of one-hot columns;
+    # only the flag of completed loans is needed by row
+    categorical_means = category_means(pos, 'SK_ID_CURR', POS_CASH_CATEGORICAL, nan_as_category=False)
+    pos['NAME_CONTRACT_STATUS_Completed'] = pos['NAME_CONTRACT_STATUS'] == 'Completed'
+    pos = pos.drop(columns=POS_CASH_CATEGORICAL)
 
-    # Flag days past due over 120 days
-    pos['POS_IS_DPD_OVER_120'] = pos['SK_DPD'].apply(
-        lambda x: 1 if x >= 120 else 0)
+    # Flag months with late payment, days past due, less than and over 120 days past due
+    pos = add_derived(pos, POS_CASH_DERIVED)
 
     # Aggregate by SK_ID_CURR
-    categorical_agg = {key: ['mean'] for key in categorical_cols}
-    pos_agg = group(pos, 'POS_', {**POS_CASH_AGG, **categorical_agg})
+    pos_agg = group(pos, 'POS_', POS_CASH_AGG)
+    pos_agg = pos_agg.join(categorical_means.add_prefix('POS_').add_suffix('_MEAN'), on='SK_ID_CURR')
 
     # Sort and group by SK_ID_PREV
     sort_pos = pos.sort_values(by=['SK_ID_PREV', 'MONTHS_BALANCE'])
@@ -51,8 +87,7 @@ def pos_cash(path_to_data):
     df['POS_LOAN_COMPLETED_MEAN'] = gp['NAME_CONTRACT_STATUS_Completed'].mean()
     df['POS_COMPLETED_BEFORE_MEAN'] = gp['CNT_INSTALMENT'].first() - \
         gp['CNT_INSTALMENT'].last()
-    df['POS_COMPLETED_BEFORE_MEAN'] = df.apply(lambda x: 1 if x['POS_COMPLETED_BEFORE_MEAN'] > 0
-                                               and x['POS_LOAN_COMPLETED_MEAN'] > 0 else 0, axis=1)
+    df = add_derived(df, POS_CASH_LOAN_DERIVED)
 
     # Number of remaining installments (future installments) and percentage from total
     df['POS_REMAINING_INSTALMENTS'] = gp['CNT_INSTALMENT_FUTURE'].last()
@@ -66,25 +101,15 @@ def pos_cash(path_to_data):
     del df, gp, df_gp, sort_pos
 
     # Percentage of late payments for the 3 most recent applications
-    pos = do_sum(pos, ['SK_ID_PREV'], 'LATE_PAYMENT', 'LATE_PAYMENT_SUM')
-
-    # Last month of each application
-    last_month_df = pos.groupby('SK_ID_PREV')['MONTHS_BALANCE'].idxmax()
-
-    # Most recent applications (last 3)
-    sort_pos = pos.sort_values(by=['SK_ID_PREV', 'MONTHS_BALANCE'])
-    gp = sort_pos.iloc[last_month_df].groupby('SK_ID_CURR').tail(3)
-
-    # Average application features over the last 3 applications
-    gp_mean = gp.groupby('SK_ID_CURR').mean().reset_index()
-    pos_agg = pd.merge(
-        pos_agg, gp_mean[['SK_ID_CURR', 'LATE_PAYMENT_SUM']], on='SK_ID_CURR', how='left')
+    if late_payment is None:
+        late_payment = late_payment_last_applications(pos[LATE_PAYMENT_COLUMNS + ['LATE_PAYMENT']])
+    pos_agg = pd.merge(pos_agg, late_payment, on='SK_ID_CURR', how='left')
 
     # Drop some useless categorical features, which were created to calculate to other features
     drop_features = [
         'POS_NAME_CONTRACT_STATUS_Canceled_MEAN', 'POS_NAME_CONTRACT_STATUS_Amortized debt_MEAN',
         'POS_NAME_CONTRACT_STATUS_XNA_MEAN']
     pos_agg.drop(drop_features, axis=1, inplace=True)
-    del gp, gp_mean, sort_pos, pos
+    del pos
     gc.collect()
     return pos_agg
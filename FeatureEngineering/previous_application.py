@@ -1,76 +1,50 @@
 import pandas as pd
 import numpy as np
 import gc
-import os
-from utils import one_hot_encoder, group, group_and_merge
+from utils import one_hot_encoder, group, group_and_merge, group_many, add_derived, TableRegistry
 from utils import PREVIOUS_AGG, PREVIOUS_ACTIVE_AGG, PREVIOUS_APPROVED_AGG, PREVIOUS_REFUSED_AGG, \
     PREVIOUS_LATE_PAYMENTS_AGG, PREVIOUS_TIME_AGG, PREVIOUS_LOAN_TYPE_AGG
+from utils import PREVIOUS_INPUT_COLUMNS, PREVIOUS_CATEGORICAL, PREVIOUS_DERIVED, input_columns
 
 
-def previous_application(path_to_data):
+def previous_application(path_to_data, tables=None, chunk_rows=None):
     """ Process mainly on dseb63_previous_application.csv and and merge with 
-    some solumns of dseb63_installments_payments.csv for insights return a pandas dataframe. """
+    some solumns of dseb63_installments_payments.csv for insights return a pandas dataframe.
+    If chunk_rows is given, dseb63_installments_payments.csv is read chunk_rows rows at a time
+    (streaming mode) instead of being loaded whole. """
     # Read data dseb63_previous_application.csv and dseb63_installments_payments.csv
-    prev = pd.read_csv(os.path.join(
-        path_to_data, 'dseb63_previous_application.csv'))
-    pay = pd.read_csv(os.path.join(
-        path_to_data, 'dseb63_installments_payments.csv'))
+    tables = tables or TableRegistry(path_to_data)
+    aggregations = [PREVIOUS_AGG, PREVIOUS_ACTIVE_AGG, PREVIOUS_APPROVED_AGG, PREVIOUS_REFUSED_AGG,
+                    PREVIOUS_LATE_PAYMENTS_AGG, PREVIOUS_TIME_AGG, PREVIOUS_LOAN_TYPE_AGG]
+    columns = input_columns(tables.columns('previous_application'), aggregations,
+                            PREVIOUS_INPUT_COLUMNS, PREVIOUS_CATEGORICAL)
+    prev = tables.get('previous_application', columns)
+    pay_columns = ['SK_ID_PREV', 'AMT_INSTALMENT', 'AMT_PAYMENT']
+    if chunk_rows:
+        pay_chunks = tables.chunks('installments_payments', pay_columns, chunk_rows=chunk_rows)
+    else:
+        pay_chunks = [tables.get('installments_payments', pay_columns)]
 
     # One-hot encode most important categorical features
-    enc_columns = [
-        'NAME_CONTRACT_STATUS', 'NAME_CONTRACT_TYPE', 'CHANNEL_TYPE',
-        'NAME_TYPE_SUITE', 'NAME_YIELD_GROUP', 'PRODUCT_COMBINATION',
-        'NAME_PRODUCT_TYPE', 'NAME_CLIENT_TYPE']
     prev, categorical_cols = one_hot_encoder(
-        prev, enc_columns, nan_as_category=False)
+        prev, PREVIOUS_CATEGORICAL, nan_as_category=False)
 
+    # Ratios and differences of some columns, interest of the loans
+    new_cnt_payment = pd.cut(x=prev['CNT_PAYMENT'], bins=[0, 12, 60, 120], labels=["Short", "Middle", "Long"])
+    prev = add_derived(prev, PREVIOUS_DERIVED, {'NEW_CNT_PAYMENT': new_cnt_payment})
     new_coding = {"0": "Yes", "1": "No"}
-    # Calculate ratios and difference for some columns
-    prev['APPLICATION_CREDIT_DIFF'] = prev['AMT_APPLICATION'] - prev['AMT_CREDIT']
-    prev['APPLICATION_CREDIT_RATIO'] = prev['AMT_APPLICATION'] / prev['AMT_CREDIT']
-
-    prev['CREDIT_TO_ANNUITY_RATIO'] = prev['AMT_CREDIT']/prev['AMT_ANNUITY']
-
-    prev['DOWN_PAYMENT_TO_CREDIT'] = prev['AMT_DOWN_PAYMENT'] / prev['AMT_CREDIT']
-    prev["NEW_APP_CREDIT_RATE_RATIO"] = prev["APPLICATION_CREDIT_RATIO"].apply(
-        lambda x: 1 if (x <= 1) else 0)
     prev['NEW_APP_CREDIT_RATE_RATIO'] = prev['NEW_APP_CREDIT_RATE_RATIO'].astype(
         'O')
     prev['NEW_APP_CREDIT_RATE_RATIO'] = prev['NEW_APP_CREDIT_RATE_RATIO'].replace(
         new_coding)
 
-    prev["NEW_CNT_PAYMENT"] = pd.cut(x=prev['CNT_PAYMENT'], bins=[
-                                     0, 12, 60, 120], labels=["Short", "Middle", "Long"])
-    prev['NEW_CREDIT_GOODS_RATE'] = prev['AMT_CREDIT'] / prev['AMT_GOODS_PRICE']
-
-    prev["NEW_END_DIFF"] = prev["DAYS_TERMINATION"] - prev["DAYS_LAST_DUE"]
-    prev['NEW_DAYS_DUE_DIFF'] = prev['DAYS_LAST_DUE_1ST_VERSION'] - \
-        prev['DAYS_FIRST_DUE']
-    prev['NEW_RETURN_DAY'] = prev['DAYS_DECISION'] + prev['CNT_PAYMENT'] * 30
-    prev['NEW_DAYS_TERMINATION_DIFF'] = prev['DAYS_TERMINATION'] - \
-        prev['NEW_RETURN_DAY']
-
-    prev['NFLAG_LAST_APPL_IN_DAY'] = prev['NFLAG_LAST_APPL_IN_DAY'].astype("O")
-
-    # Interest ratio on previous application
-    total_payment = prev['AMT_ANNUITY'] * prev['CNT_PAYMENT']
-    prev['SIMPLE_INTERESTS'] = (
-        total_payment/prev['AMT_CREDIT'] - 1)/prev['CNT_PAYMENT']
-    prev['AMT_INTEREST'] = prev['CNT_PAYMENT'] * \
-        prev['AMT_ANNUITY'] - prev['AMT_CREDIT']
-    prev['INTEREST_SHARE'] = prev['AMT_INTEREST'] / \
-        (prev['AMT_CREDIT'] + 0.00001)  # smoothing to avoid division by zero
-    prev['INTEREST_RATE'] = 2 * 12 * prev['AMT_INTEREST'] / \
-        (prev['AMT_CREDIT'] * (prev['CNT_PAYMENT'] + 1))
-
     # Active loans - approved and not complete yet (last_due 365243)
     approved = prev[prev['NAME_CONTRACT_STATUS_Approved'] == 1]
     active_df = approved[approved['DAYS_LAST_DUE'] == 365243]
 
-    # Find how much was already payed in active loans (using installments csv)
-    active_pay = pay[pay['SK_ID_PREV'].isin(active_df['SK_ID_PREV'])]
-    active_pay_agg = active_pay.groupby(
-        'SK_ID_PREV')[['AMT_INSTALMENT', 'AMT_PAYMENT']].sum()
+    # Find how much was already payed in active loans and the loans with late payments
+    # (days past due), using installments csv
+    active_pay_agg, dpd_id = installments_summary(pay_chunks, active_df['SK_ID_PREV'])
     active_pay_agg.reset_index(inplace=True)
 
     # Active loans: difference of what was payed and installments
@@ -88,7 +62,7 @@ def previous_application(path_to_data):
     active_agg_df = group(active_df, 'PREV_ACTIVE_', PREVIOUS_ACTIVE_AGG)
     active_agg_df['TOTAL_REPAYMENT_RATIO'] = active_agg_df['PREV_ACTIVE_AMT_PAYMENT_SUM'] /\
         active_agg_df['PREV_ACTIVE_AMT_CREDIT_SUM']
-    del active_pay, active_pay_agg, active_df
+    del active_pay_agg, active_df
 
     # Change 365.243 values to nan (missing)
     prev['DAYS_FIRST_DRAWING'].replace(365243, np.nan, inplace=True)
@@ -113,41 +87,42 @@ def previous_application(path_to_data):
     agg_prev = agg_prev.merge(active_agg_df, how='left', on='SK_ID_CURR')
     del active_agg_df
 
-    # Aggregations for approved and refused loans
+    # Aggregations for approved loans (their DAYS_ columns still hold 365243)
     agg_prev = group_and_merge(
         approved, agg_prev, 'APPROVED_', PREVIOUS_APPROVED_AGG)
-    refused = prev[prev['NAME_CONTRACT_STATUS_Refused'] == 1]
-    agg_prev = group_and_merge(
-        refused, agg_prev, 'REFUSED_', PREVIOUS_REFUSED_AGG)
-    del approved, refused
+    del approved
 
-    # Aggregations for Consumer loans and Cash loans
+    # Aggregations for refused loans, Consumer loans and Cash loans and loans in the last x months, in one pass
+    jobs = [('REFUSED_', prev['NAME_CONTRACT_STATUS_Refused'] == 1, PREVIOUS_REFUSED_AGG)]
     for loan_type in ['Consumer loans', 'Cash loans']:
-        type_df = prev[prev[f'NAME_CONTRACT_TYPE_{loan_type}'] == 1]
         prefix = 'PREV_' + loan_type.split(" ", maxsplit=1)[0] + '_'
-        agg_prev = group_and_merge(
-            type_df, agg_prev, prefix, PREVIOUS_LOAN_TYPE_AGG)
-    del type_df
-
-    # Get the SK_ID_PREV for loans with late payments (days past due)
-    pay['LATE_PAYMENT'] = pay['DAYS_ENTRY_PAYMENT'] - pay['DAYS_INSTALMENT']
-    pay['LATE_PAYMENT'] = pay['LATE_PAYMENT'].apply(
-        lambda x: 1 if x > 0 else 0)
-    dpd_id = pay[pay['LATE_PAYMENT'] > 0]['SK_ID_PREV'].unique()
+        jobs.append((prefix, prev[f'NAME_CONTRACT_TYPE_{loan_type}'] == 1, PREVIOUS_LOAN_TYPE_AGG))
+    windows = {f'PREV_LAST{time_frame}M_': -30*time_frame for time_frame in [12, 24]}
+    agg_prev = agg_prev.merge(group_many(prev, jobs, key_dictionary=tables.key_dictionary(),
+                                         windows=[('DAYS_DECISION', windows, PREVIOUS_TIME_AGG)]),
+                              how='left', on='SK_ID_CURR')
+    del jobs
 
     # Aggregations for loans with late payments
     agg_dpd = group_and_merge(prev[prev['SK_ID_PREV'].isin(dpd_id)], agg_prev,
                               'PREV_LATE_', PREVIOUS_LATE_PAYMENTS_AGG)
     del agg_dpd, dpd_id
 
-    # Aggregations for loans in the last x months
-    for time_frame in [12, 24]:
-        time_frame_df = prev[prev['DAYS_DECISION'] >= -30*time_frame]
-        prefix = f'PREV_LAST{time_frame}M_'
-        agg_prev = group_and_merge(
-            time_frame_df, agg_prev, prefix, PREVIOUS_TIME_AGG)
-        del time_frame_df
-
     del prev
     gc.collect()
     return agg_prev
+
+
+def installments_summary(pay_chunks, active_ids):
+    """ Sums of AMT_INSTALMENT and AMT_PAYMENT by SK_ID_PREV of the active loans (active_ids)
+    and SK_ID_PREV of the loans with late payments, from the chunks of rows of
+    dseb63_installments_payments.csv: each chunk is reduced on its own and the sums
+    of the chunks are added at the end. """
+    sums, dpd_ids = [], []
+    for pay in pay_chunks:
+        active_pay = pay[pay['SK_ID_PREV'].isin(active_ids)]
+        sums.append(active_pay.groupby('SK_ID_PREV')[['AMT_INSTALMENT', 'AMT_PAYMENT']].sum())
+        dpd_ids.append(pay.loc[pay['DPD'] > 0, 'SK_ID_PREV'].unique())
+        del pay, active_pay
+    active_pay_agg = sums[0] if len(sums) == 1 else pd.concat(sums).groupby(level=0).sum()
+    return active_pay_agg, np.unique(np.concatenate(dpd_ids))
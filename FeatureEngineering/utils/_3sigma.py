@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+from .profile import cardinality_profile
 
 
 def zoom_3sigma(col, dataset, dataset_apl, verbose=True):
@@ -25,56 +27,153 @@ def zoom_3sigma(col, dataset, dataset_apl, verbose=True):
         xnew : list
             List of zoomed values.
     '''
-    xs = dataset[col]
-    mu = xs.mean()
-    sigma = xs.std()
-    low = mu - 3*sigma
-    high = mu + 3*sigma
-
-    def _value(x):
-        if x < low:
-            return low
-        elif x > high:
-            return high
-        else:
-            return x
-    xapl = dataset_apl[col]
-    xnew = list(map(lambda x: _value(x), xapl))
-    n_low = len([i for i in xnew if i == low])
-    n_high = len([i for i in xnew if i == high])
-    n = len(xapl)
+    stats = fit_3sigma(dataset, [col])
+    xnew = dataset_apl[[col]].copy()
+    report = clip_3sigma(xnew, stats)
     if verbose:
         print(col)
-        print('Percentage of low: {:.2f}{}'.format(100*n_low/n, '%'))
-        print('Percentage of high: {:.2f}{}'.format(100*n_high/n, '%'))
-        print('Low value: {:.2f}'.format(low))
-        print('High value: {:.2f}'.format(high))
+        print('Percentage of low: {:.2f}{}'.format(report.loc[col, 'PCT_LOW'], '%'))
+        print('Percentage of high: {:.2f}{}'.format(report.loc[col, 'PCT_HIGH'], '%'))
+        print('Low value: {:.2f}'.format(stats.loc[col, 'LOW']))
+        print('High value: {:.2f}'.format(stats.loc[col, 'HIGH']))
         print('*'*20)
-    return xnew
+    return xnew[col].tolist()
+
+
+def _nan_mean_std(values):
+    '''
+    Mean and standard deviation (ddof=1) of each row of a 2-d array of one dtype,
+    skipping missing values, with the same arithmetic as pandas.Series.mean and
+    pandas.Series.std on each column (float32 sums in float32, variance in float64).
+    '''
+    is_float = values.dtype.kind == 'f'
+    dtype = values.dtype if is_float else np.dtype(np.float64)
+    mask = np.isnan(values) if is_float else np.zeros(values.shape, dtype=bool)
+    if is_float:
+        values = np.where(mask, 0, values).astype(dtype, copy=False)
+    count = (values.shape[1] - mask.sum(axis=1)).astype(dtype)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = values.sum(axis=1, dtype=dtype) / count
+        mean[count == 0] = np.nan
+        values = values.astype(dtype, copy=False)
+        avg = values.sum(axis=1, dtype=np.float64) / count
+        # pandas subtracts a float64 scalar from the array: float32 columns stay float32
+        sqr = (avg[:, None].astype(dtype) - values) ** 2
+        sqr[mask] = 0
+        d = np.where(count > 1, count - 1, np.nan).astype(dtype)
+        var = (sqr.sum(axis=1, dtype=np.float64) / d).astype(dtype)
+        std = np.sqrt(var)
+    return mean, std
+
+
+def fit_3sigma(df, columns):
+    '''
+    Fit the 3 sigma range of columns, e.g. on the train rows, to clip them on any data.
+        Input:
+            df : pandas.DataFrame
+                Dataset to fit on.
+            columns : list
+                Numeric columns.
+        Output:
+            stats : pandas.DataFrame
+                MEAN, STD, LOW (μ - 3σ) and HIGH (μ + 3σ) of each column (index).
+    '''
+    rows = []
+    by_dtype = {}
+    for col in columns:
+        by_dtype.setdefault(df[col].dtype, []).append(col)
+    for dtype, cols in by_dtype.items():
+        # One reduction for all the columns of a dtype, each column a contiguous row
+        values = np.ascontiguousarray(np.stack([df[c].to_numpy() for c in cols]))
+        mean, std = _nan_mean_std(values)
+        # μ ± 3σ with numpy scalars of the column dtype, as Series.mean() - 3 * Series.std():
+        # the rounding of scalar and array arithmetic differs for float32
+        for col, mu, sigma in zip(cols, mean, std):
+            rows.append((col, mu, sigma, mu - 3 * sigma, mu + 3 * sigma))
+    stats = pd.DataFrame(rows, columns=['COLUMN', 'MEAN', 'STD', 'LOW', 'HIGH']).set_index('COLUMN')
+    stats = stats.astype(np.float64)
+    return stats.loc[list(columns)]
 
 
-def _count_unique(x):
+def clip_3sigma(df, stats):
     '''
-    Count unique values of a pandas.Series. 
+    Clip columns in place to the ranges of fit_3sigma.
+    The columns become float64, or int64 for integer columns without clipped
+    values, as they were when assigned the Python values of zoom_3sigma.
         Input:
-            x : pandas.Series
-                Series to count unique values.
+            df : pandas.DataFrame
+                Dataset to clip, modified in place.
+            stats : pandas.DataFrame
+                Output of fit_3sigma; its columns missing from df are skipped.
         Output:
-                Number of unique values.
+            report : pandas.DataFrame
+                N_LOW, N_HIGH (number of values equal to the low and high
+                bounds after clipping) and their percentages PCT_LOW, PCT_HIGH
+                of each column (index).
     '''
-    return pd.Series.nunique(x)
+    rows = []
+    for col in [c for c in stats.index if c in df.columns]:
+        low, high = stats.at[col, 'LOW'], stats.at[col, 'HIGH']
+        x = df[col].to_numpy()
+        with np.errstate(invalid='ignore'):
+            below, above = x < low, x > high
+        if x.dtype.kind == 'f' or below.any() or above.any():
+            df[col] = np.where(below, low, np.where(above, high, x.astype(np.float64)))
+        else:
+            df[col] = x.astype(np.int64)
+        x = df[col].to_numpy()
+        n_low, n_high = int((x == low).sum()), int((x == high).sum())
+        rows.append((col, n_low, n_high, 100 * n_low / len(x), 100 * n_high / len(x)))
+    return pd.DataFrame(rows, columns=['COLUMN', 'N_LOW', 'N_HIGH', 'PCT_LOW', 'PCT_HIGH']).set_index('COLUMN')
 
 
-def find_features(df):
-    ''' Find features that have more than 500 unique values.
+def find_features(df, threshold=500, profile=None):
+    ''' Find features that have more than threshold unique values.
         Input:
             df : pandas.DataFrame
                 Dataset to find features.
+            threshold : int
+                Minimum number of unique values, excluded.
+            profile : pandas.DataFrame
+                Output of cardinality_profile on df, default: profiled here,
+                counting up to threshold only.
         Output:
             cols_3sigma : list
-                List of features that have more than 500 unique values.
+                List of features that have more than threshold unique values,
+                in the order of the columns of df.
     '''
-    tbl_dis_val = df.apply(_count_unique).sort_values(ascending=False)
-    cols_3sigma = tbl_dis_val[tbl_dis_val > 500].index.tolist()
+    if profile is None:
+        profile = cardinality_profile(df, max_unique=threshold)
+    undecided = profile[~profile['EXACT'] & (profile['N_UNIQUE'] <= threshold)]
+    if len(undecided):
+        raise ValueError(f'The profile counted the unique values up to fewer than {threshold}, '
+                         f'e.g. for {undecided.index[0]}; profile again with max_unique >= {threshold}')
+    cols_3sigma = profile.index[profile['N_UNIQUE'] > threshold].tolist()
     cols_3sigma = [c for c in cols_3sigma if c != 'SK_ID_CURR']
     return cols_3sigma
+
+
+def add_3sigma_features(df, verbose=False, stats=None, profile=None):
+    ''' Zoom every feature found by find_features to its 3 sigma range, all columns at once.
+        Input:
+            df : pandas.DataFrame
+                Dataset to zoom in, modified in place.
+            verbose: boolean
+                Print the number of low and high values of each feature or not
+            stats : pandas.DataFrame
+                Ranges fitted before by fit_3sigma (e.g. on train),
+                default: fitted on df.
+            profile : pandas.DataFrame
+                Output of cardinality_profile on df, to find the features
+                without counting their unique values again.
+        Output:
+            df : pandas.DataFrame
+                Dataset with the zoomed features.
+    '''
+    if stats is None:
+        stats = fit_3sigma(df, find_features(df, profile=profile))
+    report = clip_3sigma(df, stats)
+    if verbose:
+        print(stats.join(report).to_string())
+    return df
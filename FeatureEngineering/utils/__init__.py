@@ -1,15 +1,35 @@
-from ._3sigma import zoom_3sigma, find_features
+from ._3sigma import zoom_3sigma, find_features, add_3sigma_features, fit_3sigma, clip_3sigma
 from .add_features import add_features_in_group, installments_last_loan_features, add_ratios_features
+from .assemble import assemble
+from .checkpoint import Checkpoints, code_fingerprint, file_hash
 from .constants import BUREAU_AGG, BUREAU_ACTIVE_AGG, BUREAU_CLOSED_AGG, BUREAU_LOAN_TYPE_AGG, BUREAU_TIME_AGG
 from .constants import PREVIOUS_AGG, PREVIOUS_ACTIVE_AGG, PREVIOUS_APPROVED_AGG, PREVIOUS_REFUSED_AGG, PREVIOUS_LATE_PAYMENTS_AGG, PREVIOUS_LOAN_TYPE_AGG, PREVIOUS_TIME_AGG
 from .constants import POS_CASH_AGG
 from .constants import INSTALLMENTS_AGG, INSTALLMENTS_TIME_AGG
 from .constants import CREDIT_CARD_AGG, CREDIT_CARD_TIME_AGG
 from .constants import rolling_columns
-from .do_aggregate import do_sum, do_std, do_mean, do_median
-from .encoder import one_hot_encoder, label_encoder, get_age_label
-from .group import group, group_and_merge
+from .constants import BUREAU_BALANCE_INPUT_COLUMNS, BUREAU_BALANCE_CATEGORICAL, BUREAU_INPUT_COLUMNS, BUREAU_CATEGORICAL
+from .constants import PREVIOUS_INPUT_COLUMNS, PREVIOUS_CATEGORICAL, POS_CASH_INPUT_COLUMNS, POS_CASH_CATEGORICAL
+from .constants import INSTALLMENTS_INPUT_COLUMNS, CREDIT_CARD_INPUT_COLUMNS, CREDIT_CARD_CATEGORICAL
+from .constants import APPLICATION_DERIVED, BUREAU_DERIVED, PREVIOUS_DERIVED, POS_CASH_DERIVED, POS_CASH_LOAN_DERIVED
+from .constants import INSTALLMENTS_DAYS_DERIVED, INSTALLMENTS_DERIVED, CREDIT_CARD_DERIVED, RATIOS_DERIVED
+from .derived import add_derived, evaluate, DERIVED_BATCH_ROWS
+from .do_aggregate import do_sum, do_std, do_mean, do_median, do_aggregate
+from .encoder import one_hot_encoder, label_encoder, get_age_label, get_age_labels, bin_labels, category_codes, category_means
+from .ewm import ewm_mean, segment_ewm
+from .group import group, group_and_merge, group_many
 from .handling_data import replace_infinite, drop_highNaN, drop_multicollinearity
-from .parallel import parallel_apply
-from .reduce_memory import reduce_mem_usage
+from .incremental import upsert
+from .keys import KeyDictionary, factorize_keys, lookup_join, key_positions, take_rows
+from .loader import read_table, convert_table, table_columns, input_columns
+from .loader import save_features, load_features
+from .memmap import write_matrix, open_matrix, select_columns, impute_median, scale, matrix_frame, remove_matrix
+from .parallel import close_pool
+from .profile import cardinality_profile, PROFILE_MAX_UNIQUE
+from .reduce_memory import reduce_mem_usage, downcast
+from .row_stats import row_stats, ROW_STATISTICS
+from .scheduler import Stage, run_stages
+from .schema import SCHEMAS, apply_schema
+from .streaming import stream_group, partial_states, merge_states, finalize_states, partition_chunks, concat_partitions
+from .tables import TableRegistry, installments_days
 from .timer import timer
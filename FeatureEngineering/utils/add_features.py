@@ -1,4 +1,7 @@
+import pandas as pd
 from scipy.stats import kurtosis, iqr, skew
+from .constants import RATIOS_DERIVED
+from .derived import add_derived
 
 
 def add_features_in_group(features, gr_, feature_name, aggs, prefix):
@@ -53,20 +56,27 @@ def add_features_in_group(features, gr_, feature_name, aggs, prefix):
     return features
 
 
-def installments_last_loan_features(gr):
+def installments_last_loan_features(pay):
     '''
-    Calculate features for the last loan in installments_payments.csv.
+    Calculate features for the last loan of each client in installments_payments.csv.
+    The last loan is the SK_ID_PREV of the client's latest installment. When several
+    loans share the latest DAYS_INSTALMENT, the first of them in the table order is
+    taken: ties are broken deterministically, where the unstable per-client sort
+    this replaced could pick any of them.
         Input:
-            gr : pandas.DataFrame
-                DataFrame groupby object.
+            pay : pandas.DataFrame
+                Installments with SK_ID_CURR, SK_ID_PREV, DAYS_INSTALMENT, DPD,
+                LATE_PAYMENT, PAID_OVER_AMOUNT and PAID_OVER columns.
         Output:
-            features : dict
-                Dictionary with new features.
+            features : pandas.DataFrame
+                New features, indexed by SK_ID_CURR.
     '''
-    gr_ = gr.copy()
-    gr_.sort_values(['DAYS_INSTALMENT'], ascending=False, inplace=True)
-    last_installment_id = gr_['SK_ID_PREV'].iloc[0]
-    gr_ = gr_[gr_['SK_ID_PREV'] == last_installment_id]
+    # Sort once by client and latest installment first, the first row of each client gives its last loan
+    last = pay[['SK_ID_CURR', 'SK_ID_PREV', 'DAYS_INSTALMENT']].sort_values(
+        ['SK_ID_CURR', 'DAYS_INSTALMENT'], ascending=[True, False], kind='stable')
+    last = last.drop_duplicates('SK_ID_CURR').set_index('SK_ID_CURR')['SK_ID_PREV']
+    last_loan = pay['SK_ID_PREV'].values == last.reindex(pay['SK_ID_CURR']).values
+    gr_ = pay[last_loan].groupby('SK_ID_CURR')
 
     features = {}
     features = add_features_in_group(features, gr_, 'DPD',
@@ -81,7 +91,7 @@ def installments_last_loan_features(gr):
     features = add_features_in_group(features, gr_, 'PAID_OVER',
                                      ['count', 'mean'],
                                      'LAST_LOAN_')
-    return features
+    return pd.DataFrame(features)
 
 
 def add_ratios_features(df):
@@ -94,41 +104,5 @@ def add_ratios_features(df):
             df : pandas.DataFrame
                 Final ataframe with ratios added.
     '''
-
-    # CREDIT TO INCOME RATIO
-    df['BUREAU_INCOME_CREDIT_RATIO'] = df['BUREAU_AMT_CREDIT_SUM_MEAN'] / \
-        df['AMT_INCOME_TOTAL']
-    df['BUREAU_ACTIVE_CREDIT_TO_INCOME_RATIO'] = df['BUREAU_ACTIVE_AMT_CREDIT_SUM_SUM'] / \
-        df['AMT_INCOME_TOTAL']
-
-    # PREVIOUS TO CURRENT CREDIT RATIO
-    df['CURRENT_TO_APPROVED_CREDIT_MIN_RATIO'] = df['APPROVED_AMT_CREDIT_MIN'] / \
-        df['AMT_CREDIT']
-    df['CURRENT_TO_APPROVED_CREDIT_MAX_RATIO'] = df['APPROVED_AMT_CREDIT_MAX'] / \
-        df['AMT_CREDIT']
-    df['CURRENT_TO_APPROVED_CREDIT_MEAN_RATIO'] = df['APPROVED_AMT_CREDIT_MEAN'] / df['AMT_CREDIT']
-
-    # PREVIOUS TO CURRENT ANNUITY RATIO
-    df['CURRENT_TO_APPROVED_ANNUITY_MAX_RATIO'] = df['APPROVED_AMT_ANNUITY_MAX'] / \
-        df['AMT_ANNUITY']
-    df['CURRENT_TO_APPROVED_ANNUITY_MEAN_RATIO'] = df['APPROVED_AMT_ANNUITY_MEAN'] / \
-        df['AMT_ANNUITY']
-    df['PAYMENT_MIN_TO_ANNUITY_RATIO'] = df['INS_AMT_PAYMENT_MIN'] / df['AMT_ANNUITY']
-    df['PAYMENT_MAX_TO_ANNUITY_RATIO'] = df['INS_AMT_PAYMENT_MAX'] / df['AMT_ANNUITY']
-    df['PAYMENT_MEAN_TO_ANNUITY_RATIO'] = df['INS_AMT_PAYMENT_MEAN'] / df['AMT_ANNUITY']
-
-    # PREVIOUS TO CURRENT CREDIT TO ANNUITY RATIO
-    df['CTA_CREDIT_TO_ANNUITY_MAX_RATIO'] = df['APPROVED_CREDIT_TO_ANNUITY_RATIO_MAX'] / \
-        df['CREDIT_TO_ANNUITY_RATIO']
-    df['CTA_CREDIT_TO_ANNUITY_MEAN_RATIO'] = df['APPROVED_CREDIT_TO_ANNUITY_RATIO_MEAN'] / \
-        df['CREDIT_TO_ANNUITY_RATIO']
-
-    # DAYS DIFFERENCES AND RATIOS
-    df['DAYS_DECISION_MEAN_TO_BIRTH'] = df['APPROVED_DAYS_DECISION_MEAN'] / \
-        df['DAYS_BIRTH']
-    df['DAYS_CREDIT_MEAN_TO_BIRTH'] = df['BUREAU_DAYS_CREDIT_MEAN'] / df['DAYS_BIRTH']
-    df['DAYS_DECISION_MEAN_TO_EMPLOYED'] = df['APPROVED_DAYS_DECISION_MEAN'] / \
-        df['DAYS_EMPLOYED']
-    df['DAYS_CREDIT_MEAN_TO_EMPLOYED'] = df['BUREAU_DAYS_CREDIT_MEAN'] / \
-        df['DAYS_EMPLOYED']
-    return df
+    # All the ratios are added to the wide table with one concat
+    return add_derived(df, RATIOS_DERIVED)
@@ -0,0 +1,61 @@
+import pandas as pd
+from .keys import take_rows, key_positions
+
+
+def _mb(df):
+    return df.memory_usage(index=True).sum() / 1024 ** 2
+
+
+def assemble(df, blocks, key='SK_ID_CURR', verbose=True, key_dictionary=None):
+    '''
+    Add the features of every table to the main dataframe in one step,
+    instead of one left merge per table.
+
+    Each block is aligned on the rows of df by its key (keys missing from a
+    block get missing values, as with a left merge) and the aligned blocks are
+    concatenated next to df without copying them again. A merge copies the
+    whole, growing frame every time, so the peak memory of a chain of merges
+    is about twice the final frame; here it is the final frame plus one block.
+        Input:
+            df : pandas.DataFrame
+                Main dataframe, one row per key.
+            blocks : list
+                Features of each table (pandas.DataFrame with a key column and
+                one row per key). The list is emptied as the blocks are aligned.
+            key : str
+                Key column.
+            verbose : bool
+                Print the estimated peak memory saved.
+            key_dictionary : utils.KeyDictionary
+                Codes of the keys shared by the builders: the rows of each block
+                are then found by array lookup instead of a reindex.
+        Output:
+            df : pandas.DataFrame
+                df with the columns of every block, in the order of the blocks.
+    '''
+    keys = df[key].to_numpy()
+    merge_peak, size = 0, _mb(df)
+    remaining = sum(_mb(block) for block in blocks)
+    assemble_peak, aligned = size + remaining, []
+    while blocks:
+        block = blocks.pop(0)
+        block_size = _mb(block)
+        # A merge holds the current frame, the block and the merged frame;
+        # here the aligned blocks, the blocks not aligned yet and one aligned copy
+        merge_peak = max(merge_peak, 2 * (size + block_size))
+        assemble_peak = max(assemble_peak, size + remaining + block_size)
+        remaining -= block_size
+        if key_dictionary is None or key not in key_dictionary:
+            block = block.set_index(key).reindex(keys)
+        else:
+            block = take_rows(block.drop(columns=[key]), key_positions(key_dictionary, key, block[key], keys))
+        block.index = df.index
+        size += _mb(block) - block.index.memory_usage() / 1024 ** 2
+        aligned.append(block)
+        del block
+
+    df = pd.concat([df] + aligned, axis=1, copy=False)
+    if verbose:
+        print('Peak memory of the assembly: {:5.2f} Mb instead of {:5.2f} Mb with merges ({:5.2f} Mb saved)'.format(
+            assemble_peak, merge_peak, merge_peak - assemble_peak))
+    return df
@@ -0,0 +1,300 @@
+'''Content-addressed cache of the outputs of the feature engineering stages.
+
+The output of a stage is stored as a Feather file named after a key, the hash
+of everything the output depends on:
+    - the content of the csv files the stage reads,
+    - the source code of the stage function and of the project functions it
+      calls, and the value of the constants they use (e.g. PREVIOUS_AGG),
+    - its other arguments and the keys of the stages it takes the output of.
+A stage whose key is already in the cache is loaded instead of recomputed,
+so editing one ratio of add_ratios_features only reruns the stages after the
+assembly. The cache folder is kept under a size limit by removing the least
+recently used outputs.
+
+The last output saved for each stage name is also recorded with the hash of
+its code alone, so that utils.incremental can update it for a few clients
+when only the data changed.
+'''
+import hashlib
+import inspect
+import json
+import os
+import time
+import types
+import pandas as pd
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - pyarrow is listed in requirements.txt
+    feather = None
+
+CHECKPOINT_DIR = '.checkpoints'
+CHECKPOINT_VERSION = 1
+# Default size limit of the checkpoint folder, in bytes
+CHECKPOINT_MAX_BYTES = 20 * 1024 ** 3
+
+# Functions and constants defined under this folder are part of the code of a stage
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_HASH_CHUNK = 1 << 24
+_INDEX_COLUMN = '__index__'
+
+
+def file_hash(path, hashes=None):
+    '''
+    Hash of the content of a file.
+        Input:
+            path : str
+                File to hash.
+            hashes : dict
+                Known hashes by path, size and modification time; a file that did not
+                change since it was hashed is not read again. Updated in place.
+        Output:
+            digest : str
+    '''
+    stat = os.stat(path)
+    stamp = f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    if hashes is not None and stamp in hashes:
+        return hashes[stamp]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(block)
+    if hashes is not None:
+        hashes[stamp] = digest.hexdigest()
+    return digest.hexdigest()
+
+
+def _in_project(obj):
+    path = getattr(inspect.getmodule(obj), '__file__', None)
+    return path is not None and os.path.abspath(path).startswith(PROJECT_DIR + os.sep)
+
+
+def _names(code):
+    ''' Global names used by a code object and the functions defined in it. '''
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _names(const)
+    return names
+
+
+def _constant(value):
+    ''' Stable text of a constant, None when value is not a plain constant. '''
+    try:
+        return json.dumps(value, sort_keys=True, default=_set_as_list)
+    except (TypeError, ValueError):
+        return None
+
+
+def _set_as_list(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    raise TypeError
+
+
+def code_fingerprint(funcs):
+    '''
+    Text that changes whenever the code of funcs changes: the source of each
+    function, of the project functions and classes it uses (recursively) and
+    the value of the module level constants they read.
+        Input:
+            funcs : list
+                Functions of a stage.
+        Output:
+            fingerprint : str
+    '''
+    seen, parts = set(), []
+
+    def visit(obj):
+        if id(obj) in seen or not _in_project(obj):
+            return
+        seen.add(id(obj))
+        parts.append(f'{obj.__module__}.{obj.__qualname__}\n{inspect.getsource(obj)}')
+        if inspect.isclass(obj):
+            members = [m for m in vars(obj).values() if inspect.isfunction(m)]
+            for member in members:
+                visit_globals(member)
+        else:
+            visit_globals(obj)
+
+    def visit_globals(func):
+        func = inspect.unwrap(func)
+        for name in sorted(_names(func.__code__)):
+            if name not in func.__globals__:
+                continue
+            value = func.__globals__[name]
+            if inspect.isfunction(value) or inspect.isclass(value):
+                visit(value)
+            elif not inspect.ismodule(value):
+                text = _constant(value)
+                if text is not None:
+                    parts.append(f'{func.__module__}.{name} = {text}')
+
+    for func in funcs:
+        visit(func)
+    return '\n'.join(parts)
+
+
+class Checkpoints:
+    '''
+    Folder of stage outputs, by key.
+        Input:
+            folder : str
+                Folder of the checkpoints, created if needed.
+            max_bytes : int
+                Size limit of the folder; the least recently used outputs are
+                removed after each save until it fits. None: no limit.
+    '''
+
+    def __init__(self, folder=CHECKPOINT_DIR, max_bytes=CHECKPOINT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.keys, self.code_keys = {}, {}
+        os.makedirs(folder, exist_ok=True)
+        self._hashes_file = os.path.join(folder, 'file_hashes.json')
+        self._latest_file = os.path.join(folder, 'latest.json')
+        self._hashes = self._read_json(self._hashes_file)
+        self._latest = self._read_json(self._latest_file)
+
+    @staticmethod
+    def _read_json(path):
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(path, value):
+        with open(path + '.tmp', 'w') as f:
+            json.dump(value, f)
+        os.replace(path + '.tmp', path)
+
+    def key(self, name, funcs, files=(), upstream=(), params=None):
+        '''
+        Key of the output of a stage.
+            Input:
+                name : str
+                    Name of the stage; the key is also stored in self.keys[name]
+                    and the hash of its code and params in self.code_keys[name].
+                funcs : list
+                    Functions that compute the output.
+                files : list
+                    Input files read by the stage.
+                upstream : list
+                    Keys of the stages whose outputs are used.
+                params : dict
+                    Other arguments that change the output.
+            Output:
+                key : str
+        '''
+        code = hashlib.sha1()
+        code.update(f'{CHECKPOINT_VERSION}:{name}\n'.encode())
+        code.update(code_fingerprint(funcs).encode())
+        code.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        self.code_keys[name] = code.hexdigest()
+
+        digest = hashlib.sha1(self.code_keys[name].encode())
+        for path in files:
+            if os.path.exists(path):
+                digest.update(f'\n{os.path.basename(path)}:{file_hash(path, self._hashes)}'.encode())
+        for key in upstream:
+            digest.update(f'\n{key}'.encode())
+        self._write_json(self._hashes_file, self._hashes)
+        self.keys[name] = digest.hexdigest()
+        return self.keys[name]
+
+    def _path(self, key):
+        return os.path.join(self.folder, f'{key}.feather')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def load(self, key):
+        ''' Output stored under key, None when it is not in the cache. '''
+        path = self._path(key)
+        if feather is None or not os.path.exists(path):
+            return None
+        os.utime(path)  # most recently used
+        df = feather.read_feather(path)
+        if _INDEX_COLUMN in df.columns:
+            df = df.set_index(_INDEX_COLUMN)
+            df.index.name = None
+        return df
+
+    def latest(self, name):
+        '''
+        Last output saved for the stage name, None when there is none or when the
+        code or params of the stage changed since (see Checkpoints.key).
+        '''
+        key, code_key = self._latest.get(name, (None, None))
+        if key is None or code_key != self.code_keys.get(name):
+            return None
+        return self.load(key)
+
+    def save(self, key, df, name=None):
+        ''' Store the output df under key, as the latest output of the stage name, and evict old outputs. '''
+        if feather is None:
+            return
+        path = self._path(key)
+        if isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1:
+            stored = df.reset_index(drop=True)
+        else:
+            stored = df.rename_axis(_INDEX_COLUMN).reset_index()
+        # Write to a temporary file first so an interrupted run never leaves a half-written output
+        stored.to_feather(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        if name is not None:
+            self._latest[name] = (key, self.code_keys.get(name))
+            self._write_json(self._latest_file, self._latest)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        '''
+        Remove the least recently used outputs until the folder fits in max_bytes.
+            Input:
+                keep : str
+                    Key never removed, e.g. the output just saved.
+            Output:
+                removed : list
+                    Keys of the removed outputs.
+        '''
+        if self.max_bytes is None:
+            return []
+        entries = []
+        for file in os.listdir(self.folder):
+            if file.endswith('.feather'):
+                stat = os.stat(os.path.join(self.folder, file))
+                entries.append((stat.st_mtime, stat.st_size, file[:-len('.feather')]))
+        total, removed = sum(size for _, size, _ in entries), []
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            os.remove(self._path(key))
+            total -= size
+            removed.append(key)
+        return removed
+
+    def run(self, name, funcs, func, *args, files=(), upstream=(), params=None, **kwargs):
+        '''
+        Load the output of a stage from the cache, or compute and store it.
+            Input:
+                name, funcs, files, upstream, params :
+                    See Checkpoints.key.
+                func : function
+                    Called as func(*args, **kwargs) when the output is not cached.
+            Output:
+                df : pandas.DataFrame
+        '''
+        key = self.key(name, funcs, files, upstream, params)
+        df = self.load(key)
+        if df is not None:
+            print(f'Stage {name} - loaded from checkpoint {key[:12]}')
+            return df
+        start = time.time()
+        df = func(*args, **kwargs)
+        self.save(key, df, name)
+        print(f'Stage {name} - done in {time.time() - start:.0f}s')
+        return df
@@ -35,6 +35,15 @@ Constants:
     
     rolling_columns: list of column to calculate the 
                             rolling Exponential Weighted Moving Average over months
+
+    *_INPUT_COLUMNS: Raw columns of each table used by a builder, built from its keys, the keys
+                        of its aggregation dicts, the columns of its *_DERIVED expressions
+                        and the few columns it uses directly.
+    *_CATEGORICAL: Raw categorical columns of each table that are one-hot encoded.
+
+    *_DERIVED: Derived columns (ratios, differences, flags, clipped values) of each table,
+                        computed by utils.derived.add_derived.
+    RATIOS_DERIVED: Ratios of the columns of the assembled table, computed by add_ratios_features.
 '''
 
 BUREAU_AGG = {
@@ -438,3 +447,312 @@ rolling_columns = [
     'PAYMENT_MIN_DIFF',
 
     'SK_DPD_RATIO']
+
+BUREAU_BALANCE_CATEGORICAL = ['STATUS']
+
+BUREAU_CATEGORICAL = ['CREDIT_ACTIVE', 'CREDIT_TYPE']
+
+PREVIOUS_CATEGORICAL = [
+    'NAME_CONTRACT_STATUS', 'NAME_CONTRACT_TYPE', 'CHANNEL_TYPE',
+    'NAME_TYPE_SUITE', 'NAME_YIELD_GROUP', 'PRODUCT_COMBINATION',
+    'NAME_PRODUCT_TYPE', 'NAME_CLIENT_TYPE']
+
+POS_CASH_CATEGORICAL = ['NAME_CONTRACT_STATUS']
+
+CREDIT_CARD_CATEGORICAL = []
+
+APPLICATION_DERIVED = {
+    # Income by organization type, document count and kurtosis, age group: computed by application()
+    'NEW_INC_BY_ORG': None,
+    'DOCUMENT_COUNT': None,
+    'NEW_DOC_KURT': None,
+    'AGE_RANGE': None,
+
+    # Some simple new features (percentages)
+    'PAYMENT_RATE': ('div', 'AMT_ANNUITY', 'AMT_CREDIT'),
+
+    # Credit ratios
+    'CREDIT_TO_ANNUITY_RATIO': ('div', 'AMT_CREDIT', 'AMT_ANNUITY'),
+    'CREDIT_TO_GOODS_RATIO': ('div', 'AMT_CREDIT', 'AMT_GOODS_PRICE'),
+    'GOODS_INCOME_RATIO': ('div', 'AMT_GOODS_PRICE', 'AMT_INCOME_TOTAL'),
+
+    # Income ratios
+    'ANNUITY_TO_INCOME_RATIO': ('div', 'AMT_ANNUITY', 'AMT_INCOME_TOTAL'),
+    'CREDIT_TO_INCOME_RATIO': ('div', 'AMT_CREDIT', 'AMT_INCOME_TOTAL'),
+    'INCOME_TO_EMPLOYED_RATIO': ('div', 'AMT_INCOME_TOTAL', 'DAYS_EMPLOYED'),
+    'INCOME_TO_BIRTH_RATIO': ('div', 'AMT_INCOME_TOTAL', 'DAYS_BIRTH'),
+    'INCOME_ANNUITY_DIFF': ('sub', 'AMT_INCOME_TOTAL', 'AMT_ANNUITY'),
+    'INCOME_EXT_RATIO': ('div', 'AMT_INCOME_TOTAL', 'EXT_SOURCE_3'),
+    'CREDIT_EXT_RATIO': ('div', 'AMT_CREDIT', 'EXT_SOURCE_3'),
+    # Income per month - Annuity
+    'APP_AMT_INCOME_TOTAL_12_AMT_ANNUITY_ratio': ('sub', ('div', 'AMT_INCOME_TOTAL', 12.), 'AMT_ANNUITY'),
+
+    # Time ratios
+    'EMPLOYED_TO_BIRTH_RATIO': ('div', 'DAYS_EMPLOYED', 'DAYS_BIRTH'),
+    'ID_TO_BIRTH_RATIO': ('div', 'DAYS_ID_PUBLISH', 'DAYS_BIRTH'),
+    'CAR_TO_BIRTH_RATIO': ('div', 'OWN_CAR_AGE', 'DAYS_BIRTH'),
+    'CAR_TO_EMPLOYED_RATIO': ('div', 'OWN_CAR_AGE', 'DAYS_EMPLOYED'),
+    'PHONE_TO_BIRTH_RATIO': ('div', 'DAYS_LAST_PHONE_CHANGE', 'DAYS_BIRTH'),
+
+    # EXT_SOURCE_X statistics (External source): computed by application()
+    'EXT_SOURCES_MIN': None,
+    'EXT_SOURCES_MAX': None,
+    'EXT_SOURCES_MEAN': None,
+    'EXT_SOURCES_NANMEDIAN': None,
+    'APPS_EXT_SOURCE_STD': None,
+
+    'APP_SCORE1_TO_EMPLOY_RATIO': ('div', 'EXT_SOURCE_1', ('div', 'DAYS_EMPLOYED', 365.25)),
+    'EXT_SOURCES_PROD': ('mul', 'EXT_SOURCE_1', 'EXT_SOURCE_2', 'EXT_SOURCE_3'),
+    'EXT_SOURCES_WEIGHTED': ('add', ('mul', 'EXT_SOURCE_1', 2), ('mul', 'EXT_SOURCE_2', 1),
+                             ('mul', 'EXT_SOURCE_3', 3)),
+    'APP_EXT_SOURCE_2*EXT_SOURCE_3*DAYS_BIRTH': ('mul', 'EXT_SOURCE_1', 'EXT_SOURCE_2', 'DAYS_BIRTH'),
+    'APP_SCORE1_TO_FAM_CNT_RATIO': ('div', 'EXT_SOURCE_1', 'CNT_FAM_MEMBERS'),
+    'APP_SCORE1_TO_GOODS_RATIO': ('div', 'EXT_SOURCE_1', 'AMT_GOODS_PRICE'),
+    'APP_SCORE1_TO_CREDIT_RATIO': ('div', 'EXT_SOURCE_1', 'AMT_CREDIT'),
+    'APP_SCORE1_TO_SCORE2_RATIO': ('div', 'EXT_SOURCE_1', 'EXT_SOURCE_2'),
+    'APP_SCORE1_TO_SCORE3_RATIO': ('div', 'EXT_SOURCE_1', 'EXT_SOURCE_3'),
+    'APP_SCORE2_TO_CREDIT_RATIO': ('div', 'EXT_SOURCE_2', 'AMT_CREDIT'),
+    'APP_SCORE2_TO_REGION_RATING_RATIO': ('div', 'EXT_SOURCE_2', 'REGION_RATING_CLIENT'),
+    'APP_SCORE2_TO_CITY_RATING_RATIO': ('div', 'EXT_SOURCE_2', 'REGION_RATING_CLIENT_W_CITY'),
+    'APP_SCORE2_TO_POP_RATIO': ('div', 'EXT_SOURCE_2', 'REGION_POPULATION_RELATIVE'),
+    'APP_SCORE2_TO_PHONE_CHANGE_RATIO': ('div', 'EXT_SOURCE_2', 'DAYS_LAST_PHONE_CHANGE'),
+    'EXT_SOURCE_1^2': ('pow', 'EXT_SOURCE_1', 2),
+    'EXT_SOURCE_2^2': ('pow', 'EXT_SOURCE_2', 2),
+    'EXT_SOURCE_3^2': ('pow', 'EXT_SOURCE_3', 2),
+    'APP_EXT_SOURCE_1*EXT_SOURCE_2': ('mul', 'EXT_SOURCE_1', 'EXT_SOURCE_2'),
+    'APP_EXT_SOURCE_1*EXT_SOURCE_3': ('mul', 'EXT_SOURCE_1', 'EXT_SOURCE_3'),
+    'APP_EXT_SOURCE_2*EXT_SOURCE_3': ('mul', 'EXT_SOURCE_2', 'EXT_SOURCE_3'),
+    'EXT_SOURCE_1 * DAYS_EMPLOYED': ('mul', 'EXT_SOURCE_1', 'DAYS_EMPLOYED'),
+    'EXT_SOURCE_2 * DAYS_EMPLOYED': ('mul', 'EXT_SOURCE_2', 'DAYS_EMPLOYED'),
+    'EXT_SOURCE_3 * DAYS_EMPLOYED': ('mul', 'EXT_SOURCE_3', 'DAYS_EMPLOYED'),
+    'EXT_SOURCE_1 / DAYS_BIRTH': ('div', 'EXT_SOURCE_1', 'DAYS_BIRTH'),
+    'EXT_SOURCE_2 / DAYS_BIRTH': ('div', 'EXT_SOURCE_2', 'DAYS_BIRTH'),
+    'EXT_SOURCE_3 / DAYS_BIRTH': ('div', 'EXT_SOURCE_3', 'DAYS_BIRTH'),
+
+    # ratio feature
+    'APP_DAYS_EMPLOYED_DAYS_BIRTH_diff': ('sub', 'DAYS_EMPLOYED', 'DAYS_BIRTH'),
+
+    # Feature based on average per person
+    'INCOME_PER_PERSON': ('div', 'AMT_INCOME_TOTAL', 'CNT_FAM_MEMBERS'),
+    'CREDIT_PER_PERSON': ('div', 'AMT_CREDIT', 'CNT_FAM_MEMBERS'),
+
+    # percentage of income
+    'INCOME_CREDIT_PERCENTAGE': ('div', 'AMT_INCOME_TOTAL', 'AMT_CREDIT'),
+
+    'PHONE_TO_EMPLOY_RATIO': ('div', 'DAYS_LAST_PHONE_CHANGE', 'DAYS_EMPLOYED'),
+
+    # Ratio and diff related to children
+    'CHILDREN_RATIO': ('div', 'CNT_CHILDREN', 'CNT_FAM_MEMBERS'),
+    'CNT_NON_CHILD': ('sub', 'CNT_FAM_MEMBERS', 'CNT_CHILDREN'),
+    'CHILD_TO_NON_CHILD_RATIO': ('div', 'CNT_CHILDREN', 'CNT_NON_CHILD'),
+    'CREDIT_PER_CHILD': ('div', 'AMT_CREDIT', ('add', 1, 'CNT_CHILDREN')),
+    'CREDIT_PER_NON_CHILD': ('div', 'AMT_CREDIT', 'CNT_NON_CHILD'),
+    'INCOME_PER_NON_CHILD': ('div', 'AMT_INCOME_TOTAL', 'CNT_NON_CHILD'),
+    'INCOME_PER_CHILD': ('div', 'AMT_INCOME_TOTAL', ('add', 1, 'CNT_CHILDREN')),
+
+    # age bins (DAYS_BIRTH_QCUT: computed by application())
+    'RETIREMENT_AGE': ('lt', 'DAYS_BIRTH', -14000),
+    'DAYS_BIRTH_QCUT': None,
+
+    # long employemnt
+    'LONG_EMPLOYMENT': ('lt', 'DAYS_EMPLOYED', -2000),
+
+    # income bands: computed by application()
+    'INCOME_BAND': None,
+
+    # details change
+    'DAYS_DETAILS_CHANGE_MUL': ('mul', 'DAYS_LAST_PHONE_CHANGE', 'DAYS_REGISTRATION', 'DAYS_ID_PUBLISH'),
+    'DAYS_DETAILS_CHANGE_SUM': ('add', 'DAYS_LAST_PHONE_CHANGE', 'DAYS_REGISTRATION', 'DAYS_ID_PUBLISH'),
+
+    # enquires
+    'AMT_ENQ_SUM': ('add', 'AMT_REQ_CREDIT_BUREAU_HOUR', 'AMT_REQ_CREDIT_BUREAU_DAY', 'AMT_REQ_CREDIT_BUREAU_WEEK',
+                    'AMT_REQ_CREDIT_BUREAU_MON', 'AMT_REQ_CREDIT_BUREAU_QRT', 'AMT_REQ_CREDIT_BUREAU_YEAR'),
+    'ENQ_CREDIT_RATIO': ('div', 'AMT_ENQ_SUM', 'AMT_CREDIT'),
+
+    # flag asset: computed by application()
+    'FLAG_ASSET': None,
+}
+
+BUREAU_DERIVED = {
+    # Credit duration and credit/account end date difference
+    'CREDIT_DURATION': ('add', ('neg', 'DAYS_CREDIT'), 'DAYS_CREDIT_ENDDATE'),
+    'ENDDATE_DIF': ('sub', 'DAYS_CREDIT_ENDDATE', 'DAYS_ENDDATE_FACT'),
+    'DCREDIT_DOVERDUE_DIFF': ('sub', 'DAYS_CREDIT', 'CREDIT_DAY_OVERDUE'),  # days credit overdue diff
+    'DCREDIT_DENDFACT_DIFF': ('sub', 'DAYS_CREDIT', 'DAYS_ENDDATE_FACT'),  # days credit endfact diff
+    'DUPDATE_DENDATE_DIFF': ('sub', 'DAYS_CREDIT_UPDATE', 'DAYS_CREDIT_ENDDATE'),  # days update enddate diff
+
+    # Credit to debt ratio and difference
+    'DEBT_PERCENTAGE': ('div', 'AMT_CREDIT_SUM', 'AMT_CREDIT_SUM_DEBT'),
+    'DEBT_CREDIT_DIFF': ('sub', 'AMT_CREDIT_SUM', 'AMT_CREDIT_SUM_DEBT'),
+    'CREDIT_TO_ANNUITY_RATIO': ('div', 'AMT_CREDIT_SUM', 'AMT_ANNUITY'),
+    'BUREAU_CREDIT_FACT_DIFF': ('sub', 'DAYS_CREDIT', 'DAYS_ENDDATE_FACT'),
+    'BUREAU_CREDIT_ENDDATE_DIFF': ('sub', 'DAYS_CREDIT', 'DAYS_CREDIT_ENDDATE'),
+    'BUREAU_CREDIT_DEBT_RATIO': ('div', 'AMT_CREDIT_SUM_DEBT', 'AMT_CREDIT_SUM'),
+    'DEBT_CREDIT_LIMIT_DIFF': ('sub', 'AMT_CREDIT_SUM', 'AMT_CREDIT_SUM_LIMIT'),
+    'DEBT_CREDIT_OVERDUE_DIFF': ('sub', 'AMT_CREDIT_SUM', 'AMT_CREDIT_SUM_OVERDUE'),
+
+    # CREDIT_DAY_OVERDUE : flags of loans past due, over 120 days past due
+    'BUREAU_IS_DPD': ('gt', 'CREDIT_DAY_OVERDUE', 0),
+    'BUREAU_IS_DPD_OVER120': ('gt', 'CREDIT_DAY_OVERDUE', 120),
+}
+
+PREVIOUS_DERIVED = {
+    # Ratios and difference for some columns
+    'APPLICATION_CREDIT_DIFF': ('sub', 'AMT_APPLICATION', 'AMT_CREDIT'),
+    'APPLICATION_CREDIT_RATIO': ('div', 'AMT_APPLICATION', 'AMT_CREDIT'),
+    'CREDIT_TO_ANNUITY_RATIO': ('div', 'AMT_CREDIT', 'AMT_ANNUITY'),
+    'DOWN_PAYMENT_TO_CREDIT': ('div', 'AMT_DOWN_PAYMENT', 'AMT_CREDIT'),
+    'NEW_APP_CREDIT_RATE_RATIO': ('le', 'APPLICATION_CREDIT_RATIO', 1),
+
+    # Short, middle or long loan: computed by previous_application()
+    'NEW_CNT_PAYMENT': None,
+    'NEW_CREDIT_GOODS_RATE': ('div', 'AMT_CREDIT', 'AMT_GOODS_PRICE'),
+
+    'NEW_END_DIFF': ('sub', 'DAYS_TERMINATION', 'DAYS_LAST_DUE'),
+    'NEW_DAYS_DUE_DIFF': ('sub', 'DAYS_LAST_DUE_1ST_VERSION', 'DAYS_FIRST_DUE'),
+    'NEW_RETURN_DAY': ('add', 'DAYS_DECISION', ('mul', 'CNT_PAYMENT', 30)),
+    'NEW_DAYS_TERMINATION_DIFF': ('sub', 'DAYS_TERMINATION', 'NEW_RETURN_DAY'),
+
+    # Interest ratio on previous application (AMT_ANNUITY * CNT_PAYMENT: total payment)
+    'SIMPLE_INTERESTS': ('div', ('sub', ('div', ('mul', 'AMT_ANNUITY', 'CNT_PAYMENT'), 'AMT_CREDIT'), 1),
+                         'CNT_PAYMENT'),
+    'AMT_INTEREST': ('sub', ('mul', 'AMT_ANNUITY', 'CNT_PAYMENT'), 'AMT_CREDIT'),
+    # smoothing to avoid division by zero
+    'INTEREST_SHARE': ('div', 'AMT_INTEREST', ('add', 'AMT_CREDIT', 0.00001)),
+    'INTEREST_RATE': ('div', ('mul', 2 * 12, 'AMT_INTEREST'), ('mul', 'AMT_CREDIT', ('add', 'CNT_PAYMENT', 1))),
+}
+
+POS_CASH_DERIVED = {
+    'LATE_PAYMENT': ('gt', 'SK_DPD', 0),
+    'POS_IS_DPD': ('gt', 'SK_DPD', 0),
+    'POS_IS_DPD_UNDER_120': ('between', 'SK_DPD', 0, 120),
+    'POS_IS_DPD_OVER_120': ('ge', 'SK_DPD', 120),
+}
+POS_CASH_LOAN_DERIVED = {
+    'POS_COMPLETED_BEFORE_MEAN': ('and', ('gt', 'POS_COMPLETED_BEFORE_MEAN', 0),
+                                  ('gt', 'POS_LOAN_COMPLETED_MEAN', 0)),
+}
+
+INSTALLMENTS_DAYS_DERIVED = {
+    'DPD': ('clip', ('sub', 'DAYS_ENTRY_PAYMENT', 'DAYS_INSTALMENT'), 0),
+    'DBD': ('clip', ('sub', 'DAYS_INSTALMENT', 'DAYS_ENTRY_PAYMENT'), 0),
+    'LATE_PAYMENT': ('gt', 'DBD', 0),
+}
+INSTALLMENTS_DERIVED = {
+    'LATE_PAYMENT_RATIO': ('where', ('eq', 'LATE_PAYMENT', 1), 'INSTALMENT_PAYMENT_RATIO', 0),
+    'SIGNIFICANT_LATE_PAYMENT': ('gt', 'LATE_PAYMENT_RATIO', 0.05),
+    'DPD_7': ('ge', 'DPD', 7),
+    'DPD_15': ('ge', 'DPD', 15),
+    'INS_IS_DPD_UNDER_120': ('between', 'DPD', 0, 120),
+    'INS_IS_DPD_OVER_120': ('ge', 'DPD', 120),
+}
+
+CREDIT_CARD_DERIVED = {
+    # Amount used from limit
+    'LIMIT_USE': ('div', 'AMT_BALANCE', 'AMT_CREDIT_LIMIT_ACTUAL'),
+    # Current payment / Min payment
+    'PAYMENT_DIV_MIN': ('div', 'AMT_PAYMENT_CURRENT', 'AMT_INST_MIN_REGULARITY'),
+    # Late payment
+    'LATE_PAYMENT': ('gt', 'SK_DPD', 0),
+    # How much drawing of limit
+    'DRAWING_LIMIT_RATIO': ('div', 'AMT_DRAWINGS_ATM_CURRENT', 'AMT_CREDIT_LIMIT_ACTUAL'),
+    # Total amount of drawing at ATM
+    'AMT_DRAWING_SUM': ('add', 'AMT_DRAWINGS_ATM_CURRENT', 'AMT_DRAWINGS_CURRENT',
+                        'AMT_DRAWINGS_OTHER_CURRENT', 'AMT_DRAWINGS_POS_CURRENT'),
+    # Total of drawing on previous credit
+    'CNT_DRAWING_SUM': ('add', 'CNT_DRAWINGS_ATM_CURRENT', 'CNT_DRAWINGS_CURRENT', 'CNT_DRAWINGS_OTHER_CURRENT',
+                        'CNT_DRAWINGS_POS_CURRENT', 'CNT_INSTALMENT_MATURE_CUM'),
+    # ATM balance ratio, with smoothing by 0.00001 to avoid dividing by zero
+    'BALANCE_LIMIT_RATIO': ('div', 'AMT_BALANCE', ('add', 'AMT_CREDIT_LIMIT_ACTUAL', 0.00001)),
+    # Number of times drawing was done, with smoothing by 0.00001 to avoid dividing by zero
+    'MIN_PAYMENT_RATIO': ('div', 'AMT_PAYMENT_CURRENT', ('add', 'AMT_INST_MIN_REGULARITY', 0.0001)),
+    'MIN_PAYMENT_TOTAL_RATIO': ('div', 'AMT_PAYMENT_TOTAL_CURRENT', ('add', 'AMT_INST_MIN_REGULARITY', 0.00001)),
+    # Days past due ratio, with smoothing by 0.00001 to avoid dividing by zero
+    'SK_DPD_RATIO': ('div', 'SK_DPD', ('add', 'SK_DPD_DEF', 0.00001)),
+    # Difference in payment min and current
+    'PAYMENT_MIN_DIFF': ('sub', 'AMT_PAYMENT_CURRENT', 'AMT_INST_MIN_REGULARITY'),
+    # Difference in total payment and current
+    'PAYMENT_MIN_TOTAL_DIFF': ('sub', 'AMT_PAYMENT_TOTAL_CURRENT', 'AMT_INST_MIN_REGULARITY'),
+    # Interest received
+    'AMT_INTEREST_RECEIVABLE': ('sub', 'AMT_TOTAL_RECEIVABLE', 'AMT_RECEIVABLE_PRINCIPAL'),
+}
+
+RATIOS_DERIVED = {
+    # CREDIT TO INCOME RATIO
+    'BUREAU_INCOME_CREDIT_RATIO': ('div', 'BUREAU_AMT_CREDIT_SUM_MEAN', 'AMT_INCOME_TOTAL'),
+    'BUREAU_ACTIVE_CREDIT_TO_INCOME_RATIO': ('div', 'BUREAU_ACTIVE_AMT_CREDIT_SUM_SUM', 'AMT_INCOME_TOTAL'),
+
+    # PREVIOUS TO CURRENT CREDIT RATIO
+    'CURRENT_TO_APPROVED_CREDIT_MIN_RATIO': ('div', 'APPROVED_AMT_CREDIT_MIN', 'AMT_CREDIT'),
+    'CURRENT_TO_APPROVED_CREDIT_MAX_RATIO': ('div', 'APPROVED_AMT_CREDIT_MAX', 'AMT_CREDIT'),
+    'CURRENT_TO_APPROVED_CREDIT_MEAN_RATIO': ('div', 'APPROVED_AMT_CREDIT_MEAN', 'AMT_CREDIT'),
+
+    # PREVIOUS TO CURRENT ANNUITY RATIO
+    'CURRENT_TO_APPROVED_ANNUITY_MAX_RATIO': ('div', 'APPROVED_AMT_ANNUITY_MAX', 'AMT_ANNUITY'),
+    'CURRENT_TO_APPROVED_ANNUITY_MEAN_RATIO': ('div', 'APPROVED_AMT_ANNUITY_MEAN', 'AMT_ANNUITY'),
+    'PAYMENT_MIN_TO_ANNUITY_RATIO': ('div', 'INS_AMT_PAYMENT_MIN', 'AMT_ANNUITY'),
+    'PAYMENT_MAX_TO_ANNUITY_RATIO': ('div', 'INS_AMT_PAYMENT_MAX', 'AMT_ANNUITY'),
+    'PAYMENT_MEAN_TO_ANNUITY_RATIO': ('div', 'INS_AMT_PAYMENT_MEAN', 'AMT_ANNUITY'),
+
+    # PREVIOUS TO CURRENT CREDIT TO ANNUITY RATIO
+    'CTA_CREDIT_TO_ANNUITY_MAX_RATIO': ('div', 'APPROVED_CREDIT_TO_ANNUITY_RATIO_MAX', 'CREDIT_TO_ANNUITY_RATIO'),
+    'CTA_CREDIT_TO_ANNUITY_MEAN_RATIO': ('div', 'APPROVED_CREDIT_TO_ANNUITY_RATIO_MEAN', 'CREDIT_TO_ANNUITY_RATIO'),
+
+    # DAYS DIFFERENCES AND RATIOS
+    'DAYS_DECISION_MEAN_TO_BIRTH': ('div', 'APPROVED_DAYS_DECISION_MEAN', 'DAYS_BIRTH'),
+    'DAYS_CREDIT_MEAN_TO_BIRTH': ('div', 'BUREAU_DAYS_CREDIT_MEAN', 'DAYS_BIRTH'),
+    'DAYS_DECISION_MEAN_TO_EMPLOYED': ('div', 'APPROVED_DAYS_DECISION_MEAN', 'DAYS_EMPLOYED'),
+    'DAYS_CREDIT_MEAN_TO_EMPLOYED': ('div', 'BUREAU_DAYS_CREDIT_MEAN', 'DAYS_EMPLOYED'),
+}
+
+
+def _expression_columns(expression):
+    ''' Column names (strings) in an expression of utils.derived, in order. '''
+    if isinstance(expression, str):
+        return [expression]
+    if isinstance(expression, tuple):
+        return [c for argument in expression[1:] for c in _expression_columns(argument)]
+    return []
+
+
+def _input_columns(keys, aggregations=(), derived=(), extra=()):
+    '''
+    Columns a builder reads: its keys, the keys of its aggregation dicts, the columns of
+    its derived expressions and the extra columns it uses directly, in this order and
+    without duplicates. Names that are not raw columns (derived features) are dropped by
+    utils.loader.input_columns when the table is read.
+    '''
+    columns = list(keys)
+    columns += [c for aggregation in aggregations for c in aggregation]
+    columns += [c for declaration in derived for e in declaration.values() for c in _expression_columns(e)]
+    columns += list(extra)
+    return list(dict.fromkeys(columns))
+
+
+BUREAU_BALANCE_INPUT_COLUMNS = _input_columns(['SK_ID_BUREAU'], extra=['MONTHS_BALANCE'])
+
+BUREAU_INPUT_COLUMNS = _input_columns(
+    ['SK_ID_CURR', 'SK_ID_BUREAU'],
+    [BUREAU_AGG, BUREAU_ACTIVE_AGG, BUREAU_CLOSED_AGG, BUREAU_LOAN_TYPE_AGG, BUREAU_TIME_AGG],
+    [BUREAU_DERIVED])
+
+PREVIOUS_INPUT_COLUMNS = _input_columns(
+    ['SK_ID_CURR', 'SK_ID_PREV'],
+    [PREVIOUS_AGG, PREVIOUS_ACTIVE_AGG, PREVIOUS_APPROVED_AGG, PREVIOUS_REFUSED_AGG,
+     PREVIOUS_LATE_PAYMENTS_AGG, PREVIOUS_TIME_AGG, PREVIOUS_LOAN_TYPE_AGG],
+    [PREVIOUS_DERIVED])
+
+# CNT_INSTALMENT and CNT_INSTALMENT_FUTURE: exponential moving averages and remaining installments
+POS_CASH_INPUT_COLUMNS = _input_columns(
+    ['SK_ID_CURR', 'SK_ID_PREV'], [POS_CASH_AGG], [POS_CASH_DERIVED, POS_CASH_LOAN_DERIVED],
+    extra=['CNT_INSTALMENT', 'CNT_INSTALMENT_FUTURE'])
+
+# NUM_INSTALMENT_NUMBER: payments grouped by installment
+INSTALLMENTS_INPUT_COLUMNS = _input_columns(
+    ['SK_ID_CURR', 'SK_ID_PREV'], [INSTALLMENTS_AGG, INSTALLMENTS_TIME_AGG],
+    [INSTALLMENTS_DAYS_DERIVED, INSTALLMENTS_DERIVED], extra=['NUM_INSTALMENT_NUMBER'])
+
+# AMT_RECIVABLE: raw name of AMT_RECEIVABLE, renamed by credit_card()
+CREDIT_CARD_INPUT_COLUMNS = _input_columns(
+    ['SK_ID_CURR', 'SK_ID_PREV'], [CREDIT_CARD_AGG, CREDIT_CARD_TIME_AGG], [CREDIT_CARD_DERIVED],
+    extra=rolling_columns + ['AMT_RECIVABLE'])
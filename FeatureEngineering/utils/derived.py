@@ -0,0 +1,195 @@
+'''Derived columns declared as expressions and computed on batches of rows of the columns.
+
+A derived column is declared in utils.constants as name: expression, where an
+expression is a tuple (operation, *arguments) and an argument is a column
+name, a number or another expression:
+    ('add', a, b, ...)          a + b + ..., from left to right
+    ('sub', a, b)               a - b
+    ('mul', a, b, ...)          a * b * ..., from left to right
+    ('div', a, b)               a / b
+    ('neg', a)                  -a
+    ('pow', a, n)               a ** n
+    ('clip', x, low)            low where x <= low, else x (missing values kept), float64
+    ('gt', x, v), ('ge', x, v), ('lt', x, v), ('le', x, v), ('eq', x, v)
+                                1 where the comparison holds, else 0 (also for missing values)
+    ('between', x, low, high)   1 where low < x < high, else 0
+    ('and', a, b, ...)          1 where every flag is 1, else 0
+    ('where', flag, a, b)       a where flag is 1, else b, float64
+Arithmetic has the dtypes of the pandas operations it replaces (float32
+columns give float32 values, int / int gives float64); flags are int64, as
+the per-row `lambda x: 1 if ... else 0` they replace. A column declared with
+the expression None is computed by the builder and given to add_derived.
+
+The columns of a declaration are evaluated batch of rows by batch of rows,
+so that the intermediate values of a batch stay in cache, and written into
+one preallocated block per dtype; an expression used by several columns
+(e.g. 1 + CNT_CHILDREN) is computed once per batch. The blocks are added to
+the table with one concat, which slices the blocks of the table and of the
+new columns instead of copying them: inserting the columns one by one copies
+each of them and fragments the table into a block per column.
+'''
+import operator
+from functools import reduce
+import numpy as np
+import pandas as pd
+
+# Rows of the derived columns evaluated at a time
+DERIVED_BATCH_ROWS = 65536
+
+_COMPARISONS = {'gt': operator.gt, 'ge': operator.ge, 'lt': operator.lt,
+                'le': operator.le, 'eq': operator.eq}
+_ARITHMETIC = {'add': operator.add, 'sub': operator.sub, 'mul': operator.mul,
+               'div': operator.truediv, 'pow': operator.pow}
+# Operations whose values can be written into a given array
+_UFUNCS = {'add': np.add, 'sub': np.subtract, 'mul': np.multiply, 'div': np.true_divide}
+
+
+def _flag(values):
+    return np.asarray(values, dtype=bool).astype(np.int64)
+
+
+def _evaluate(expression, column, cache=None, out=None):
+    '''
+    Compute an expression on the columns returned by column(name); the values of
+    the expressions already computed are kept in cache, by expression. The values
+    of an arithmetic operation are written into out when given, with its dtype.
+    '''
+    key = repr(expression)
+    if cache is not None and key in cache:
+        return cache[key]
+    operation, *arguments = expression
+    values = [_evaluate(argument, column, cache) if isinstance(argument, tuple)
+              else column(argument) if isinstance(argument, str) else argument
+              for argument in arguments]
+    if operation in _UFUNCS and out is not None:
+        result = _UFUNCS[operation](values[0], values[1], out=out)
+        for value in values[2:]:
+            result = _UFUNCS[operation](result, value, out=out)
+    elif operation in _ARITHMETIC:
+        result = reduce(_ARITHMETIC[operation], values)
+    elif operation == 'neg':
+        result = np.negative(values[0], out=out)
+    elif operation == 'clip':
+        x = np.asarray(values[0], dtype=np.float64)
+        result = np.where(x <= values[1], np.float64(values[1]), x)
+    elif operation in _COMPARISONS:
+        result = _flag(_COMPARISONS[operation](values[0], values[1]))
+    elif operation == 'between':
+        x, low, high = values
+        result = _flag((x > low) & (x < high))
+    elif operation == 'and':
+        result = _flag(np.logical_and.reduce([np.asarray(v) == 1 for v in values]))
+    elif operation == 'where':
+        flag, a, b = values
+        result = np.where(np.asarray(flag) == 1, np.asarray(a, dtype=np.float64), np.float64(b))
+    else:
+        raise ValueError(f'Unknown operation {operation} in derived column expression {expression}')
+    if cache is not None:
+        cache[key] = result
+    return result
+
+
+def evaluate(df, expression):
+    '''
+    Compute an expression on the columns of df.
+        Input:
+            df : pandas.DataFrame
+                Table with the columns used by the expression.
+            expression : tuple
+                (operation, *arguments), see the module docstring.
+        Output:
+            values : numpy.ndarray
+                One value per row of df.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        return _evaluate(expression, lambda name: df[name].to_numpy())
+
+
+def _derived_blocks(df, derived, batch_rows):
+    '''
+    Compute derived columns batch of rows by batch of rows.
+        Output:
+            blocks : list
+                (names, block) of each dtype: the values of column names[i] are block[i].
+    '''
+    n_rows = len(df)
+    sources, blocks, where = {}, {}, {}
+    for start in range(0, max(n_rows, 1), batch_rows):
+        rows = slice(start, start + batch_rows)
+        batch, cache = {}, {}
+
+        def column(name):
+            if name in batch:
+                return batch[name]
+            if name not in sources:
+                sources[name] = df[name].to_numpy()
+            return sources[name][rows]
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            for name, expression in derived.items():
+                # After the first batch, the values are written into their row of the block
+                target = blocks[where[name][0]][where[name][1], rows] if name in where else None
+                values = np.asarray(_evaluate(expression, column, cache, target))
+                if target is not None and values is not target:
+                    target[...] = values
+                if name in batch or name in df.columns:
+                    cache.clear()  # the expressions computed before read the former values of name
+                batch[name] = values
+        if start == 0:
+            # The first batch gives the dtype of each column
+            names = {}
+            for name, values in batch.items():
+                names.setdefault(values.dtype, []).append(name)
+            for dtype, cols in names.items():
+                blocks[dtype] = np.empty((len(cols), n_rows), dtype=dtype)
+                for i, name in enumerate(cols):
+                    where[name] = (dtype, i)
+                    blocks[dtype][i, rows] = batch[name]
+    return [([name for name in where if where[name][0] == dtype], block) for dtype, block in blocks.items()]
+
+
+def add_derived(df, derived, values=None, batch_rows=DERIVED_BATCH_ROWS):
+    '''
+    Add derived columns to a table, in the order they are declared.
+        Input:
+            df : pandas.DataFrame
+                Table; its columns with a derived name are replaced in place.
+            derived : dict
+                Expression of each new column (see utils.constants), which may use
+                the columns declared before it; None for the columns given in values.
+            values : dict
+                Values of the columns declared with the expression None, computed by
+                the caller (e.g. row statistics); expressions cannot use them.
+            batch_rows : int
+                Number of rows evaluated at a time.
+        Output:
+            df : pandas.DataFrame
+                df with the new columns, in one block per dtype. The existing
+                columns share the data of df.
+    '''
+    values = values or {}
+    missing = [name for name, expression in derived.items() if expression is None and name not in values]
+    if missing:
+        raise ValueError(f'No values given for the derived columns {missing}')
+    frames = []
+    for names, block in _derived_blocks(df, {name: e for name, e in derived.items() if e is not None}, batch_rows):
+        for i, name in enumerate(names):
+            if name in df.columns:
+                df[name] = block[i]  # an existing column keeps its place
+        new = [i for i, name in enumerate(names) if name not in df.columns]
+        if len(new) < len(names):
+            block, names = block[new], [names[i] for i in new]
+        frames.append(pd.DataFrame(block.T, index=df.index, columns=names, copy=False))
+    given = {name: values[name] for name, expression in derived.items() if expression is None}
+    for name in [name for name in given if name in df.columns]:
+        df[name] = given.pop(name)
+    if given:
+        frames.append(pd.DataFrame(given, index=df.index))
+    order = list(df.columns) + [name for name in derived if name not in df.columns]
+    if len(order) == len(df.columns):
+        return df
+    # Under copy on write, concat and the selection of the columns in their order
+    # slice the blocks of the tables instead of copying them into new blocks
+    with pd.option_context('mode.copy_on_write', True):
+        df = pd.concat([df] + frames, axis=1)
+        return df if list(df.columns) == order else df[order]
@@ -1,32 +1,57 @@
+import numpy as np
 import pandas as pd
 
 
+def do_aggregate(df, group_cols, aggregations):
+    '''
+    Add statistics of columns by group to every row of a table, as
+    do_sum/do_mean/do_median/do_std, for several columns at once.
+
+    The groups are found once and each statistic is written to the rows
+    through their group number, instead of a merge (a copy of the whole
+    table) per statistic.
+        Input:
+            df : pandas.DataFrame
+                Table.
+            group_cols : list
+                Key columns of the groups.
+            aggregations : dict
+                (column, statistic) of each new column, e.g.
+                {'GROUP_INCOME_MEAN': ('AMT_INCOME_TOTAL', 'mean')};
+                statistic is a pandas groupby aggregation.
+        Output:
+            df : pandas.DataFrame
+                df with a RangeIndex and the new columns, as a left merge gives;
+                rows with a missing key get missing values. The existing
+                columns share the data of df.
+    '''
+    groups = df.groupby(group_cols, observed=True)
+    codes = groups.ngroup().fillna(-1).to_numpy().astype(np.int64)
+    unmatched = codes < 0  # rows with a missing key belong to no group
+    df = df.copy(deep=False)
+    df.index = pd.RangeIndex(len(df))
+    for agg_name, (counted, statistic) in aggregations.items():
+        values = groups[counted].agg(statistic).to_numpy()
+        if unmatched.any():
+            if values.dtype.kind in 'biu':
+                values = values.astype(np.float64)
+            # Group number -1 takes the missing value appended last
+            values = np.concatenate([values, np.full(1, np.nan, dtype=values.dtype)])
+        df[agg_name] = values[codes]
+    return df
+
+
 def do_sum(dataframe, group_cols, counted, agg_name):
-    gp = dataframe[group_cols + [counted]].groupby(
-        group_cols)[counted].sum().reset_index().rename(columns={counted: agg_name})
-    dataframe = dataframe.merge(gp, on=group_cols, how='left')
-    return dataframe
+    return do_aggregate(dataframe, group_cols, {agg_name: (counted, 'sum')})
 
 
 def do_mean(df, group_cols, counted, agg_name):
-    gp = df[group_cols + [counted]].groupby(group_cols)[counted].mean().reset_index().rename(
-        columns={counted: agg_name})
-    df = df.merge(gp, on=group_cols, how='left')
-    del gp
-    return df
+    return do_aggregate(df, group_cols, {agg_name: (counted, 'mean')})
 
 
 def do_median(df, group_cols, counted, agg_name):
-    gp = df[group_cols + [counted]].groupby(group_cols)[counted].median().reset_index().rename(
-        columns={counted: agg_name})
-    df = df.merge(gp, on=group_cols, how='left')
-    del gp
-    return df
+    return do_aggregate(df, group_cols, {agg_name: (counted, 'median')})
 
 
 def do_std(df, group_cols, counted, agg_name):
-    gp = df[group_cols + [counted]].groupby(group_cols)[counted].std().reset_index().rename(
-        columns={counted: agg_name})
-    df = df.merge(gp, on=group_cols, how='left')
-    del gp
-    return df
+    return do_aggregate(df, group_cols, {agg_name: (counted, 'std')})
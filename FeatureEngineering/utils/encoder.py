@@ -1,23 +1,92 @@
+import numpy as np
 import pandas as pd
+from .keys import factorize_keys
 
 
-def one_hot_encoder(df, categorical_columns=None, nan_as_category=True):
-    """Create a new column for each categorical value in categorical columns using get dummies. """
+def _categorical_columns(df):
+    return [col for col in df.columns if df[col].dtype == 'object' or isinstance(df[col].dtype, pd.CategoricalDtype)]
+
+
+def one_hot_encoder(df, categorical_columns=None, nan_as_category=True, dtype=bool, sparse=False):
+    """Create a new column for each categorical value in categorical columns using get dummies.
+    dtype (e.g. np.uint8) and sparse set the type of the new columns, as for pd.get_dummies. """
     original_columns = list(df.columns)
     if not categorical_columns:
-        categorical_columns = [
-            col for col in df.columns if df[col].dtype == 'object']
+        categorical_columns = _categorical_columns(df)
     df = pd.get_dummies(df, columns=categorical_columns,
-                        dummy_na=nan_as_category)
+                        dummy_na=nan_as_category, dtype=dtype, sparse=sparse)
     categorical_columns = [c for c in df.columns if c not in original_columns]
     return df, categorical_columns
 
 
+def category_codes(df, categorical_columns=None, nan_as_category=True):
+    '''
+    Encode categorical columns as integer codes, one code per column of their
+    one-hot encoding, without creating these columns.
+        Input:
+            df : pandas.DataFrame
+                Table.
+            categorical_columns : list
+                Columns to encode, default: the object and categorical columns.
+            nan_as_category : bool
+                Missing values get their own code (column COL_nan), as in one_hot_encoder;
+                otherwise they are coded -1.
+        Output:
+            codes : dict
+                int64 codes of each column.
+            names : dict
+                Names one_hot_encoder gives the columns of the codes of each column, in code order.
+    '''
+    if not categorical_columns:
+        categorical_columns = _categorical_columns(df)
+    codes, names = {}, {}
+    for col in categorical_columns:
+        values = df[col].array if isinstance(df[col].dtype, pd.CategoricalDtype) else pd.Categorical(df[col])
+        codes[col] = values.codes.astype(np.int64)
+        names[col] = [f'{col}_{category}' for category in values.categories]
+        if nan_as_category:
+            codes[col][codes[col] < 0] = len(names[col])
+            names[col].append(f'{col}_nan')
+    return codes, names
+
+
+def category_means(df, by, categorical_columns=None, nan_as_category=True, key_dictionary=None):
+    '''
+    Share of the rows of each group in each category, as
+    one_hot_encoder(df)[0].groupby(by)[dummies].mean(), from the count of the
+    rows of every (group, category) pair: the dummies are never created.
+        Input:
+            df : pandas.DataFrame
+                Table.
+            by : str
+                Key column of the groups.
+            categorical_columns, nan_as_category :
+                See category_codes.
+            key_dictionary : utils.KeyDictionary
+                Codes of the keys shared by the builders, see group_many.
+        Output:
+            means : pandas.DataFrame
+                float64 means, one row per key (sorted, index named by) and
+                one column per dummy.
+    '''
+    groups, keys = factorize_keys(df[by], by, key_dictionary)
+    grouped = groups >= 0  # rows with a missing key belong to no group
+    sizes = np.bincount(groups[grouped], minlength=len(keys))
+    codes, names = category_codes(df, categorical_columns, nan_as_category)
+    means = {}
+    for col, code in codes.items():
+        rows = grouped & (code >= 0)
+        counts = np.bincount(groups[rows] * len(names[col]) + code[rows], minlength=len(keys) * len(names[col]))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shares = counts.reshape(len(keys), len(names[col])) / sizes[:, None]
+        means.update(zip(names[col], shares.T))
+    return pd.DataFrame(means, index=pd.Index(keys, name=by))
+
+
 def label_encoder(df, categorical_columns=None):
     """Encode categorical values as integers (0,1,2,3...) with pandas.factorize. """
     if not categorical_columns:
-        categorical_columns = [
-            col for col in df.columns if df[col].dtype == 'object']
+        categorical_columns = _categorical_columns(df)
     for col in categorical_columns:
         df[col], uniques = pd.factorize(df[col])
     return df, categorical_columns
@@ -38,3 +107,32 @@ def get_age_label(days_birth):
         return 5
     else:
         return 0
+
+
+# Upper bounds (years, excluded) of the age groups of get_age_label, and the label of each group
+_AGE_BOUNDS = [27, 40, 50, 65, 99]
+_AGE_LABELS = np.array([1, 2, 3, 4, 5, 0])
+
+
+def get_age_labels(days_birth):
+    """ get_age_label of every value of an array, by lookup of its age group (missing values: 0). """
+    age_years = -np.asarray(days_birth, dtype=np.float64) / 365
+    return _AGE_LABELS[np.searchsorted(_AGE_BOUNDS, age_years, side='right')]
+
+
+def bin_labels(values, bins, labels):
+    '''
+    pd.cut(values, bins, labels=labels, right=False), by lookup of the bin of each value.
+        Input:
+            values : array-like
+            bins : list
+                Increasing edges; value v is in bin i when bins[i] <= v < bins[i + 1].
+            labels : list
+                Label of each bin.
+        Output:
+            labels : pandas.Categorical
+                Ordered labels, missing for missing values and values outside the bins.
+    '''
+    codes = np.searchsorted(bins, np.asarray(values), side='right') - 1
+    codes[codes >= len(bins) - 1] = -1
+    return pd.Categorical.from_codes(codes, categories=pd.Index(labels), ordered=True)
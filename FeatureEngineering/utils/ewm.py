@@ -0,0 +1,90 @@
+'''Exponentially weighted means of every group of a table, for all groups at once.
+
+df.groupby(keys)[columns].transform(lambda x: x.ewm(alpha=a).mean()) calls
+the lambda once per group. Here the rows are sorted by group once and the
+recursion of pandas' ewm (adjust=True, ignore_na=False, min_periods=0) is run
+step by step over the position in the group: step k updates the k-th row of
+every group that has one, for every column at once. The operations are the
+ones of pandas, in the same order, so the results are the same.
+'''
+import numpy as np
+import pandas as pd
+
+
+def segment_ewm(values, starts, lengths, alphas):
+    '''
+    Exponentially weighted means of segments of rows.
+        Input:
+            values : numpy.ndarray
+                2-d array (rows x columns), the rows of each segment contiguous.
+            starts : numpy.ndarray
+                First row of each segment.
+            lengths : numpy.ndarray
+                Number of rows of each segment.
+            alphas : numpy.ndarray
+                Smoothing factor of each column.
+        Output:
+            means : numpy.ndarray
+                float64 array shaped as values, the mean of each row over the rows
+                of its segment up to it (missing until the first value).
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    means = np.full(values.shape, np.nan)
+    alphas = np.asarray(alphas, dtype=np.float64)
+    decay = 1. - 1. / (1. + (1. - alphas) / alphas)  # pandas goes through the center of mass
+    n_columns = values.shape[1]
+    weighted = np.full((len(starts), n_columns), np.nan)
+    old_wt = np.ones((len(starts), n_columns))
+
+    groups = np.argsort(-lengths, kind='stable')  # longest first: active groups are a prefix
+    starts, lengths = starts[groups], lengths[groups]
+    for k in range(int(lengths.max()) if len(lengths) else 0):
+        active = np.searchsorted(-lengths, -k, side='left')  # groups with more than k rows
+        rows = starts[:active] + k
+        cur = values[rows]
+        w, wt = weighted[:active], old_wt[:active]
+        seen = ~np.isnan(w)
+        observed = ~np.isnan(cur)
+        if k > 0:
+            wt = np.where(seen, wt * decay, wt)
+            update = seen & observed & (w != cur)
+            with np.errstate(invalid='ignore'):
+                w = np.where(update, (wt * w + cur) / (wt + 1.), w)
+            wt = np.where(seen & observed, wt + 1., wt)
+        w = np.where(~seen & observed, cur, w)
+        weighted[:active], old_wt[:active] = w, wt
+        means[rows] = w
+    return means
+
+
+def ewm_mean(df, by, columns, alphas):
+    '''
+    Exponentially weighted mean of columns within the groups of df, in the order of
+    the rows, as df.groupby(by)[columns].transform(lambda x: x.ewm(alpha=alpha).mean()).
+        Input:
+            df : pandas.DataFrame
+                Table.
+            by : str or list
+                Key column(s) of the groups.
+            columns : list
+                Columns to smooth.
+            alphas : float or list
+                Smoothing factor, or one per column.
+        Output:
+            means : pandas.DataFrame
+                float64 means with the index of df and the given columns;
+                rows with a missing key get missing values.
+    '''
+    columns = list(columns)
+    alphas = np.broadcast_to(np.asarray(alphas, dtype=np.float64), (len(columns),))
+    codes = df.groupby(by, sort=False).ngroup().fillna(-1).to_numpy().astype(np.int64)
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]
+    sizes = np.bincount(codes[order]) if len(order) else np.zeros(0, dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+
+    values = np.column_stack([df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in columns]) \
+        if columns else np.empty((len(df), 0))
+    means = np.full((len(df), len(columns)), np.nan)
+    means[order] = segment_ewm(values[order], starts, sizes, alphas)
+    return pd.DataFrame(means, index=df.index, columns=columns)
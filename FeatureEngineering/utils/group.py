@@ -1,4 +1,6 @@
+import numpy as np
 import pandas as pd
+from .keys import factorize_keys
 
 
 def group(df_to_agg, prefix, aggregations, aggregate_by='SK_ID_CURR'):
@@ -11,3 +13,263 @@ def group(df_to_agg, prefix, aggregations, aggregate_by='SK_ID_CURR'):
 def group_and_merge(df_to_agg, df_to_merge, prefix, aggregations, aggregate_by='SK_ID_CURR'):
     agg_df = group(df_to_agg, prefix, aggregations, aggregate_by=aggregate_by)
     return df_to_merge.merge(agg_df, how='left', on=aggregate_by)
+
+
+def group_many(df, jobs, aggregate_by='SK_ID_CURR', key_dictionary=None, windows=None):
+    '''
+    Run several aggregations of row subsets of one table in a single pass.
+
+    The key is factorized and the rows sorted by key once; the columns used by
+    the jobs are gathered in that order once and shared by all the jobs, so no
+    filtered copy of the table is made. Each job is reduced segment by segment
+    (one segment per key) and the results are assembled with one join.
+        Input:
+            df : pandas.DataFrame
+                Table to aggregate.
+            jobs : list
+                (prefix, mask, aggregations) of each aggregation: mask is a
+                boolean array of the rows to aggregate (None for all rows) and
+                aggregations a dict as for group.
+            aggregate_by : str
+                Key column.
+            key_dictionary : utils.KeyDictionary
+                Codes of the keys shared by the builders, to number the groups
+                without factorizing the key again.
+            windows : list
+                (time, starts, aggregations) of each family of time windows,
+                aggregated after the jobs: time is a column of df or an array
+                with the time of each row, and starts a dict {prefix: start}
+                of windows of the rows with time >= start, e.g.
+                {'BUREAU_LAST6M_': -180, 'BUREAU_LAST12M_': -360}. See _window_blocks.
+        Output:
+            agg_df : pandas.DataFrame
+                One row per key of df, in sorted order, and the columns of
+                group(df[mask], prefix, aggregations) for each job, then of each
+                window; keys without rows in a job get missing values, as with
+                group_and_merge. Sums of integer columns are 64-bit integers.
+    '''
+    codes, keys = factorize_keys(df[aggregate_by], aggregate_by, key_dictionary)
+    order = np.argsort(codes, kind='stable')
+    order = order[codes[order] >= 0]  # rows with a missing key belong to no group
+    codes = codes[order]
+
+    columns = {c for _, _, aggregations in jobs for c in aggregations}
+    values = {c: df[c].to_numpy()[order] for c in columns}
+
+    blocks = []
+    for prefix, mask, aggregations in jobs:
+        rows = slice(None) if mask is None else np.asarray(mask)[order]
+        job_codes = codes[rows]
+        starts = np.flatnonzero(np.r_[True, job_codes[1:] != job_codes[:-1]]) if len(job_codes) else job_codes
+        block = {}
+        for column, aggs in aggregations.items():
+            for agg in aggs:
+                name = '{}{}_{}'.format(prefix, column, agg.upper())
+                block[name] = _segment_reduce(values[column][rows], job_codes, starts, agg)
+        blocks.append(pd.DataFrame(block, index=job_codes[starts]).reindex(np.arange(len(keys))))
+    for time, starts, aggregations in windows or []:
+        time = df[time] if isinstance(time, str) else time
+        blocks.extend(_window_blocks(df, order, codes, len(keys), time, starts, aggregations))
+
+    agg_df = pd.concat(blocks, axis=1)
+    agg_df.insert(0, aggregate_by, keys)
+    return agg_df.reset_index(drop=True)
+
+
+def _sum_dtype(dtype):
+    '''
+    Output dtype of a sum of values of dtype. Integers and booleans are summed
+    into 64 bits (uint64 for unsigned integers) so that the sums of int8 and
+    int16 columns do not wrap around; this is deliberate, pandas may keep the
+    dtype of the column.
+    '''
+    if dtype.kind == 'f':
+        return dtype
+    return np.uint64 if dtype.kind == 'u' else np.int64
+
+
+def _segment_reduce(values, codes, starts, agg):
+    '''
+    Reduce each segment of values sorted by group, with the semantics (missing
+    values skipped) and output dtypes of pandas groupby aggregations, except
+    the 64-bit integer sums of _sum_dtype.
+    '''
+    if values.dtype.kind not in 'biuf' or not len(values):
+        return pd.Series(values).groupby(codes, sort=False).agg(agg).to_numpy()
+
+    dtype = values.dtype
+    is_float = dtype.kind == 'f'
+    valid = ~np.isnan(values) if is_float else np.ones(len(values), dtype=bool)
+    if agg == 'size':
+        return np.diff(np.r_[starts, len(values)]).astype(np.int64)
+    if agg == 'count':
+        return np.add.reduceat(valid, starts, dtype=np.int64)
+    if agg in ('sum', 'mean', 'var'):
+        acc = np.float64 if is_float else _sum_dtype(dtype)
+        total = np.add.reduceat(np.where(valid, values, 0).astype(acc), starts)
+        if agg == 'sum':
+            return total.astype(_sum_dtype(dtype))
+        count = np.add.reduceat(valid, starts, dtype=np.int64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            if agg == 'var':
+                deviation = np.where(valid, values - np.repeat(mean, np.diff(np.r_[starts, len(values)])), 0)
+                mean = np.add.reduceat(deviation ** 2, starts) / np.where(count > 1, count - 1, np.nan)
+        return mean.astype(np.float32 if dtype == np.float32 else np.float64)
+    if agg in ('min', 'max'):
+        return (np.fmin if agg == 'min' else np.fmax).reduceat(values, starts)
+    if agg == 'last':
+        last = np.maximum.reduceat(np.where(valid, np.arange(len(values)), -1), starts)
+        result = values[np.maximum(last, 0)]
+        if is_float:
+            result[last < starts] = np.nan
+        return result
+    if agg == 'nunique':
+        by_value = np.lexsort((values, codes))
+        v, c = values[by_value], codes[by_value]
+        new = np.r_[True, (v[1:] != v[:-1]) | (c[1:] != c[:-1])] & ~np.isnan(v.astype(np.float64))
+        return np.add.reduceat(new, starts, dtype=np.int64)
+    return pd.Series(values).groupby(codes, sort=False).agg(agg).to_numpy()
+
+
+# Statistics of _window_blocks computed from those of the narrower windows
+_WINDOW_AGGS = ('size', 'count', 'sum', 'mean', 'var', 'min', 'max', 'last')
+
+
+def _window_blocks(df, order, codes, n_keys, time, starts, aggregations):
+    '''
+    Blocks of group_many for a family of nested time windows.
+
+    A row belongs to every window starting at or before its time (missing
+    times: to none). The rows are sorted once by key and narrowest window, so
+    the rows of a key that a window adds to the narrower one are a segment,
+    reduced once; the statistics of each window extend those of the narrower
+    one by this segment: sums and counts are accumulated, min and max taken
+    over the segments, the last value taken at the largest row position and
+    the variance pooled from the count, mean and sum of squared deviations of
+    the segments. Other statistics are reduced over the rows of each window.
+        Input:
+            order, codes :
+                Rows of df with a key, sorted by key, and their group numbers.
+            n_keys : int
+                Number of groups.
+            time, starts, aggregations :
+                See group_many.
+        Output:
+            blocks : list
+                DataFrame of each window, in the order of starts, one row per group.
+    '''
+    prefixes = sorted(starts, key=starts.get, reverse=True)  # narrowest window first
+    n_windows = len(prefixes)
+    time = np.asarray(time, dtype=np.float64)[order]
+    rank = np.full(len(order), n_windows, dtype=np.int64)  # narrowest window of each row
+    for w in reversed(range(n_windows)):
+        rank[time >= starts[prefixes[w]]] = w
+
+    inside = np.flatnonzero(rank < n_windows)
+    by_cell = inside[np.argsort(codes[inside].astype(np.int64) * n_windows + rank[inside], kind='stable')]
+    rows = order[by_cell]
+    cells = codes[by_cell].astype(np.int64) * n_windows + rank[by_cell]
+    cell_starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]]) if len(cells) else cells
+    cell_key, cell_window = np.divmod(cells[cell_starts], n_windows)
+
+    def accumulate(cell_values, ufunc, empty=0):
+        '''
+        Statistic of each group (row) in each window (column), accumulated by ufunc
+        from those of its segments (None: of the segment only, empty without rows).
+        '''
+        dense = np.full((n_keys, n_windows), empty, dtype=cell_values.dtype)
+        dense[cell_key, cell_window] = cell_values
+        return dense if ufunc is None else ufunc.accumulate(dense, axis=1)
+
+    sizes = accumulate(np.diff(np.r_[cell_starts, len(cells)]), np.add)
+    present = [np.flatnonzero(sizes[:, w]) for w in range(n_windows)]
+    blocks = [{} for _ in prefixes]
+    for column, aggs in aggregations.items():
+        values = df[column].to_numpy()
+        segments = None  # values of the segments, gathered once for all the statistics of the column
+        for agg in aggs:
+            if agg == 'size':
+                by_window = [sizes[present[w], w] for w in range(n_windows)]
+            elif agg in _WINDOW_AGGS and values.dtype.kind in 'biuf' and len(rows):
+                if segments is None:
+                    segments = values[rows]
+                result = _window_reduce(values, segments, rows, cell_starts, accumulate, agg)
+                by_window = [result[present[w], w] for w in range(n_windows)]
+            else:
+                by_window = []
+                for w in range(n_windows):
+                    window = rank <= w
+                    w_codes = codes[window]
+                    w_starts = np.flatnonzero(np.r_[True, w_codes[1:] != w_codes[:-1]]) if len(w_codes) else w_codes
+                    by_window.append(_segment_reduce(values[order[window]], w_codes, w_starts, agg))
+            for w, prefix in enumerate(prefixes):
+                blocks[w]['{}{}_{}'.format(prefix, column, agg.upper())] = by_window[w]
+
+    frames = {prefix: pd.DataFrame(block, index=present[w]).reindex(np.arange(n_keys))
+              for w, (prefix, block) in enumerate(zip(prefixes, blocks))}
+    return [frames[prefix] for prefix in starts]
+
+
+def _window_reduce(values, v, rows, cell_starts, accumulate, agg):
+    '''
+    Statistic of each group in each window for _window_blocks (v: values[rows]),
+    with the semantics and output dtypes of _segment_reduce.
+    '''
+    dtype = values.dtype
+    is_float = dtype.kind == 'f'
+    if agg in ('min', 'max'):
+        ufunc = np.fmin if agg == 'min' else np.fmax
+        if is_float:
+            empty = np.nan
+        elif dtype.kind == 'b':
+            empty = agg == 'min'
+        else:
+            empty = np.iinfo(dtype).max if agg == 'min' else np.iinfo(dtype).min
+        return accumulate(ufunc.reduceat(v, cell_starts), ufunc, empty)
+
+    valid = ~np.isnan(v) if is_float else None  # None: no missing values
+    if agg == 'last':
+        # Value at the largest position of a non-missing value
+        position = rows if valid is None else np.where(valid, rows, -1)
+        position = accumulate(np.maximum.reduceat(position, cell_starts), np.maximum, -1)
+        result = values[np.maximum(position, 0)]
+        if is_float:
+            result[position < 0] = np.nan
+        return result
+
+    if valid is None:
+        count = np.diff(np.r_[cell_starts, len(v)])
+    else:
+        count = np.add.reduceat(valid, cell_starts, dtype=np.int64)
+    if agg == 'count':
+        return accumulate(count, np.add)
+    summed = v.astype(_sum_dtype(dtype)) if valid is None else np.where(valid, v, 0).astype(np.float64)
+    total = np.add.reduceat(summed, cell_starts)
+    if agg == 'sum':
+        return accumulate(total, np.add).astype(_sum_dtype(dtype))
+    if agg == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = accumulate(total, np.add) / accumulate(count, np.add)
+        return mean.astype(np.float32 if dtype == np.float32 else np.float64)
+
+    # var: pool the (count, mean, sum of squared deviations) of the narrower window and the added segment
+    mean = np.divide(total, count, out=np.zeros(len(count)), where=count > 0)
+    deviation = v - np.repeat(mean, np.diff(np.r_[cell_starts, len(v)]))
+    if valid is not None:
+        deviation[~valid] = 0
+    square = np.add.reduceat(deviation ** 2, cell_starts)
+    count, mean, square = [accumulate(x, None) for x in (count, mean, square)]
+    n, pooled_mean, pooled_square = count[:, 0], mean[:, 0], square[:, 0]
+    var = np.empty(count.shape)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for w in range(count.shape[1]):
+            if w:
+                total = n + count[:, w]
+                delta = mean[:, w] - pooled_mean
+                share = np.divide(count[:, w], total, out=np.zeros(len(total)), where=total > 0)
+                pooled_square = pooled_square + square[:, w] + delta ** 2 * n * share
+                pooled_mean = pooled_mean + delta * share
+                n = total
+            var[:, w] = pooled_square / np.where(n > 1, n - 1, np.nan)
+    return var.astype(np.float32 if dtype == np.float32 else np.float64)
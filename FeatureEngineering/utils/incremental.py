@@ -0,0 +1,51 @@
+'''Update the features of a stage for a few clients instead of recomputing all of them.
+
+A builder whose features of each SK_ID_CURR only depend on the rows of that
+client (previous_application, installment, credit_card) is run on the rows of
+the new or changed clients only (see TableRegistry ids), and its new rows
+replace the rows of these clients in its last full output (see
+Checkpoints.latest). The result is the output a full rebuild would give.
+Builders that use statistics of all clients (application, the LL_ features of
+bureau, LATE_PAYMENT_SUM of pos_cash) are always rebuilt in full.
+'''
+import numpy as np
+import pandas as pd
+
+
+def upsert(block, rows, ids, key='SK_ID_CURR'):
+    '''
+    Replace the rows of some clients in the output of a builder.
+        Input:
+            block : pandas.DataFrame
+                Last full output of the builder, one row per key, sorted by key.
+            rows : pandas.DataFrame
+                Output of the builder on the rows of the clients ids only.
+            ids : iterable
+                Keys that were recomputed; their rows of block are dropped,
+                also when they have no row in rows any more.
+            key : str
+                Key column.
+        Output:
+            block : pandas.DataFrame
+                block with the rows of ids replaced, sorted by key, with the
+                dtypes a full rebuild gives.
+    '''
+    if list(rows.columns) != list(block.columns):
+        added = [c for c in rows.columns if c not in block.columns]
+        dropped = [c for c in block.columns if c not in rows.columns]
+        raise ValueError(f'The new rows have other columns than the stored features '
+                         f'(new: {added}, missing: {dropped}), e.g. a new category; '
+                         f'the stage has to be rebuilt in full')
+
+    kept = block[~block[key].isin(np.asarray(list(ids)))]
+    result = pd.concat([kept, rows], ignore_index=True)
+    result = result.sort_values(key, kind='stable').reset_index(drop=True)
+
+    # A column with missing values in only one of the parts is float there and
+    # integer in the other; a full rebuild keeps it integer when none is left
+    for c in result.columns:
+        kinds = {kept[c].dtype.kind, rows[c].dtype.kind}
+        if result[c].dtype.kind == 'f' and kinds & set('iu') and not result[c].isna().any():
+            integer = kept[c].dtype if kept[c].dtype.kind in 'iu' else rows[c].dtype
+            result[c] = result[c].astype(integer)
+    return result
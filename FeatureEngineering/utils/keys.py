@@ -0,0 +1,162 @@
+'''Dense codes of the ids of a run (SK_ID_CURR, SK_ID_PREV, SK_ID_BUREAU), shared by the builders.
+
+Each id space is numbered once, from the tables that list its ids
+(application_train/test, previous_application, bureau; see
+TableRegistry.key_dictionary): code i is the i-th smallest id, so groups of
+codes come in the order of the ids, as with a sorted groupby. The ids of a
+space span a range not much larger than their number, so the codes of a
+column are read from a lookup table indexed by id, without the hash table
+that pd.factorize, groupby and merge build for every call. Groups are then
+reduced by offsets (group_many) or counted with bincount (category_means),
+and a table with one row per id is joined to another by taking its rows at
+the codes of the other table.
+'''
+import numpy as np
+import pandas as pd
+
+# Ids are coded with a lookup table when they span at most this many times their number
+_DENSE_SPAN = 8
+
+
+class KeyDictionary:
+    '''
+    Dense int32 codes of the ids of some key columns.
+        Input:
+            keys : dict
+                Ids of each key column, e.g. {'SK_ID_CURR': application['SK_ID_CURR']}
+                (any order, duplicates and missing values allowed).
+    '''
+
+    def __init__(self, keys):
+        self._keys, self._lookup = {}, {}
+        for name, values in keys.items():
+            values = pd.unique(np.asarray(values))
+            if values.dtype.kind == 'f':
+                values = values[~np.isnan(values)].astype(np.int64)
+            values = np.sort(values)
+            self._keys[name] = values
+            if len(values) and values[-1] - values[0] < _DENSE_SPAN * len(values):
+                lookup = np.full(values[-1] - values[0] + 1, -1, dtype=np.int32)
+                lookup[values - values[0]] = np.arange(len(values), dtype=np.int32)
+                self._lookup[name] = lookup
+
+    def __contains__(self, name):
+        return name in self._keys
+
+    def keys(self, name):
+        ''' Ids of the key column name, by code. '''
+        return self._keys[name]
+
+    def codes(self, name, values):
+        '''
+        Codes of ids of the key column name.
+            Input:
+                name : str
+                    Key column, e.g. 'SK_ID_CURR'.
+                values : array-like
+                    Ids.
+            Output:
+                codes : numpy.ndarray
+                    int32 code of each id; -1 for missing values and ids not in the dictionary.
+        '''
+        values = np.asarray(values)
+        if values.dtype.kind == 'f':
+            codes = np.full(len(values), -1, dtype=np.int32)
+            valid = ~np.isnan(values)
+            codes[valid] = self.codes(name, values[valid].astype(np.int64))
+            return codes
+        keys = self._keys[name]
+        if name not in self._lookup:
+            return pd.Index(keys).get_indexer(values).astype(np.int32)
+        lookup = self._lookup[name]
+        offsets = values.astype(np.int64) - keys[0]
+        if not len(offsets) or (offsets.min() >= 0 and offsets.max() < len(lookup)):
+            return lookup.take(offsets)
+        inside = (offsets >= 0) & (offsets < len(lookup))
+        return np.where(inside, lookup.take(np.where(inside, offsets, 0)), -1).astype(np.int32)
+
+
+def factorize_keys(values, name, key_dictionary=None):
+    '''
+    pd.factorize(values, sort=True) from the codes of a key dictionary.
+        Input:
+            values : pandas.Series
+                Ids of the key column name.
+            name : str
+                Key column.
+            key_dictionary : KeyDictionary
+                Codes of the ids; None, or an id of values not in it: pd.factorize is used.
+        Output:
+            codes : numpy.ndarray
+                Number of the group of each value (-1 for missing values), in the order of the ids.
+            uniques : numpy.ndarray
+                Id of each group, with the dtype of values.
+    '''
+    if key_dictionary is None or name not in key_dictionary:
+        return pd.factorize(values, sort=True)
+    codes = key_dictionary.codes(name, values)
+    missing = codes < 0
+    n_missing = missing.sum()
+    if n_missing != values.isna().sum():
+        return pd.factorize(values, sort=True)
+    keys = key_dictionary.keys(name)
+    present = np.zeros(len(keys), dtype=bool)
+    present[codes[~missing] if n_missing else codes] = True
+    if present.all():
+        return codes, keys.astype(values.dtype)
+    # Number the ids of values only, keeping their order; code -1 reads the last entry, -1
+    numbers = np.append(np.cumsum(present, dtype=np.int32) - 1, np.int32(-1))
+    return numbers.take(codes), keys[present].astype(values.dtype)
+
+
+def take_rows(df, rows):
+    ''' Rows of df at positions rows, missing values at -1 (int columns become float64, as with a merge). '''
+    missing = rows < 0
+    if not missing.any():
+        return df.iloc[rows].reset_index(drop=True)
+    columns = {}
+    for c in df.columns:
+        values = df[c].to_numpy()
+        if values.dtype.kind in 'iu':
+            values = values.astype(np.float64)
+        elif values.dtype.kind == 'b':
+            values = values.astype(object)
+        taken = values[np.where(missing, 0, rows)]
+        taken[missing] = np.nan
+        columns[c] = taken
+    return pd.DataFrame(columns)
+
+
+def key_positions(key_dictionary, name, keys, values):
+    '''
+    Position in keys of each of values, -1 when not found: the rows of a table with one
+    row per id (keys) that a left join on values takes.
+    '''
+    codes = key_dictionary.codes(name, keys)
+    if (codes < 0).any():
+        return pd.Index(keys).get_indexer(values)
+    if len(codes) and np.bincount(codes).max() > 1:
+        raise ValueError(f'The table to join has several rows for some {name}')
+    where = np.full(len(key_dictionary.keys(name)) + 1, -1, dtype=np.int64)
+    where[codes] = np.arange(len(keys))
+    return where[key_dictionary.codes(name, values)]  # code -1 reads the last entry, -1
+
+
+def lookup_join(left, right, on, key_dictionary):
+    '''
+    left.merge(right, on=on, how='left') for a right table with one row per id, by array lookup.
+        Input:
+            left : pandas.DataFrame
+            right : pandas.DataFrame
+                One row per id of on.
+            on : str
+                Key column of both tables.
+            key_dictionary : KeyDictionary
+                Codes of the ids of on.
+        Output:
+            df : pandas.DataFrame
+                Columns of left then the other columns of right, with a RangeIndex.
+    '''
+    rows = key_positions(key_dictionary, on, right[on], left[on])
+    taken = take_rows(right.drop(columns=[on]), rows)
+    return pd.concat([left.reset_index(drop=True), taken], axis=1)
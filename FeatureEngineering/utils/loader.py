@@ -0,0 +1,185 @@
+'''Read the dseb63_*.csv source tables through an on-disk columnar cache.
+
+The first read of a table parses the csv once and stores it as a Feather file
+next to a small json side-car holding the fingerprint of the source csv.
+Later reads load the Feather file (only the requested columns) as long as the
+fingerprint still matches; any change of the csv triggers a re-conversion.
+Tables are converted to the compact dtypes declared in utils.schema, so the
+cached files, and every frame read from them, already have narrow types.
+'''
+import json
+import os
+import pandas as pd
+from .schema import SCHEMAS, apply_schema
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - pyarrow is listed in requirements.txt
+    feather = None
+
+CACHE_DIR = '.cache'
+CACHE_VERSION = 2
+
+
+def table_path(path_to_data, name):
+    ''' Return the path of the csv file of a dseb63 table, e.g. name='bureau'. '''
+    return os.path.join(path_to_data, f'dseb63_{name}.csv')
+
+
+def fingerprint(path, schema=None, **read_kwargs):
+    '''
+    Fingerprint of a source file: its size and modification time,
+    plus the schema and csv reader options used to convert it.
+        Input:
+            path : str
+                Path of the csv file.
+            schema : dict
+                Dtypes applied to the table, see utils.schema.
+            read_kwargs : dict
+                Keyword arguments passed to pandas.read_csv.
+        Output:
+            fingerprint : dict
+    '''
+    stat = os.stat(path)
+    return {'version': CACHE_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'schema': schema or {},
+            'read_kwargs': json.loads(json.dumps(read_kwargs, sort_keys=True, default=str))}
+
+
+def table_columns(path_to_data, name, **read_kwargs):
+    ''' Return the column names of a table by reading only the csv header. '''
+    return pd.read_csv(table_path(path_to_data, name), nrows=0, **read_kwargs).columns.tolist()
+
+
+def input_columns(columns, aggregations, inputs=(), categorical=()):
+    '''
+    Select the raw columns of a table that a builder really needs.
+        Input:
+            columns : list
+                All columns of the raw table.
+            aggregations : list
+                Aggregation dicts (see utils.constants) applied by the builder.
+                Their keys that are raw columns are kept, the others are derived features.
+            inputs : list
+                Raw columns used by keys, filters and derived features.
+            categorical : list
+                Raw categorical columns that are one-hot encoded.
+        Output:
+            usecols : list
+                Needed columns, in the order of the raw table.
+    '''
+    wanted = set(inputs) | set(categorical)
+    for aggregation in aggregations:
+        wanted.update(aggregation)
+    return [c for c in columns if c in wanted]
+
+
+def _cache_files(path_to_data, name, cache_dir):
+    cache_dir = cache_dir or os.path.join(path_to_data, CACHE_DIR)
+    return (os.path.join(cache_dir, f'dseb63_{name}.feather'),
+            os.path.join(cache_dir, f'dseb63_{name}.json'))
+
+
+def _is_fresh(meta_file, expected):
+    if not os.path.exists(meta_file):
+        return False
+    with open(meta_file) as f:
+        return json.load(f) == expected
+
+
+def convert_table(path_to_data, name, cache_dir=None, **read_kwargs):
+    '''
+    Parse the csv of a table and store it in the columnar cache.
+        Input:
+            path_to_data : str
+                Folder that contains the dseb63_*.csv files.
+            name : str
+                Table name without prefix and extension, e.g. 'bureau'.
+            cache_dir : str
+                Folder of the cache, default: <path_to_data>/.cache
+            read_kwargs : dict
+                Keyword arguments passed to pandas.read_csv.
+        Output:
+            df : pandas.DataFrame
+                The parsed table.
+    '''
+    source = table_path(path_to_data, name)
+    data_file, meta_file = _cache_files(path_to_data, name, cache_dir)
+    df = pd.read_csv(source, **read_kwargs).reset_index(drop=True)
+    df = apply_schema(df, SCHEMAS.get(name, {}), name)
+
+    os.makedirs(os.path.dirname(data_file), exist_ok=True)
+    # Write to temporary files first so an interrupted run never leaves a half-written cache
+    df.to_feather(data_file + '.tmp')
+    os.replace(data_file + '.tmp', data_file)
+    with open(meta_file + '.tmp', 'w') as f:
+        json.dump(fingerprint(source, SCHEMAS.get(name), **read_kwargs), f)
+    os.replace(meta_file + '.tmp', meta_file)
+    return df
+
+
+def read_table(path_to_data, name, columns=None, dtype=None, cache_dir=None, **read_kwargs):
+    '''
+    Read a dseb63 table, converting it to the columnar cache on first use.
+        Input:
+            path_to_data : str
+                Folder that contains the dseb63_*.csv files.
+            name : str
+                Table name without prefix and extension, e.g. 'bureau'.
+            columns : list
+                Columns to load, default: all columns.
+            dtype : dict
+                Dtype of some of the loaded columns, e.g. {'STATUS': 'category'}.
+            cache_dir : str
+                Folder of the cache, default: <path_to_data>/.cache
+            read_kwargs : dict
+                Keyword arguments passed to pandas.read_csv on conversion.
+        Output:
+            df : pandas.DataFrame
+    '''
+    source = table_path(path_to_data, name)
+    if feather is None:
+        df = pd.read_csv(source, usecols=columns, **read_kwargs)
+        df = apply_schema(df, SCHEMAS.get(name, {}), name)
+        return df.astype(dtype) if dtype else df
+
+    data_file, meta_file = _cache_files(path_to_data, name, cache_dir)
+    expected = fingerprint(source, SCHEMAS.get(name), **read_kwargs)
+    if not _is_fresh(meta_file, expected) or not os.path.exists(data_file):
+        df = convert_table(path_to_data, name, cache_dir, **read_kwargs)
+        if columns is not None:
+            df = df[list(columns)]
+    else:
+        df = feather.read_feather(data_file, columns=columns)
+    return df.astype(dtype) if dtype else df
+
+
+def save_features(df, path):
+    '''
+    Save the final feature matrix as a Feather file, keeping the dtypes of every column.
+        Input:
+            df : pandas.DataFrame
+                Feature matrix.
+            path : str
+                Output file, e.g. 'FeatEng.feather'.
+    '''
+    df.reset_index(drop=True).to_feather(path)
+
+
+def load_features(path, columns=None):
+    '''
+    Load a feature matrix saved by save_features (or an older FeatEng.csv).
+        Input:
+            path : str
+                Feather or csv file.
+            columns : list
+                Columns to load, e.g. the features kept by feature_selection,
+                default: all columns.
+        Output:
+            df : pandas.DataFrame
+    '''
+    if path.endswith('.csv'):
+        return pd.read_csv(path, usecols=columns)
+    return feather.read_feather(path, columns=columns)
@@ -0,0 +1,187 @@
+'''Memory-mapped float32 feature matrix for model training.
+
+The matrix is stored as a raw row-major float32 file with a json side-car
+holding its column names and shape. Rows are written once, in the order given
+by the caller, so a train/validation/test split is a pair of row slices, i.e.
+views of the file and not copies. Imputation, column selection and scaling
+then work in place, a block of rows (or columns) at a time, so the memory
+used does not grow with the size of the matrix.
+'''
+import json
+import os
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 50000
+
+
+def _side_car(path):
+    return path + '.json'
+
+
+def open_matrix(path, mode='r+'):
+    '''
+    Open a matrix written by write_matrix.
+        Input:
+            path : str
+                File of the matrix.
+            mode : str
+                numpy.memmap mode, 'r+' to modify the matrix in place, 'r' to read it.
+        Output:
+            X : numpy.memmap
+                Matrix of shape (rows, columns).
+            columns : list
+                Name of each column of X.
+    '''
+    with open(_side_car(path)) as f:
+        meta = json.load(f)
+    X = np.memmap(path, dtype=meta['dtype'], mode=mode, shape=tuple(meta['shape']))
+    return X, meta['columns']
+
+
+def _write_side_car(path, columns, shape):
+    with open(_side_car(path), 'w') as f:
+        json.dump({'columns': list(columns), 'shape': list(shape), 'dtype': 'float32'}, f)
+
+
+def write_matrix(df, columns, path, rows=None, chunk_rows=CHUNK_ROWS):
+    '''
+    Write some columns of a DataFrame to a memory-mapped float32 matrix.
+    Infinite values are stored as NaN (as utils.replace_infinite does).
+        Input:
+            df : pandas.DataFrame
+                Feature matrix.
+            columns : list
+                Columns to write.
+            path : str
+                Output file, its side-car is <path>.json
+            rows : numpy.ndarray
+                Positions of the rows of df to write, in the order of the output,
+                default: all rows in their order.
+            chunk_rows : int
+                Number of rows converted at a time.
+        Output:
+            X : numpy.memmap
+                Matrix of shape (len(rows), len(columns)).
+    '''
+    rows = np.arange(len(df)) if rows is None else np.asarray(rows)
+    shape = (len(rows), len(columns))
+    X = np.memmap(path, dtype=np.float32, mode='w+', shape=shape)
+    for start in range(0, shape[0], chunk_rows):
+        block = df.iloc[rows[start:start + chunk_rows]][columns].to_numpy(dtype=np.float32, na_value=np.nan)
+        block[np.isinf(block)] = np.nan
+        X[start:start + chunk_rows] = block
+    X.flush()
+    _write_side_car(path, columns, shape)
+    return X
+
+
+def select_columns(X, path, columns, keep, chunk_rows=CHUNK_ROWS):
+    '''
+    Keep only some columns of a matrix, compacting the file in place.
+        Input:
+            X : numpy.memmap
+                Matrix opened on `path`.
+            path : str
+                File of the matrix.
+            columns : list
+                Name of each column of X.
+            keep : numpy.ndarray
+                Boolean mask of the columns to keep.
+            chunk_rows : int
+                Number of rows moved at a time.
+        Output:
+            X : numpy.memmap
+                Matrix with the kept columns only.
+            columns : list
+                Name of each kept column.
+    '''
+    keep = np.asarray(keep, dtype=bool)
+    columns = [c for c, k in zip(columns, keep) if k]
+    if len(columns) == X.shape[1]:
+        return X, columns
+
+    n_rows, n_cols = X.shape[0], len(columns)
+    flat = X.reshape(-1)
+    # Row i moves to offset i * n_cols <= i * X.shape[1], so a block never overwrites
+    # rows that were not moved yet.
+    for start in range(0, n_rows, chunk_rows):
+        block = np.array(X[start:start + chunk_rows][:, keep])
+        flat[start * n_cols:start * n_cols + block.size] = block.reshape(-1)
+    X.flush()
+    del flat, X
+
+    with open(path, 'r+b') as f:
+        f.truncate(n_rows * n_cols * np.dtype(np.float32).itemsize)
+    _write_side_car(path, columns, (n_rows, n_cols))
+    return open_matrix(path)
+
+
+def impute_median(X, fit_rows, chunk_rows=CHUNK_ROWS):
+    '''
+    Replace NaN by the median of the column, in place.
+        Input:
+            X : numpy.memmap
+                Matrix to impute.
+            fit_rows : slice
+                Rows the medians are computed on, e.g. the training rows.
+            chunk_rows : int
+                The medians are computed on blocks of about chunk_rows * X.shape[1] values.
+        Output:
+            medians : numpy.ndarray
+                Median of each column, NaN for the columns without any value in fit_rows
+                (SimpleImputer drops these columns, see select_columns).
+    '''
+    fit = X[fit_rows]
+    n_block = max(1, chunk_rows * X.shape[1] // max(1, fit.shape[0]))
+    medians = np.empty(X.shape[1], dtype=np.float32)
+    for start in range(0, X.shape[1], n_block):
+        block = np.array(fit[:, start:start + n_block])
+        empty = np.isnan(block).all(axis=0)
+        medians[start:start + n_block] = np.nan
+        if not empty.all():
+            medians[start:start + n_block][~empty] = np.nanmedian(block[:, ~empty], axis=0)
+
+    for start in range(0, X.shape[0], chunk_rows):
+        block = X[start:start + chunk_rows]
+        rows, cols = np.where(np.isnan(block))
+        block[rows, cols] = medians[cols]
+    X.flush()
+    return medians
+
+
+def scale(X, scaler, fit_rows, chunk_rows=CHUNK_ROWS):
+    '''
+    Fit a scaler on some rows of a matrix and scale the whole matrix in place.
+        Input:
+            X : numpy.memmap
+                Matrix to scale.
+            scaler : sklearn.preprocessing.StandardScaler
+                Scaler fitted with partial_fit, one block of rows at a time.
+            fit_rows : slice
+                Rows the scaler is fitted on, e.g. the training rows.
+            chunk_rows : int
+                Number of rows processed at a time.
+        Output:
+            scaler : sklearn.preprocessing.StandardScaler
+                The fitted scaler.
+    '''
+    fit = X[fit_rows]
+    for start in range(0, fit.shape[0], chunk_rows):
+        scaler.partial_fit(fit[start:start + chunk_rows])
+    for start in range(0, X.shape[0], chunk_rows):
+        X[start:start + chunk_rows] = scaler.transform(X[start:start + chunk_rows], copy=False)
+    X.flush()
+    return scaler
+
+
+def matrix_frame(X, columns):
+    ''' Wrap a matrix in a DataFrame without copying it, e.g. for feature_selection. '''
+    return pd.DataFrame(X, columns=columns, copy=False)
+
+
+def remove_matrix(path):
+    ''' Delete a matrix and its side-car. '''
+    for f in (path, _side_car(path)):
+        if os.path.exists(f):
+            os.remove(f)
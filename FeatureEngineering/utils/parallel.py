@@ -1,30 +1,83 @@
+'''A pool of worker processes and arrays shared with them through shared memory.
+
+The arrays a job needs are copied once into a shared memory block, and the
+workers get only the name of the block and its layout: they map the arrays
+instead of receiving them pickled. The pool is created once and kept for the
+following calls. utils.profile counts the distinct values of columns this way.
+'''
+import atexit
 import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
 import pandas as pd
 
+NUM_WORKERS = 4
+
+_pool, _pool_workers = None, 0
+
+
+def get_pool(num_workers=0):
+    ''' Return the pool of worker processes, created on first use and kept between calls. '''
+    global _pool, _pool_workers
+    num_workers = num_workers if num_workers > 0 else NUM_WORKERS
+    if _pool is None or _pool_workers != num_workers:
+        close_pool()
+        _pool, _pool_workers = mp.Pool(num_workers), num_workers
+    return _pool
+
+
+def close_pool():
+    ''' Stop the workers of the pool. '''
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+    _pool, _pool_workers = None, 0
+
+
+atexit.register(close_pool)
+
+
+def share_arrays(columns):
+    '''
+    Copy arrays into one shared memory block, for the workers to map with
+    attach_arrays; the caller closes and unlinks the block once they are done.
+        Input:
+            columns : dict
+                1-d arrays by name.
+        Output:
+            block : multiprocessing.shared_memory.SharedMemory
+            layout : list
+                (column, dtype, offset, length, categories) of each array;
+                categorical and object columns are stored as codes.
+    '''
+    arrays, layout, offset = [], [], 0
+    for name, values in columns.items():
+        categories = None
+        if isinstance(values, pd.Categorical) or values.dtype.kind not in 'biufcmM':
+            values = pd.Categorical(values)
+            values, categories = values.codes, values.categories
+        values = np.ascontiguousarray(values)
+        layout.append((name, values.dtype.str, offset, len(values), categories))
+        arrays.append((offset, values))
+        offset += -(-values.nbytes // 8) * 8  # keep every array 8-byte aligned
+
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for start, values in arrays:
+        np.ndarray(values.shape, values.dtype, buffer=block.buf, offset=start)[:] = values
+    return block, layout
+
+
+_attached = {}
+
 
-def parallel_apply(groups, func, index_name='Index', num_workers=0, chunk_size=100000):
-    if num_workers <= 0:
-        num_workers = 4
-    indeces, features = [], []
-    for index_chunk, groups_chunk in chunk_groups(groups, chunk_size):
-        with mp.pool.Pool(num_workers) as executor:
-            features_chunk = executor.map(func, groups_chunk)
-        features.extend(features_chunk)
-        indeces.extend(index_chunk)
-
-    features = pd.DataFrame(features)
-    features.index = indeces
-    features.index.name = index_name
-    return features
-
-
-def chunk_groups(groupby_object, chunk_size):
-    n_groups = groupby_object.ngroups
-    group_chunk, index_chunk = [], []
-    for i, (index, df) in enumerate(groupby_object):
-        group_chunk.append(df)
-        index_chunk.append(index)
-        if (i + 1) % chunk_size == 0 or i + 1 == n_groups:
-            group_chunk_, index_chunk_ = group_chunk.copy(), index_chunk.copy()
-            group_chunk, index_chunk = [], []
-            yield index_chunk_, group_chunk_
+def attach_arrays(name, layout):
+    ''' Map the arrays of a shared block (see share_arrays) in a worker, once per block. '''
+    if name not in _attached:
+        for old in list(_attached):
+            _attached.pop(old)[0].close()
+        block = shared_memory.SharedMemory(name=name)
+        arrays = {column: np.ndarray((length,), dtype, buffer=block.buf, offset=offset)
+                  for column, dtype, offset, length, _ in layout}
+        _attached[name] = (block, arrays)
+    return _attached[name][1]
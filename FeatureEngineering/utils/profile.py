@@ -0,0 +1,120 @@
+'''Number of distinct values of every column of a table, counted up to a limit.
+
+pandas.Series.nunique builds the full set of values of a column, although
+find_features only asks whether there are more than 500 of them. Here the
+distinct values of a column are collected block of rows by block of rows
+(the blocks growing geometrically) and the count stops as soon as it passes
+max_unique: a continuous feature stops after its first rows, and a
+low-cardinality one keeps a small set. The counts are exact up to max_unique,
+so tests against a threshold <= max_unique are exact too.
+
+Columns are profiled in blocks, in a pool of processes when num_workers > 1
+(the columns are shared with the workers as in utils.parallel). The profile is
+a small DataFrame, cached by main.py with the other stage outputs, so the
+stages after the assembly (3 sigma, encoding, EDA) can reuse it.
+'''
+import numpy as np
+import pandas as pd
+from .parallel import attach_arrays, share_arrays, get_pool
+
+# Default limit of the counts of cardinality_profile
+PROFILE_MAX_UNIQUE = 1000
+
+_FIRST_BLOCK_ROWS = 4096
+
+
+def _column_values(series):
+    '''
+    Array with the distinct values of a column: its values, or the codes of a
+    categorical or object column (coded, missing values coded -1).
+    '''
+    values = series.values
+    if not isinstance(values, (np.ndarray, pd.Categorical)):
+        values = np.asarray(values)
+    if isinstance(values, pd.Categorical) or values.dtype.kind not in 'biufcmM':
+        return pd.Categorical(values).codes, True
+    return values, False
+
+
+def _missing(values, coded):
+    if coded:
+        return values < 0
+    if values.dtype.kind in 'mM':
+        return np.isnat(values)
+    if values.dtype.kind in 'fc':
+        return np.isnan(values)
+    return np.zeros(len(values), dtype=bool)
+
+
+def _count_distinct(values, max_unique, coded=False):
+    '''
+    Number of distinct non-missing values of an array, counted up to max_unique.
+        Output:
+            n_unique : int
+                Exact count, or a count > max_unique reached before the end of values.
+            exact : bool
+    '''
+    seen = values[:0]
+    start, size = 0, _FIRST_BLOCK_ROWS
+    while start < len(values):
+        block = values[start:start + size]
+        seen = pd.unique(np.concatenate([seen, pd.unique(block)]))
+        start, size = start + size, size * 2
+        n_unique = len(seen) - int(_missing(seen, coded).any())
+        if n_unique > max_unique and start < len(values):
+            return n_unique, False
+    return len(seen) - int(_missing(seen, coded).any()), True
+
+
+def _profile_columns(arrays, coded, max_unique):
+    return [(c, int(_missing(values, coded[c]).sum())) + _count_distinct(values, max_unique, coded[c])
+            for c, values in arrays.items()]
+
+
+def _profile_task(task):
+    name, layout, coded, max_unique = task
+    arrays = attach_arrays(name, layout)
+    return _profile_columns({c: arrays[c] for c in coded}, coded, max_unique)
+
+
+def cardinality_profile(df, columns=None, max_unique=PROFILE_MAX_UNIQUE, num_workers=1, block_columns=64):
+    '''
+    Count the distinct values of the columns of a table, up to max_unique.
+        Input:
+            df : pandas.DataFrame
+                Table.
+            columns : list
+                Columns to profile, default: all.
+            max_unique : int
+                Columns with more distinct values are only known to have more.
+            num_workers : int
+                Number of processes; 1: in this process.
+            block_columns : int
+                Number of columns profiled by a worker at a time.
+        Output:
+            profile : pandas.DataFrame
+                DTYPE, N_MISSING, N_UNIQUE (distinct non-missing values, as
+                Series.nunique) and EXACT (False: N_UNIQUE is only a lower
+                bound > max_unique) of each column (index).
+    '''
+    columns = list(df.columns) if columns is None else list(columns)
+    arrays, coded = {}, {}
+    for c in columns:
+        arrays[c], coded[c] = _column_values(df[c])
+    blocks = [{c: coded[c] for c in columns[i:i + block_columns]}
+              for i in range(0, len(columns), block_columns)]
+    if num_workers > 1 and len(blocks) > 1:
+        block, layout = share_arrays(arrays)
+        try:
+            tasks = [(block.name, layout, cols, max_unique) for cols in blocks]
+            results = get_pool(num_workers).map(_profile_task, tasks)
+        finally:
+            block.close()
+            block.unlink()
+    else:
+        results = [_profile_columns({c: arrays[c] for c in cols}, cols, max_unique) for cols in blocks]
+
+    profile = pd.DataFrame([row for result in results for row in result],
+                           columns=['COLUMN', 'N_MISSING', 'N_UNIQUE', 'EXACT']).set_index('COLUMN')
+    profile.insert(0, 'DTYPE', [str(df[c].dtype) for c in profile.index])
+    return profile
@@ -1,32 +1,138 @@
+'''Store the columns of a table in the narrowest dtypes that keep their values.
+
+Integer columns get the narrowest integer dtype holding their range. A float
+column is cast to float16 or float32 only when the largest relative error of
+its values in that dtype is within a tolerance (a value cast to an infinity
+has an infinite error), so an AMT_ column is not rounded to float16 only
+because it fits its range. The errors and ranges are
+computed for blocks of columns of one dtype at a time. Object columns with
+few distinct values become categoricals.
+'''
 import numpy as np
+import pandas as pd
+from .profile import cardinality_profile
 
+# Largest relative error allowed when casting a float column to a narrower float dtype
+REDUCE_MEMORY_TOLERANCE = 1e-6
+# Object columns with at most this many distinct values become categoricals
+CATEGORY_MAX_UNIQUE = 1000
 
-def reduce_mem_usage(dataframe, verbose=True):
-    m_start = dataframe.memory_usage().sum() / 1024 ** 2
-    for col in dataframe.columns:
-        col_type = dataframe[col].dtype
-        if col_type != object:
-            c_min = dataframe[col].min()
-            c_max = dataframe[col].max()
-            if str(col_type)[:3] == 'int':
-                if c_min > np.iinfo(np.int8).min and c_max < np.iinfo(np.int8).max:
-                    dataframe[col] = dataframe[col].astype(np.int8)
-                elif c_min > np.iinfo(np.int16).min and c_max < np.iinfo(np.int16).max:
-                    dataframe[col] = dataframe[col].astype(np.int16)
-                elif c_min > np.iinfo(np.int32).min and c_max < np.iinfo(np.int32).max:
-                    dataframe[col] = dataframe[col].astype(np.int32)
-                elif c_min > np.iinfo(np.int64).min and c_max < np.iinfo(np.int64).max:
-                    dataframe[col] = dataframe[col].astype(np.int64)
-            elif str(col_type)[:5] == 'float':
-                if c_min > np.finfo(np.float16).min and c_max < np.finfo(np.float16).max:
-                    dataframe[col] = dataframe[col].astype(np.float16)
-                elif c_min > np.finfo(np.float32).min and c_max < np.finfo(np.float32).max:
-                    dataframe[col] = dataframe[col].astype(np.float32)
-                else:
-                    dataframe[col] = dataframe[col].astype(np.float64)
-    if verbose:
-        m_end = dataframe.memory_usage().sum() / 1024 ** 2
-        print('Mem. usage decreased to {:5.2f} Mb ({:.1f}% reduction)'.format(
-            m_end, 100 * (m_start - m_end) / m_start))
+_NARROWER = {'i': [np.int8, np.int16, np.int32], 'u': [np.uint8, np.uint16, np.uint32],
+             'f': [np.float32, np.float16]}  # floats widest first, see downcast
+# Rows checked first, to rule out most columns before checking all their rows
+_SAMPLE_ROWS = 1000
+
+
+def _column_blocks(df, kind, block_columns):
+    ''' Columns of df of one dtype kind, by dtype, block_columns at a time. '''
+    by_dtype = {}
+    for col in df.columns:
+        if df[col].dtype.kind == kind and isinstance(df[col].dtype, np.dtype):
+            by_dtype.setdefault(df[col].dtype, []).append(col)
+    for dtype, cols in by_dtype.items():
+        for i in range(0, len(cols), block_columns):
+            yield dtype, cols[i:i + block_columns]
+
+
+def _relative_error(values, dtype):
+    ''' Largest relative error of each row of a 2-d float array cast to dtype (missing values skipped). '''
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        error = values.astype(dtype).astype(np.float64)
+        np.subtract(error, values, out=error)
+        np.abs(error, out=error)
+        np.divide(error, np.abs(values), out=error)
+    # 0 / 0 (zeros, and infinities kept) and missing values are nan, skipped by fmax
+    largest = np.fmax.reduce(error, axis=1) if error.shape[1] else np.zeros(len(error))
+    return np.nan_to_num(largest, nan=0., posinf=np.inf)
 
+
+def downcast(dataframe, tolerance=REDUCE_MEMORY_TOLERANCE, max_categories=CATEGORY_MAX_UNIQUE, block_columns=64):
+    '''
+    Narrow the dtype of every column of a table.
+        Input:
+            dataframe : pandas.DataFrame
+                Table, modified in place.
+            tolerance : float
+                Largest relative error allowed for a float column in a narrower float dtype.
+            max_categories : int
+                Object columns with at most this many distinct values (and fewer than
+                half the rows) become categoricals; None: keep object columns.
+            block_columns : int
+                Number of columns checked at a time.
+        Output:
+            dataframe : pandas.DataFrame
+            report : pandas.DataFrame
+                DTYPE_BEFORE, DTYPE_AFTER, BYTES_BEFORE, BYTES_AFTER and MAX_ERROR
+                (largest relative error of the values) of each changed column (index).
+    '''
+    new_dtypes, errors = {}, {}
+    for kind in 'iu':
+        for dtype, cols in _column_blocks(dataframe, kind, block_columns):
+            values = np.stack([dataframe[c].to_numpy() for c in cols])
+            low, high = values.min(axis=1, initial=0), values.max(axis=1, initial=0)
+            for narrow in _NARROWER[kind]:
+                if np.dtype(narrow).itemsize >= dtype.itemsize:
+                    break
+                fits = (low >= np.iinfo(narrow).min) & (high <= np.iinfo(narrow).max)
+                for col in np.asarray(cols)[fits]:
+                    new_dtypes.setdefault(col, np.dtype(narrow))
+    for dtype, cols in _column_blocks(dataframe, 'f', block_columns):
+        values = np.stack([dataframe[c].to_numpy(dtype=np.float64) for c in cols])
+        # float16 values are float32 values: a column can only fit float16 if it fits float32
+        candidates = np.arange(len(cols))
+        for narrow in _NARROWER['f']:
+            if np.dtype(narrow).itemsize >= dtype.itemsize:
+                continue
+            sample = _relative_error(values[candidates, :_SAMPLE_ROWS], narrow)
+            candidates = candidates[sample <= tolerance]
+            error = _relative_error(values[candidates], narrow)
+            candidates = candidates[error <= tolerance]
+            for i, e in zip(candidates, error[error <= tolerance]):
+                new_dtypes[cols[i]], errors[cols[i]] = np.dtype(narrow), e
+    if max_categories is not None:
+        objects = [c for c in dataframe.columns if dataframe[c].dtype == object]
+        profile = cardinality_profile(dataframe, objects, max_unique=max_categories)
+        few = profile['EXACT'] & (profile['N_UNIQUE'] < (len(dataframe) - profile['N_MISSING']) / 2)
+        for col in profile.index[few]:
+            new_dtypes[col] = 'category'
+
+    rows = []
+    for col, dtype in new_dtypes.items():
+        before = dataframe[col].memory_usage(index=False, deep=True)
+        old_dtype = dataframe[col].dtype
+        dataframe[col] = dataframe[col].astype(dtype)
+        rows.append((col, str(old_dtype), str(dataframe[col].dtype), before,
+                     dataframe[col].memory_usage(index=False, deep=True), errors.get(col, 0.)))
+    report = pd.DataFrame(rows, columns=['COLUMN', 'DTYPE_BEFORE', 'DTYPE_AFTER', 'BYTES_BEFORE',
+                                         'BYTES_AFTER', 'MAX_ERROR']).set_index('COLUMN')
+    return dataframe, report
+
+
+def reduce_mem_usage(dataframe, verbose=True, tolerance=REDUCE_MEMORY_TOLERANCE, max_categories=CATEGORY_MAX_UNIQUE,
+                     report=False):
+    '''
+    Reduce the memory used by a table with downcast.
+        Input:
+            dataframe : pandas.DataFrame
+                Table, modified in place.
+            verbose : bool
+                Print the memory saved, and the worst error of the float columns.
+            tolerance, max_categories :
+                See downcast.
+            report : bool
+                Also return the report of downcast.
+        Output:
+            dataframe : pandas.DataFrame
+            report : pandas.DataFrame
+                Only when report is True.
+    '''
+    m_start = dataframe.memory_usage(deep=True).sum() / 1024 ** 2
+    dataframe, changes = downcast(dataframe, tolerance, max_categories)
+    if verbose:
+        m_end = dataframe.memory_usage(deep=True).sum() / 1024 ** 2
+        print('Mem. usage decreased to {:5.2f} Mb ({:.1f}% reduction), {} columns narrowed, '
+              'largest relative error {:.2e}'.format(m_end, 100 * (m_start - m_end) / m_start, len(changes),
+                                                    changes['MAX_ERROR'].max() if len(changes) else 0.))
+    if report:
+        return dataframe, changes
     return dataframe
@@ -0,0 +1,89 @@
+'''Statistics of each row of a block of columns, computed together.
+
+DataFrame.min/max/mean/std/kurtosis(axis=1) each find the missing values,
+count them and go over the block again; np.nanmedian on a few columns works
+row by row on a masked array. Here the block is read once as an array in
+the dtype of its columns, the mask, counts and deviations from the mean are
+computed once, and every statistic is taken from them. The arrays keep the
+layout of the block: a pandas block is column-major, so sums add the columns
+one after another for all the rows at once, and with the arithmetic of
+pandas (float32 blocks give float32 statistics) the features do not change.
+'''
+import numpy as np
+
+ROW_STATISTICS = ('min', 'max', 'sum', 'mean', 'nanmedian', 'std', 'kurt')
+
+
+def row_stats(values, statistics=ROW_STATISTICS):
+    '''
+    Statistics of each row of a 2-d array, skipping missing values.
+        Input:
+            values : numpy.ndarray or pandas.DataFrame
+                Block of columns of one dtype, e.g. df[['EXT_SOURCE_1', 'EXT_SOURCE_2', 'EXT_SOURCE_3']].
+            statistics : list
+                Names among ROW_STATISTICS: min, max, sum, mean, std (ddof=1) and
+                kurt as the DataFrame methods with axis=1, nanmedian as np.nanmedian.
+        Output:
+            stats : dict
+                Array of each statistic, one value per row.
+    '''
+    values = np.asarray(values)
+    if not values.flags['C_CONTIGUOUS']:
+        values = np.asfortranarray(values)
+    unknown = [s for s in statistics if s not in ROW_STATISTICS]
+    if unknown:
+        raise ValueError(f'Unknown row statistics {unknown}, expected some of {ROW_STATISTICS}')
+    is_float = values.dtype.kind == 'f'
+    # Statistics of integer blocks are computed in float64, as by pandas
+    dtype = values.dtype if is_float else np.dtype(np.float64)
+    mask = np.isnan(values) if is_float else np.zeros(values.shape, dtype=bool)
+    count = (values.shape[1] - mask.sum(axis=1)).astype(dtype)
+    filled = values.astype(dtype)  # a copy in the layout of values, missing values set to 0
+    filled[mask] = 0
+
+    stats = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for name in statistics:
+            if name in ('min', 'max'):
+                stats[name] = (np.fmin if name == 'min' else np.fmax).reduce(values, axis=1)
+            elif name == 'sum':
+                stats[name] = filled.sum(axis=1) if is_float else values.sum(axis=1, dtype=np.int64)
+            elif name == 'mean':
+                stats[name] = filled.sum(axis=1, dtype=dtype) / count
+            elif name == 'nanmedian':
+                stats[name] = _nanmedian(values, count.astype(np.int64), dtype)
+
+        if 'std' in statistics or 'kurt' in statistics:
+            mean = filled.sum(axis=1, dtype=np.float64) / count
+            adjusted = np.empty_like(filled, dtype=np.float64)  # in the layout of filled
+            np.subtract(filled, mean[:, None], out=adjusted)
+            adjusted[mask] = 0
+            square = adjusted ** 2
+            m2 = square.sum(axis=1, dtype=np.float64)
+        if 'std' in statistics:
+            d = np.where(count > 1, count - 1, np.nan).astype(dtype)
+            stats['std'] = np.sqrt((m2 / d).astype(dtype))
+        if 'kurt' in statistics:
+            m4 = (square ** 2).sum(axis=1, dtype=np.float64)
+            adj = 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+            numerator = count * (count + 1) * (count - 1) * m4
+            denominator = (count - 2) * (count - 3) * m2 ** 2
+            # Values below 1e-14 are floating point errors, as in pandas
+            numerator[np.abs(numerator) < 1e-14] = 0
+            denominator[np.abs(denominator) < 1e-14] = 0
+            kurt = (numerator / denominator - adj).astype(dtype, copy=False)
+            kurt = np.where(denominator == 0, 0, kurt).astype(dtype, copy=False)
+            kurt[count < 4] = np.nan
+            stats['kurt'] = kurt
+    return {name: stats[name] for name in statistics}
+
+
+def _nanmedian(values, count, dtype):
+    ''' np.nanmedian(values, axis=1) in dtype, from the sorted rows (missing values sort last). '''
+    ordered = np.sort(values, axis=1)
+    rows = np.arange(len(values))
+    low = ordered[rows, np.maximum(count - 1, 0) // 2]
+    high = ordered[rows, count // 2 if values.shape[1] else 0]
+    median = np.where(low == high, low, (low + high) / 2).astype(dtype, copy=False)
+    median[count == 0] = np.nan
+    return median
@@ -0,0 +1,205 @@
+'''Run the feature builders as a graph of stages, several at a time.
+
+Each stage declares the builder function, the dseb63 tables it reads and the
+stages it needs the output of. Stages whose dependencies are done are
+started in separate processes, up to max_workers at a time and as long as
+the estimated memory of the running stages fits in the memory budget.
+With a utils.Checkpoints cache, a stage whose inputs and code did not change
+since its last run is loaded from the cache instead of being run, and given
+the SK_ID_CURR of new or changed clients, an incremental stage only computes
+the rows of these clients (see utils.incremental).
+'''
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from .incremental import upsert
+from .loader import table_path
+from .tables import TableRegistry
+
+# Memory used by a builder, relative to the size of the csv files it reads
+MEMORY_FACTOR = 2
+
+
+class Stage:
+    '''
+    One step of the feature engineering.
+        Input:
+            name : str
+                Name of the stage, key of its output in run_stages.
+            func : function
+                Module level builder, called as func(path_to_data, **kwargs).
+            inputs : list
+                dseb63 tables read by the builder, e.g. ['bureau', 'bureau_balance'].
+            after : list
+                Stages whose outputs are passed to func, as keyword arguments named after them.
+            kwargs : dict
+                Other keyword arguments of func.
+            memory : int
+                Estimated memory of the stage in bytes,
+                default: MEMORY_FACTOR times the size of its input csv files.
+            incremental : bool
+                The output has one row per SK_ID_CURR computed from the rows of that
+                client only, so it can be updated for some clients (see run_stages ids).
+    '''
+
+    def __init__(self, name, func, inputs=(), after=(), kwargs=None, memory=None, incremental=False):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.after = list(after)
+        self.kwargs = kwargs or {}
+        self.memory = memory
+        self.incremental = incremental
+
+    def estimate_memory(self, path_to_data):
+        if self.memory is None:
+            self.memory = MEMORY_FACTOR * sum(os.path.getsize(table_path(path_to_data, name))
+                                              for name in self.inputs
+                                              if os.path.exists(table_path(path_to_data, name)))
+        return self.memory
+
+
+def _run(func, path_to_data, kwargs):
+    start = time.time()
+    return func(path_to_data, **kwargs), time.time() - start
+
+
+def _cached(stage, path_to_data, checkpoints):
+    ''' Output of stage from the checkpoints, None when it has to be run (its key is stored either way). '''
+    if checkpoints is None:
+        return None
+    checkpoints.key(stage.name, [stage.func],
+                    files=[table_path(path_to_data, name) for name in stage.inputs],
+                    upstream=[checkpoints.keys[name] for name in stage.after],
+                    params=stage.kwargs)
+    output = checkpoints.load(checkpoints.keys[stage.name])
+    if output is not None:
+        print(f'Stage {stage.name} - loaded from checkpoint {checkpoints.keys[stage.name][:12]}')
+    return output
+
+
+def _base(stage, checkpoints, ids):
+    ''' Last full output of an incremental stage to update for ids, None when it has to be run in full. '''
+    if ids is None or checkpoints is None or not stage.incremental or stage.after:
+        return None
+    return checkpoints.latest(stage.name)
+
+
+def _done(stage, output, seconds, checkpoints, base, ids):
+    if base is not None:
+        output = upsert(base, output, ids)
+        print(f'Stage {stage.name} - {len(ids)} clients updated in {seconds:.0f}s')
+    else:
+        print(f'Stage {stage.name} - done in {seconds:.0f}s')
+    if checkpoints is not None:
+        checkpoints.save(checkpoints.keys[stage.name], output, stage.name)
+    return output
+
+
+def run_stages(stages, path_to_data, tables=None, max_workers=1, memory_budget=None, checkpoints=None,
+               ids=None):
+    '''
+    Run stages in the order of their dependencies.
+        Input:
+            stages : list
+                Stage objects.
+            path_to_data : str
+                Folder that contains the dseb63_*.csv files.
+            tables : utils.TableRegistry
+                Registry shared by the stages when they run one after another
+                (max_workers=1); a shared table is released once no remaining stage reads it.
+                Each process of a parallel run reads its own tables.
+            max_workers : int
+                Number of stages running at the same time.
+            memory_budget : int
+                Bytes the running stages may use together, default: no limit.
+                A stage is always started when no other stage is running.
+            checkpoints : utils.Checkpoints
+                Cache of the stage outputs, default: every stage is run.
+            ids : iterable
+                SK_ID_CURR of the new or changed clients (incremental mode). An
+                incremental stage that is not cached is run on the rows of these
+                clients only and its rows are replaced in its last full output;
+                the other stages, or all of them without checkpoints, run in full.
+        Output:
+            outputs : dict
+                Output of each stage by name.
+    '''
+    names = [stage.name for stage in stages]
+    for stage in stages:
+        missing = [name for name in stage.after if name not in names]
+        if missing:
+            raise ValueError(f'Stage {stage.name} runs after unknown stages {missing}')
+
+    outputs, pending = {}, list(stages)
+
+    def ready(stage):
+        return all(name in outputs for name in stage.after)
+
+    def arguments(stage):
+        return {**stage.kwargs, **{name: outputs[name] for name in stage.after}}
+
+    ids = None if ids is None else sorted(set(ids))
+    bases = {}
+
+    if max_workers <= 1:
+        # Tables of the clients ids only, shared by the incremental stages
+        subset = None if ids is None else TableRegistry(path_to_data, ids=ids)
+        while pending:
+            stage = next((s for s in pending if ready(s)), None)
+            if stage is None:
+                raise ValueError(f'Stages {[s.name for s in pending]} depend on each other')
+            pending.remove(stage)
+            outputs[stage.name] = _cached(stage, path_to_data, checkpoints)
+            if outputs[stage.name] is None:
+                kwargs = arguments(stage)
+                base = _base(stage, checkpoints, ids)
+                if base is not None:
+                    kwargs['tables'] = subset
+                elif tables is not None:
+                    kwargs['tables'] = tables
+                output, seconds = _run(stage.func, path_to_data, kwargs)
+                outputs[stage.name] = _done(stage, output, seconds, checkpoints, base, ids)
+            if tables is not None:
+                for name in stage.inputs:
+                    if not any(name in s.inputs for s in pending):
+                        tables.release(name)
+        return outputs
+
+    # Fork where possible: main.py has no __main__ guard, a spawned process would run it again
+    context = mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else None)
+    running = {}
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        while pending or running:
+            used = sum(stage.estimate_memory(path_to_data) for stage in running.values())
+            for stage in [s for s in pending if ready(s)]:
+                if len(running) >= max_workers:
+                    break
+                if running and memory_budget is not None and \
+                        used + stage.estimate_memory(path_to_data) > memory_budget:
+                    continue
+                pending.remove(stage)
+                output = _cached(stage, path_to_data, checkpoints)
+                if output is not None:
+                    outputs[stage.name] = output
+                    continue
+                kwargs = arguments(stage)
+                bases[stage.name] = _base(stage, checkpoints, ids)
+                if bases[stage.name] is not None:
+                    kwargs['tables'] = TableRegistry(path_to_data, ids=ids)
+                running[executor.submit(_run, stage.func, path_to_data, kwargs)] = stage
+                used += stage.estimate_memory(path_to_data)
+
+            if not running:
+                if any(ready(s) for s in pending):
+                    continue  # stages made ready by outputs loaded from the checkpoints
+                if not pending:
+                    break
+                raise ValueError(f'Stages {[s.name for s in pending]} depend on each other')
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                output, seconds = future.result()
+                outputs[stage.name] = _done(stage, output, seconds, checkpoints, bases.pop(stage.name), ids)
+    return outputs
@@ -0,0 +1,291 @@
+'''Compact dtypes of the dseb63 tables, applied when a table is read.
+
+IDs are int32, amounts and ratios float32, day and month counts int16
+(int32 or float32 when their range or missing values need it), flags int8
+and string columns pandas categoricals. Columns not listed keep the dtype
+pandas infers from the csv.
+
+Schemas:
+    APPLICATION_SCHEMA: dseb63_application_train.csv and dseb63_application_test.csv.
+    BUREAU_SCHEMA: dseb63_bureau.csv.
+    BUREAU_BALANCE_SCHEMA: dseb63_bureau_balance.csv.
+    PREVIOUS_SCHEMA: dseb63_previous_application.csv.
+    POS_CASH_SCHEMA: dseb63_POS_CASH_balance.csv.
+    INSTALLMENTS_SCHEMA: dseb63_installments_payments.csv.
+    CREDIT_CARD_SCHEMA: dseb63_credit_card_balance.csv.
+    SCHEMAS: schema of each table by table name.
+'''
+import numpy as np
+
+_BUILDING_COLUMNS = [
+    f'{column}_{stat}'
+    for column in ['APARTMENTS', 'BASEMENTAREA', 'YEARS_BEGINEXPLUATATION', 'YEARS_BUILD',
+                   'COMMONAREA', 'ELEVATORS', 'ENTRANCES', 'FLOORSMAX', 'FLOORSMIN',
+                   'LANDAREA', 'LIVINGAPARTMENTS', 'LIVINGAREA', 'NONLIVINGAPARTMENTS',
+                   'NONLIVINGAREA']
+    for stat in ['AVG', 'MODE', 'MEDI']]
+
+APPLICATION_SCHEMA = {
+    'SK_ID_CURR': 'int32',
+    'TARGET': 'int8',
+
+    'NAME_CONTRACT_TYPE': 'category',
+    'CODE_GENDER': 'category',
+    'FLAG_OWN_CAR': 'category',
+    'FLAG_OWN_REALTY': 'category',
+    'NAME_TYPE_SUITE': 'category',
+    'NAME_INCOME_TYPE': 'category',
+    'NAME_EDUCATION_TYPE': 'category',
+    'NAME_FAMILY_STATUS': 'category',
+    'NAME_HOUSING_TYPE': 'category',
+    'OCCUPATION_TYPE': 'category',
+    'WEEKDAY_APPR_PROCESS_START': 'category',
+    'ORGANIZATION_TYPE': 'category',
+    'FONDKAPREMONT_MODE': 'category',
+    'HOUSETYPE_MODE': 'category',
+    'WALLSMATERIAL_MODE': 'category',
+    'EMERGENCYSTATE_MODE': 'category',
+
+    'AMT_INCOME_TOTAL': 'float32',
+    'AMT_CREDIT': 'float32',
+    'AMT_ANNUITY': 'float32',
+    'AMT_GOODS_PRICE': 'float32',
+
+    'CNT_CHILDREN': 'int8',
+    'CNT_FAM_MEMBERS': 'float32',
+
+    'DAYS_BIRTH': 'int16',
+    'DAYS_EMPLOYED': 'int32',  # 365243 for unemployed
+    'DAYS_REGISTRATION': 'float32',
+    'DAYS_ID_PUBLISH': 'int16',
+    'DAYS_LAST_PHONE_CHANGE': 'float32',
+    'OWN_CAR_AGE': 'float32',
+
+    'EXT_SOURCE_1': 'float32',
+    'EXT_SOURCE_2': 'float32',
+    'EXT_SOURCE_3': 'float32',
+
+    'FLAG_MOBIL': 'int8',
+    'FLAG_EMP_PHONE': 'int8',
+    'FLAG_WORK_PHONE': 'int8',
+    'FLAG_CONT_MOBILE': 'int8',
+    'FLAG_PHONE': 'int8',
+    'FLAG_EMAIL': 'int8',
+    **{f'FLAG_DOCUMENT_{i}': 'int8' for i in range(2, 22)},
+
+    'HOUR_APPR_PROCESS_START': 'int8',
+    'REGION_POPULATION_RELATIVE': 'float32',
+    'REGION_RATING_CLIENT': 'int8',
+    'REGION_RATING_CLIENT_W_CITY': 'int8',
+    'REG_REGION_NOT_LIVE_REGION': 'int8',
+    'REG_REGION_NOT_WORK_REGION': 'int8',
+    'LIVE_REGION_NOT_WORK_REGION': 'int8',
+    'REG_CITY_NOT_LIVE_CITY': 'int8',
+    'REG_CITY_NOT_WORK_CITY': 'int8',
+    'LIVE_CITY_NOT_WORK_CITY': 'int8',
+
+    **{column: 'float32' for column in _BUILDING_COLUMNS},
+    'TOTALAREA_MODE': 'float32',
+
+    'OBS_30_CNT_SOCIAL_CIRCLE': 'float32',
+    'DEF_30_CNT_SOCIAL_CIRCLE': 'float32',
+    'OBS_60_CNT_SOCIAL_CIRCLE': 'float32',
+    'DEF_60_CNT_SOCIAL_CIRCLE': 'float32',
+
+    'AMT_REQ_CREDIT_BUREAU_HOUR': 'float32',
+    'AMT_REQ_CREDIT_BUREAU_DAY': 'float32',
+    'AMT_REQ_CREDIT_BUREAU_WEEK': 'float32',
+    'AMT_REQ_CREDIT_BUREAU_MON': 'float32',
+    'AMT_REQ_CREDIT_BUREAU_QRT': 'float32',
+    'AMT_REQ_CREDIT_BUREAU_YEAR': 'float32',
+}
+
+BUREAU_SCHEMA = {
+    'SK_ID_CURR': 'int32',
+    'SK_ID_BUREAU': 'int32',
+
+    'CREDIT_ACTIVE': 'category',
+    'CREDIT_CURRENCY': 'category',
+    'CREDIT_TYPE': 'category',
+
+    'AMT_ANNUITY': 'float32',
+    'AMT_CREDIT_MAX_OVERDUE': 'float32',
+    'AMT_CREDIT_SUM': 'float32',
+    'AMT_CREDIT_SUM_DEBT': 'float32',
+    'AMT_CREDIT_SUM_LIMIT': 'float32',
+    'AMT_CREDIT_SUM_OVERDUE': 'float32',
+
+    'CNT_CREDIT_PROLONG': 'int8',
+    'CREDIT_DAY_OVERDUE': 'int16',
+
+    'DAYS_CREDIT': 'int16',
+    'DAYS_CREDIT_ENDDATE': 'float32',
+    'DAYS_CREDIT_UPDATE': 'int32',  # goes back further than the int16 range
+    'DAYS_ENDDATE_FACT': 'float32',
+}
+
+BUREAU_BALANCE_SCHEMA = {
+    'SK_ID_BUREAU': 'int32',
+    'MONTHS_BALANCE': 'int16',
+    'STATUS': 'category',
+}
+
+PREVIOUS_SCHEMA = {
+    'SK_ID_PREV': 'int32',
+    'SK_ID_CURR': 'int32',
+
+    'NAME_CONTRACT_TYPE': 'category',
+    'WEEKDAY_APPR_PROCESS_START': 'category',
+    'FLAG_LAST_APPL_PER_CONTRACT': 'category',
+    'NAME_CASH_LOAN_PURPOSE': 'category',
+    'NAME_CONTRACT_STATUS': 'category',
+    'NAME_PAYMENT_TYPE': 'category',
+    'CODE_REJECT_REASON': 'category',
+    'NAME_TYPE_SUITE': 'category',
+    'NAME_CLIENT_TYPE': 'category',
+    'NAME_GOODS_CATEGORY': 'category',
+    'NAME_PORTFOLIO': 'category',
+    'NAME_PRODUCT_TYPE': 'category',
+    'CHANNEL_TYPE': 'category',
+    'NAME_SELLER_INDUSTRY': 'category',
+    'NAME_YIELD_GROUP': 'category',
+    'PRODUCT_COMBINATION': 'category',
+
+    'AMT_ANNUITY': 'float32',
+    'AMT_APPLICATION': 'float32',
+    'AMT_CREDIT': 'float32',
+    'AMT_DOWN_PAYMENT': 'float32',
+    'AMT_GOODS_PRICE': 'float32',
+
+    'RATE_DOWN_PAYMENT': 'float32',
+    'RATE_INTEREST_PRIMARY': 'float32',
+    'RATE_INTEREST_PRIVILEGED': 'float32',
+
+    'CNT_PAYMENT': 'float32',
+    'HOUR_APPR_PROCESS_START': 'int8',
+    'NFLAG_LAST_APPL_IN_DAY': 'int8',
+    'NFLAG_INSURED_ON_APPROVAL': 'float32',
+    'SELLERPLACE_AREA': 'int32',
+
+    'DAYS_DECISION': 'int16',
+    # the other DAYS_ columns hold 365243 and missing values
+    'DAYS_FIRST_DRAWING': 'float32',
+    'DAYS_FIRST_DUE': 'float32',
+    'DAYS_LAST_DUE_1ST_VERSION': 'float32',
+    'DAYS_LAST_DUE': 'float32',
+    'DAYS_TERMINATION': 'float32',
+}
+
+POS_CASH_SCHEMA = {
+    'SK_ID_PREV': 'int32',
+    'SK_ID_CURR': 'int32',
+
+    'MONTHS_BALANCE': 'int16',
+    'CNT_INSTALMENT': 'float32',
+    'CNT_INSTALMENT_FUTURE': 'float32',
+    'NAME_CONTRACT_STATUS': 'category',
+    'SK_DPD': 'int16',
+    'SK_DPD_DEF': 'int16',
+}
+
+INSTALLMENTS_SCHEMA = {
+    'SK_ID_PREV': 'int32',
+    'SK_ID_CURR': 'int32',
+
+    'NUM_INSTALMENT_VERSION': 'float32',
+    'NUM_INSTALMENT_NUMBER': 'int16',
+    'DAYS_INSTALMENT': 'int16',
+    'DAYS_ENTRY_PAYMENT': 'float32',
+    'AMT_INSTALMENT': 'float32',
+    'AMT_PAYMENT': 'float32',
+}
+
+CREDIT_CARD_SCHEMA = {
+    'SK_ID_PREV': 'int32',
+    'SK_ID_CURR': 'int32',
+
+    'MONTHS_BALANCE': 'int16',
+
+    'AMT_BALANCE': 'float32',
+    'AMT_CREDIT_LIMIT_ACTUAL': 'float32',
+    'AMT_DRAWINGS_ATM_CURRENT': 'float32',
+    'AMT_DRAWINGS_CURRENT': 'float32',
+    'AMT_DRAWINGS_OTHER_CURRENT': 'float32',
+    'AMT_DRAWINGS_POS_CURRENT': 'float32',
+    'AMT_INST_MIN_REGULARITY': 'float32',
+    'AMT_PAYMENT_CURRENT': 'float32',
+    'AMT_PAYMENT_TOTAL_CURRENT': 'float32',
+    'AMT_RECEIVABLE_PRINCIPAL': 'float32',
+    'AMT_RECIVABLE': 'float32',
+    'AMT_TOTAL_RECEIVABLE': 'float32',
+
+    'CNT_DRAWINGS_ATM_CURRENT': 'float32',
+    'CNT_DRAWINGS_CURRENT': 'int16',
+    'CNT_DRAWINGS_OTHER_CURRENT': 'float32',
+    'CNT_DRAWINGS_POS_CURRENT': 'float32',
+    'CNT_INSTALMENT_MATURE_CUM': 'float32',
+
+    'NAME_CONTRACT_STATUS': 'category',
+    'SK_DPD': 'int16',
+    'SK_DPD_DEF': 'int16',
+}
+
+SCHEMAS = {
+    'application_train': APPLICATION_SCHEMA,
+    'application_test': APPLICATION_SCHEMA,
+    'bureau': BUREAU_SCHEMA,
+    'bureau_balance': BUREAU_BALANCE_SCHEMA,
+    'previous_application': PREVIOUS_SCHEMA,
+    'POS_CASH_balance': POS_CASH_SCHEMA,
+    'installments_payments': INSTALLMENTS_SCHEMA,
+    'credit_card_balance': CREDIT_CARD_SCHEMA,
+}
+
+
+def _check_column(values, dtype):
+    ''' Return why `values` cannot be stored as `dtype` without loss, or None. '''
+    if dtype.kind in 'iu':
+        if values.isna().any():
+            return 'has missing values'
+        if values.dtype.kind == 'f' and (values % 1 != 0).any():
+            return 'has non-integer values'
+        info = np.iinfo(dtype)
+        if values.min() < info.min or values.max() > info.max:
+            return f'range [{values.min()}, {values.max()}] does not fit'
+    elif dtype.kind == 'f' and values.dtype.kind in 'iuf':
+        if (values.abs() > np.finfo(dtype).max).any():
+            return 'has values out of range'
+    return None
+
+
+def apply_schema(df, schema, name='table'):
+    '''
+    Cast the columns of a table to the dtypes of its schema, checking the data fits them.
+        Input:
+            df : pandas.DataFrame
+                Table read from csv.
+            schema : dict
+                Column name -> dtype, e.g. SCHEMAS['bureau'].
+            name : str
+                Table name used in the error message.
+        Output:
+            df : pandas.DataFrame
+                Table with the declared dtypes.
+    '''
+    errors = []
+    for col, dtype in schema.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype == 'category':
+            df[col] = df[col].astype('category')
+            continue
+        dtype = np.dtype(dtype)
+        error = _check_column(df[col], dtype)
+        if error:
+            errors.append(f'{col} ({df[col].dtype} -> {dtype}): {error}')
+        else:
+            df[col] = df[col].astype(dtype)
+    if errors:
+        raise ValueError(f'Data of {name} does not match its schema:\n    ' +
+                         '\n    '.join(errors))
+    return df
@@ -0,0 +1,196 @@
+'''Streaming aggregation of the large balance tables.
+
+In streaming mode a table is never loaded as a whole. It is read in chunks of
+rows, and either
+
+    - aggregated with partial-aggregate states (sum, count, min, max, sumsq,
+      last and size of each column per key), which are merged once all the
+      chunks are read and turned into the final statistics
+      (stream_group), or
+    - split by key into partitions on disk that hold complete groups, so a
+      builder can run its usual in-memory code on one partition at a time
+      (partition_chunks). This is used for the features that cannot be
+      merged from states, e.g. exponential moving averages or the last loan.
+
+Only the aggregations of STREAM_AGGREGATIONS can be computed from states.
+'''
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 1000000
+
+# Aggregation -> partial states it is computed from
+STREAM_AGGREGATIONS = {
+    'sum': ['sum'],
+    'mean': ['sum', 'count'],
+    'count': ['count'],
+    'size': ['size'],
+    'min': ['min'],
+    'max': ['max'],
+    'var': ['sum', 'count', 'sumsq'],
+    'std': ['sum', 'count', 'sumsq'],
+    'last': ['last'],
+}
+
+# How the states of two chunks are merged
+_MERGE = {'sum': 'sum', 'count': 'sum', 'sumsq': 'sum', 'size': 'sum',
+          'min': 'min', 'max': 'max', 'last': 'last'}
+
+
+def _states(aggregations):
+    states = {}
+    for column, aggs in aggregations.items():
+        for agg in aggs:
+            if agg not in STREAM_AGGREGATIONS:
+                raise ValueError(f'Aggregation {agg} of {column} can not be computed from partial states, '
+                                 f'use one of {list(STREAM_AGGREGATIONS)}')
+            for state in STREAM_AGGREGATIONS[agg]:
+                if state not in states.setdefault(column, []):
+                    states[column].append(state)
+    return states
+
+
+def partial_states(df, aggregate_by, aggregations):
+    '''
+    Partial-aggregate states of one chunk.
+        Input:
+            df : pandas.DataFrame
+                Chunk of a table.
+            aggregate_by : str
+                Key column, e.g. 'SK_ID_BUREAU'.
+            aggregations : dict
+                Aggregations, as for utils.group.
+        Output:
+            states : pandas.DataFrame
+                One row per key, one (column, state) column per state.
+    '''
+    gp = df.groupby(aggregate_by)
+    states = {}
+    for column, names in _states(aggregations).items():
+        # Sums are accumulated in float64, min, max and last keep the dtype of the column
+        values = df[column].astype(np.float64)
+        for state in names:
+            if state == 'sumsq':
+                states[(column, state)] = (values ** 2).groupby(df[aggregate_by]).sum()
+            elif state == 'size':
+                states[(column, state)] = gp.size()
+            elif state in ('sum', 'count'):
+                states[(column, state)] = values.groupby(df[aggregate_by]).agg(state)
+            else:
+                states[(column, state)] = gp[column].agg(state)
+    return pd.DataFrame(states)
+
+
+def merge_states(*states):
+    '''
+    Merge the partial states of several chunks, given in the order of the rows,
+    with one groupby over the states of all the chunks.
+        Input:
+            states : pandas.DataFrame
+                Outputs of partial_states.
+        Output:
+            states : pandas.DataFrame
+                States of all the chunks together.
+    '''
+    states = pd.concat(states)
+    return states.groupby(level=0).agg({column: _MERGE[column[1]] for column in states.columns})
+
+
+def finalize_states(states, prefix, aggregations):
+    '''
+    Turn merged states into the statistics of utils.group.
+        Input:
+            states : pandas.DataFrame
+                Output of merge_states.
+            prefix : str
+                Prefix of the new column names.
+            aggregations : dict
+                Aggregations, as for utils.group.
+        Output:
+            agg_df : pandas.DataFrame
+                Same columns as utils.group(df, prefix, aggregations).
+    '''
+    features = {}
+    for column, aggs in aggregations.items():
+        s = {state: states[(column, state)] for state in _states({column: aggs})[column]}
+        for agg in aggs:
+            name = '{}{}_{}'.format(prefix, column, agg.upper())
+            if agg in ('mean', 'var', 'std'):
+                mean = s['sum'] / s['count'].where(s['count'] > 0)
+            if agg == 'mean':
+                features[name] = mean
+            elif agg in ('var', 'std'):
+                var = (s['sumsq'] - s['count'] * mean ** 2) / (s['count'] - 1).where(s['count'] > 1)
+                var = var.clip(lower=0)
+                features[name] = np.sqrt(var) if agg == 'std' else var
+            elif agg in ('count', 'size'):
+                features[name] = s[agg].astype(np.int64)
+            else:
+                features[name] = s[agg]
+    agg_df = pd.DataFrame(features)
+    agg_df.index.name = states.index.name
+    return agg_df.reset_index()
+
+
+def stream_group(chunks, prefix, aggregations, aggregate_by='SK_ID_CURR'):
+    '''
+    utils.group computed chunk by chunk with partial-aggregate states.
+        Input:
+            chunks : iterable
+                Chunks (pandas.DataFrame) of the table, in the order of its rows.
+            prefix : str
+                Prefix of the new column names.
+            aggregations : dict
+                Aggregations, only those of STREAM_AGGREGATIONS.
+            aggregate_by : str
+                Key column.
+        Output:
+            agg_df : pandas.DataFrame
+    '''
+    # The states of a chunk are much smaller than the chunk; they are merged once at the end
+    states = merge_states(*(partial_states(chunk, aggregate_by, aggregations) for chunk in chunks))
+    states.index.name = aggregate_by
+    return finalize_states(states, prefix, aggregations)
+
+
+def partition_chunks(chunks, key, n_partitions, tmp_dir=None):
+    '''
+    Split a table given in chunks into partitions holding complete groups of `key`.
+    The chunks are written to disk, grouped by key % n_partitions, and the
+    partitions are read back one at a time, keeping the order of the rows.
+        Input:
+            chunks : iterable
+                Chunks (pandas.DataFrame) of the table.
+            key : str
+                Integer key column, e.g. 'SK_ID_CURR'.
+            n_partitions : int
+                Number of partitions.
+            tmp_dir : str
+                Folder of the temporary files, default: the system temporary folder.
+        Output:
+            partitions : generator of pandas.DataFrame
+    '''
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as folder:
+        files = [[] for _ in range(n_partitions)]
+        for i, chunk in enumerate(chunks):
+            part = chunk[key].to_numpy() % n_partitions
+            for p in np.unique(part):
+                file = os.path.join(folder, f'{p}_{i}.pkl')
+                chunk[part == p].to_pickle(file)
+                files[p].append(file)
+            del chunk, part
+
+        for part_files in files:
+            if not part_files:
+                continue
+            df = pd.concat([pd.read_pickle(f) for f in part_files], ignore_index=True)
+            for f in part_files:
+                os.remove(f)
+            yield df
+
+
+def concat_partitions(results, key='SK_ID_CURR'):
+    ''' Concatenate the outputs of a builder on each partition, sorted by key as groupby does. '''
+    return pd.concat(results, ignore_index=True).sort_values(key, kind='stable').reset_index(drop=True)
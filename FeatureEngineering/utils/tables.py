@@ -0,0 +1,225 @@
+'''Shared access to the dseb63 tables during one feature engineering run.'''
+import math
+import numpy as np
+import pandas as pd
+from .constants import INSTALLMENTS_DAYS_DERIVED
+from .derived import add_derived
+from .keys import KeyDictionary
+from .loader import read_table, table_columns, table_path
+from .schema import SCHEMAS, apply_schema
+from .streaming import CHUNK_ROWS, partition_chunks
+
+
+def installments_days(pay):
+    '''
+    Add the payment delay columns shared by installment() and previous_application().
+        Input:
+            pay : pandas.DataFrame
+                dseb63_installments_payments table.
+        Output:
+            pay : pandas.DataFrame
+                Table with DPD (days past due), DBD (days before due)
+                and LATE_PAYMENT (paid before due date) columns.
+    '''
+    return add_derived(pay, INSTALLMENTS_DAYS_DERIVED)
+
+
+# Tables listing the ids of each key column, see TableRegistry.key_dictionary
+KEY_TABLES = {
+    'SK_ID_CURR': ['application_train', 'application_test'],
+    'SK_ID_PREV': ['previous_application'],
+    'SK_ID_BUREAU': ['bureau'],
+}
+
+# Columns computed once when a table is loaded: table name -> (function, raw columns it needs)
+DERIVED_COLUMNS = {
+    'installments_payments': (installments_days, ['DAYS_ENTRY_PAYMENT', 'DAYS_INSTALMENT']),
+}
+
+
+class TableRegistry:
+    '''
+    Load each dseb63 table once per run and hand it to every builder that needs it.
+
+    Tables listed in `shared` stay in memory after the first load until they are
+    released; the others are read on every request and not kept. When a builder
+    asks a shared table for columns that were not loaded yet, only those columns
+    are read and added to the shared frame. Builders must treat the returned
+    frames as read-only (assign new columns on a copy or on the result of a
+    merge), since the same object is given to every builder.
+        Input:
+            path_to_data : str
+                Folder that contains the dseb63_*.csv files.
+            shared : iterable
+                Names of the tables to keep in memory between builders.
+            cache_dir : str
+                Folder of the columnar cache, see utils.loader.read_table.
+            ids : iterable
+                SK_ID_CURR to keep (incremental mode, see utils.incremental):
+                tables are returned with only the rows of these clients, in their
+                order in the table, and keep the categories of the whole table.
+                Default: all rows.
+    '''
+
+    def __init__(self, path_to_data, shared=('installments_payments',), cache_dir=None, ids=None):
+        self.path_to_data = path_to_data
+        self.shared = set(shared)
+        self.cache_dir = cache_dir
+        self.ids = None if ids is None else np.unique(np.asarray(list(ids)))
+        self._tables = {}
+        self._rows = {}
+        self._key_dictionary = None
+
+    def _filter(self, name, df, key=None):
+        ''' Keep the rows of self.ids, reading the SK_ID_CURR of the table if df does not have it. '''
+        if self.ids is None:
+            return df, None
+        if key is None:
+            if 'SK_ID_CURR' not in self.columns(name):
+                raise ValueError(f'Table {name} has no SK_ID_CURR column to select the clients of')
+            key = df['SK_ID_CURR'] if 'SK_ID_CURR' in df.columns else \
+                read_table(self.path_to_data, name, columns=['SK_ID_CURR'], cache_dir=self.cache_dir)['SK_ID_CURR']
+        rows = np.isin(np.asarray(key), self.ids)
+        return df[rows].reset_index(drop=True), rows
+
+    def columns(self, name, **read_kwargs):
+        ''' Return the raw column names of the table `name`. '''
+        return table_columns(self.path_to_data, name, **read_kwargs)
+
+    def get(self, name, columns=None, **read_kwargs):
+        '''
+        Return the table `name` with its derived columns.
+            Input:
+                name : str
+                    Table name, e.g. 'bureau'.
+                columns : list
+                    Raw columns to load (see utils.loader.input_columns), default: all.
+            Output:
+                df : pandas.DataFrame
+                    Table with the dtypes of utils.schema.
+        '''
+        derive, derive_inputs = DERIVED_COLUMNS.get(name, (None, []))
+        if columns is not None:
+            columns = list(columns) + [c for c in derive_inputs if c not in columns]
+
+        if name in self._tables:
+            df = self._tables[name]
+            missing = [c for c in columns or [] if c not in df.columns]
+            if missing:
+                extra = read_table(self.path_to_data, name, columns=missing,
+                                   cache_dir=self.cache_dir, **read_kwargs)
+                rows = self._rows.get(name)
+                for c in missing:
+                    df[c] = extra[c].values if rows is None else extra[c].values[rows]
+            return df
+
+        df = read_table(self.path_to_data, name, columns=columns,
+                        cache_dir=self.cache_dir, **read_kwargs)
+        df, rows = self._filter(name, df)
+        if derive is not None:
+            df = derive(df)
+        if name in self.shared:
+            self._tables[name] = df
+            self._rows[name] = rows
+        return df
+
+    def categories(self, name, categorical, key=None, chunk_rows=CHUNK_ROWS):
+        '''
+        Read the categorical columns of a table, one chunk at a time, to get all their values.
+            Input:
+                name : str
+                    Table name.
+                categorical : list
+                    Categorical columns.
+                key : str
+                    Key column to count the rows of, e.g. 'SK_ID_CURR'.
+                chunk_rows : int
+                    Number of rows read at a time.
+            Output:
+                categories : dict
+                    Sorted values of each categorical column (as pandas.get_dummies orders them).
+                n_rows : int
+                    Number of rows of the table.
+        '''
+        values = {c: set() for c in categorical}
+        n_rows = 0
+        usecols = list(categorical) + ([key] if key else [])
+        for chunk in pd.read_csv(table_path(self.path_to_data, name), usecols=usecols,
+                                 dtype={c: str for c in categorical}, chunksize=chunk_rows):
+            n_rows += len(chunk)
+            for c in categorical:
+                values[c].update(chunk[c].dropna().unique())
+        return {c: sorted(v) for c, v in values.items()}, n_rows
+
+    def chunks(self, name, columns=None, categorical=(), chunk_rows=CHUNK_ROWS, categories=None):
+        '''
+        Read a table one chunk of rows at a time, for the streaming mode of the builders.
+        The chunks have the dtypes of utils.schema and the derived columns of the table;
+        the categorical columns have the same categories in every chunk, so one-hot
+        encoding gives the same columns for every chunk.
+            Input:
+                name : str
+                    Table name.
+                columns : list
+                    Raw columns to load, default: all.
+                categorical : list
+                    Categorical columns.
+                chunk_rows : int
+                    Number of rows per chunk.
+                categories : dict
+                    Output of categories(), read from the table if None.
+            Output:
+                chunks : generator of pandas.DataFrame
+        '''
+        derive, derive_inputs = DERIVED_COLUMNS.get(name, (None, []))
+        if columns is not None:
+            columns = list(columns) + [c for c in derive_inputs if c not in columns]
+        if categories is None:
+            categories, _ = self.categories(name, categorical, chunk_rows=chunk_rows)
+        usecols = columns
+        if self.ids is not None and columns is not None and 'SK_ID_CURR' not in columns:
+            usecols = columns + ['SK_ID_CURR']
+
+        for chunk in pd.read_csv(table_path(self.path_to_data, name), usecols=usecols,
+                                 dtype={c: str for c in categories}, chunksize=chunk_rows):
+            if self.ids is not None:
+                chunk, _ = self._filter(name, chunk, chunk['SK_ID_CURR'])
+                chunk = chunk[columns] if usecols is not columns else chunk
+            chunk = apply_schema(chunk, SCHEMAS.get(name, {}), name)
+            for c, values in categories.items():
+                chunk[c] = chunk[c].astype(pd.CategoricalDtype(values))
+            if derive is not None:
+                chunk = derive(chunk)
+            yield chunk
+
+    def partitions(self, name, key='SK_ID_CURR', columns=None, categorical=(), chunk_rows=CHUNK_ROWS):
+        '''
+        Read a table as partitions of about chunk_rows rows holding complete groups of `key`,
+        see utils.streaming.partition_chunks. Arguments as for chunks().
+            Output:
+                partitions : generator of pandas.DataFrame
+        '''
+        categories, n_rows = self.categories(name, categorical, key, chunk_rows)
+        n_partitions = max(1, math.ceil(n_rows / chunk_rows))
+        chunks = self.chunks(name, columns, categorical, chunk_rows, categories)
+        return partition_chunks(chunks, key, n_partitions)
+
+    def key_dictionary(self):
+        '''
+        Codes of the ids of every key column (see utils.keys), from the tables of
+        KEY_TABLES, read on the first call and shared by the builders of the run.
+            Output:
+                key_dictionary : utils.KeyDictionary
+        '''
+        if self._key_dictionary is None:
+            keys = {}
+            for key, names in KEY_TABLES.items():
+                keys[key] = np.concatenate([
+                    self.get(name, [key])[key].to_numpy() for name in names
+                    if key in self.columns(name)])
+            self._key_dictionary = KeyDictionary(keys)
+        return self._key_dictionary
+
+    def release(self, name):
+        ''' Drop a shared table from memory once its last builder is done. '''
+        self._tables.pop(name, None)
@@ -3,15 +3,25 @@ This file is used to run the model and save the feature importance.
 
 Author: Mai Anh Trinh
 """
-import pandas as pd
+import json
 from model import logistic_regression
 from save_feature_importance import plot_feature_importance
-from FeatureEngineering.utils import reduce_mem_usage
+from FeatureEngineering.utils import load_features
 
 path_to_file = r'<replace your path to FeatEng here>'
 
-df = pd.read_csv(path_to_file)
-df = reduce_mem_usage(df, verbose=True)
+# Json list of features saved by a previous run (selected_file below).
+# If given, only these columns are loaded and no new selection is made.
+path_to_selected = None
+
+columns, feat_select = None, "Kbest"
+if path_to_selected:
+    with open(path_to_selected) as f:
+        columns = ['SK_ID_CURR', 'TARGET'] + json.load(f)
+    feat_select = None
+
+# FeatEng.feather keeps the reduced dtypes of FeatureEngineering/main.py
+df = load_features(path_to_file, columns=columns)
 
 # best parameter for woeencoder with k in range (0.867, 0.869)
 best_params = {'tol': 0.000932217641215282, 'solver': 'liblinear',
@@ -25,5 +35,6 @@ best_params = {'tol': 0.000932217641215282, 'solver': 'liblinear',
 #                'class_weight': {0: 0.8478248187345414, 1: 6.980630555705499}, 'warm_start': True}
 
 feature_importance = logistic_regression(
-    df=df, num_folds=5, feat_select="Kbest", tunning=None, best_params=best_params, k=0.867, filename='submit.csv')
+    df=df, num_folds=5, feat_select=feat_select, tunning=None, best_params=best_params, k=0.867, filename='submit.csv',
+    selected_file='selected_features.json')
 plot_feature_importance(feature_importance=feature_importance)
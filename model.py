@@ -1,3 +1,4 @@
+import json
 import optuna
 from tqdm import tqdm
 import pandas as pd
@@ -9,10 +10,12 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.impute import SimpleImputer
 from sklearn.model_selection import KFold
 from FeatureEngineering.utils import replace_infinite
+from FeatureEngineering.utils import write_matrix, select_columns, impute_median, scale, matrix_frame
 from FeatureEngineering import feature_selection
 
 
-def logistic_regression(df, num_folds, feat_select="Kbest", tunning=None, best_params=None, k=100, filename=None, n_trials=20, debug=False):
+def logistic_regression(df, num_folds, feat_select="Kbest", tunning=None, best_params=None, k=100, filename=None, n_trials=20, debug=False,
+                        selected_file=None, mmap_path=None):
     '''
     This function is used to train a logistic regression model on the data.
 
@@ -24,7 +27,8 @@ def logistic_regression(df, num_folds, feat_select="Kbest", tunning=None, best_p
         The number of folds to use for cross validation.
     feat_select : str, default='Kbest'
         The feature selection method to use.
-        Options are 'Kbest' and 'lgbm'.
+        Options are 'Kbest', 'lgbm' and None (use all features of df,
+        e.g. when df was loaded with the columns of a saved selection).
     tunning : str, default=None
         The hyperparameter tunning method to use.
         Options are 'optuna' and None.
@@ -41,6 +45,15 @@ def logistic_regression(df, num_folds, feat_select="Kbest", tunning=None, best_p
         The number of trials to use for hyperparameter tunning.
     debug : bool, default=False
         Whether to run in debug mode or not.
+    selected_file : str, default=None
+        Json file to save the list of selected features to, so a later run can
+        load only these columns of FeatEng (see FeatureEngineering.utils.load_features).
+        If None, the selection is not saved.
+    mmap_path : str, default=None
+        File to materialise the feature matrix in, as a memory-mapped float32 array
+        (see FeatureEngineering.utils.memmap). Imputation, selection, scaling and the
+        train/validation split then run in place instead of on copies of df.
+        If None, the data is kept in memory.
 
     Returns
     -------
@@ -48,6 +61,10 @@ def logistic_regression(df, num_folds, feat_select="Kbest", tunning=None, best_p
         A dataframe containing the feature importance of the model.
     '''
 
+    if mmap_path:
+        return _mmap_logistic_regression(df, num_folds, feat_select, tunning, best_params, k, filename, n_trials, debug,
+                                         selected_file, mmap_path)
+
     # Divide in training/validation and test data
     train_df = df[df['TARGET'].notnull()]
     test_df = df[df['TARGET'].isnull()]
@@ -100,9 +117,39 @@ def logistic_regression(df, num_folds, feat_select="Kbest", tunning=None, best_p
             test_imputed = test_imputed.loc[:, selected_feats]
             test_scaled = scaler.transform(test_imputed)
 
+    elif feat_select is None:
+        not_select = ['TARGET', 'SK_ID_CURR',
+                      'SK_ID_BUREAU', 'SK_ID_PREV', 'index']
+        feats = [f for f in train_df.columns if f not in not_select]
+
+        train_df = replace_infinite(train_df[feats])
+        train_imputed = pd.DataFrame(imputer.fit_transform(
+            train_df[feats]), columns=imputer.get_feature_names_out())
+        train_scaled = scaler.fit_transform(train_imputed)
+        if not debug:
+            test_df = replace_infinite(test_df)
+            test_imputed = pd.DataFrame(imputer.transform(
+                test_df[feats]), columns=imputer.get_feature_names_out())
+            test_scaled = scaler.transform(test_imputed)
+
+    if selected_file:
+        with open(selected_file, 'w') as f:
+            json.dump(train_imputed.columns.tolist(), f)
+
     X_train, X_test, y_train, y_test = train_test_split(
         train_scaled, target, test_size=0.25, random_state=123)
 
+    return _fit_logistic_regression(X_train, X_test, y_train, y_test, None if debug else test_scaled, test_df,
+                                    train_imputed.columns, num_folds, tunning, best_params, n_trials, filename, debug)
+
+
+def _fit_logistic_regression(X_train, X_test, y_train, y_test, test_scaled, test_df, columns, num_folds,
+                             tunning, best_params, n_trials, filename, debug):
+    '''
+    Tune and fit the model of logistic_regression on prepared data, score it on the
+    validation set and predict the test set. Arguments as for logistic_regression;
+    columns are the names of the features of X_train.
+    '''
     num_folds = KFold(n_splits=num_folds, shuffle=True, random_state=1054)
     if tunning == 'optuna':
         def objective(trial):
@@ -159,7 +206,7 @@ def logistic_regression(df, num_folds, feat_select="Kbest", tunning=None, best_p
     # Get the feature importances (absolute values of coefficients)
     coefficients = np.abs(final_model.coef_[0])
     feature_importance = pd.DataFrame(
-        {'Feature': train_imputed.columns, 'Importance': np.abs(coefficients)})
+        {'Feature': columns, 'Importance': np.abs(coefficients)})
 
     # Calculate score on validate set
     # Calculate the ROC-AUC score
@@ -181,3 +228,71 @@ def logistic_regression(df, num_folds, feat_select="Kbest", tunning=None, best_p
             submit.to_csv(submission_file_name, index=False)
 
     return feature_importance
+
+
+def _mmap_logistic_regression(df, num_folds, feat_select, tunning, best_params, k, filename, n_trials, debug,
+                              selected_file, mmap_path):
+    ''' logistic_regression with the feature matrix in a memory-mapped file, see _mmap_features. '''
+    X_train, X_test, y_train, y_test, test_scaled, test_df, columns = _mmap_features(
+        df, feat_select, k, mmap_path, debug)
+
+    if selected_file:
+        with open(selected_file, 'w') as f:
+            json.dump(columns, f)
+
+    return _fit_logistic_regression(X_train, X_test, y_train, y_test, test_scaled, test_df, columns, num_folds,
+                                    tunning, best_params, n_trials, filename, debug)
+
+
+def _mmap_features(df, feat_select, k, mmap_path, debug=False):
+    '''
+    Prepare the training data of logistic_regression in a memory-mapped matrix.
+
+    The rows are written in the order [train | validation | test], with the same
+    split as train_test_split(test_size=0.25, random_state=123), so every part
+    is a view of the file. The medians and the scaler are fitted on the training
+    and validation rows, as with SimpleImputer and StandardScaler in memory.
+
+    Returns
+    -------
+    X_train, X_test, y_train, y_test : numpy.memmap, numpy.memmap, pandas.Series, pandas.Series
+        Training and validation data.
+    test_scaled : numpy.memmap
+        Test data, None if debug.
+    test_df : pandas.DataFrame
+        SK_ID_CURR of the test rows.
+    columns : list
+        Name of the features.
+    '''
+    is_train = df['TARGET'].notnull().to_numpy()
+    train_pos = np.flatnonzero(is_train)
+    test_pos = np.array([], dtype=int) if debug else np.flatnonzero(~is_train)
+    print(
+        f"Starting Logistic Regression. Train shape: {(len(train_pos), df.shape[1])}, test shape: {(len(test_pos), df.shape[1])}")
+
+    fit_pos, val_pos = train_test_split(train_pos, test_size=0.25, random_state=123)
+    n_fit, n_train = len(fit_pos), len(train_pos)
+
+    not_select = ['TARGET', 'SK_ID_CURR', 'SK_ID_BUREAU', 'SK_ID_PREV', 'index']
+    feats = [f for f in df.columns if f not in not_select]
+    if feat_select == 'lgbm':
+        feats = feature_selection(train_data=df.iloc[train_pos][feats + ['TARGET']], method='lgbm')
+        if 'TARGET' in feats:
+            feats.remove('TARGET')
+
+    X = write_matrix(df, feats, mmap_path, rows=np.concatenate([fit_pos, val_pos, test_pos]))
+    medians = impute_median(X, slice(0, n_train))
+    # SimpleImputer drops the features without any value in the training data
+    X, columns = select_columns(X, mmap_path, feats, ~np.isnan(medians))
+
+    target = df['TARGET'].iloc[np.concatenate([fit_pos, val_pos])]
+    if feat_select == 'Kbest':
+        selected_feats_mask = feature_selection(
+            train_data=matrix_frame(X[:n_train], columns), target=target, method='Kbest', k=k)
+        X, columns = select_columns(X, mmap_path, columns, selected_feats_mask)
+
+    scale(X, StandardScaler(), slice(0, n_train))
+
+    test_scaled = None if debug else X[n_train:]
+    test_df = df.iloc[test_pos][['SK_ID_CURR']]
+    return X[:n_fit], X[n_fit:n_train], target.iloc[:n_fit], target.iloc[n_fit:], test_scaled, test_df, columns